@@ -0,0 +1,51 @@
+"""
+Benchmark de los modos de confirmación (CHAT_ACK_MODE)
+Compara el coste de CPU y los bytes enviados por mensaje entre el eco
+cifrado completo ("echo") y el frame de confirmación ligero ("ack").
+
+Uso: python bench_ack.py [mensajes]
+"""
+import json
+import sys
+import time
+
+from websocket_crypto import CryptoManager
+
+MESSAGE_SIZES = (32, 256, 4096)
+
+
+def echo_response(crypto: CryptoManager, decrypted: str, seq: int) -> str:
+    encrypted_response = crypto.encrypt_message(f"✓ {decrypted}")
+    encrypted_response["seq"] = seq
+    return json.dumps(encrypted_response)
+
+
+def ack_response(crypto: CryptoManager, decrypted: str, seq: int) -> str:
+    return json.dumps({"type": "ack", "id": seq, "seq": seq})
+
+
+def run(build, crypto: CryptoManager, message: str, count: int) -> tuple:
+    total_bytes = 0
+    started = time.process_time()
+    for seq in range(1, count + 1):
+        total_bytes += len(build(crypto, message, seq).encode('utf-8'))
+    elapsed = time.process_time() - started
+    return elapsed / count * 1e6, total_bytes / count
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    crypto = CryptoManager()
+    crypto.ensure_key()
+
+    print(f"{'tamaño':>8} | {'modo':>5} | {'CPU µs/msg':>11} | {'bytes/msg':>10}")
+    print("-" * 46)
+    for size in MESSAGE_SIZES:
+        message = "x" * size
+        for mode, build in (("echo", echo_response), ("ack", ack_response)):
+            cpu_us, size_bytes = run(build, crypto, message, count)
+            print(f"{size:>8} | {mode:>5} | {cpu_us:>11.2f} | {size_bytes:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
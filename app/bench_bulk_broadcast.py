@@ -0,0 +1,83 @@
+"""
+Benchmark de /broadcast masivo frente a N peticiones individuales
+Lanza las peticiones contra la app ASGI en proceso (httpx, sin red) con
+destinatarios falsos registrados en chat.connection_registry.
+
+Uso: python bench_bulk_broadcast.py [mensajes] [destinatarios]
+"""
+import asyncio
+import contextlib
+import io
+import json
+import sys
+import time
+
+import httpx
+
+import chat
+
+
+class FakeWebSocket:
+    __slots__ = ('frames', 'bytes')
+
+    def __init__(self):
+        self.frames = 0
+        self.bytes = 0
+
+    async def send_text(self, text: str):
+        self.frames += 1
+        self.bytes += len(text)
+
+
+async def individual(client: httpx.AsyncClient, messages: list):
+    for text in messages:
+        await client.post("/broadcast/bench", json={"message": text})
+
+
+async def bulk_array(client: httpx.AsyncClient, messages: list):
+    await client.post("/broadcast/bench/bulk", json=messages)
+
+
+async def bulk_ndjson(client: httpx.AsyncClient, messages: list):
+    async def body():
+        for start in range(0, len(messages), 100):
+            yield "".join(json.dumps(text) + "\n" for text in messages[start:start + 100]).encode()
+
+    await client.post("/broadcast/bench/bulk", content=body(),
+                      headers={"content-type": "application/x-ndjson"})
+
+
+async def run(strategy, count: int, recipients: int) -> tuple:
+    sockets = [FakeWebSocket() for _ in range(recipients)]
+    sessions = [chat.connection_registry.register(f"alumno{i}", ws)[0] for i, ws in enumerate(sockets)]
+    messages = [f"Aviso {i}: la clase de mañana empieza a las 9" for i in range(count)]
+
+    transport = httpx.ASGITransport(app=chat.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        started = time.perf_counter()
+        await strategy(client, messages)
+        elapsed = time.perf_counter() - started
+
+    for session in sessions:
+        chat.connection_registry.unregister(session)
+    return elapsed, sum(ws.frames for ws in sockets), sum(ws.bytes for ws in sockets)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    recipients = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+
+    chat.crypto_manager.ensure_key()
+    print(f"{count} mensajes, {recipients} destinatarios, lotes de {chat.BROADCAST_BATCH}")
+    print(f"{'envío':<14} | {'ms':>7} | {'mensajes/s':>10} | {'frames':>8} | {'MiB':>6}")
+    print("-" * 58)
+    strategies = (("individual", individual), ("bulk array", bulk_array), ("bulk ndjson", bulk_ndjson))
+    for name, strategy in strategies:
+        with contextlib.redirect_stdout(io.StringIO()):  # Un print por mensaje
+            elapsed, frames, size = asyncio.run(run(strategy, count, recipients))
+        print(f"{name:<14} | {elapsed * 1000:>7.0f} | {count / elapsed:>10.0f} | "
+              f"{frames:>8} | {size / 1024 / 1024:>6.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Benchmark de una avalancha de conexiones (toda una clase a la vez)
+Compara el handshake anterior (welcome serializado y clave en base64 por
+cliente, un user_connected a cada monitor por cada alta) con el actual de
+chat.websocket_endpoint (welcome cacheado por época de clave, handshakes
+acotados y altas agrupadas en presence_delta).
+
+Mide conexiones aceptadas por segundo, frames y bytes enviados a los
+monitores y el mayor intervalo en que el event loop no pudo atender a
+nadie más durante la avalancha.
+
+Uso: python bench_connect_storm.py [conexiones] [monitores]
+"""
+import asyncio
+import contextlib
+import io
+import json
+import sys
+import time
+
+import chat
+
+
+class FakeWebSocket:
+    __slots__ = ('frames', 'bytes', 'on_send')
+
+    def __init__(self, on_send=None):
+        self.frames = 0
+        self.bytes = 0
+        self.on_send = on_send
+
+    async def accept(self):
+        await asyncio.sleep(0)
+
+    async def send_text(self, text: str):
+        self.frames += 1
+        self.bytes += len(text)
+        if self.on_send is not None:
+            self.on_send()
+
+    async def receive_text(self) -> str:
+        await asyncio.Event().wait()  # Cliente conectado y en silencio
+
+    async def close(self, code: int = 1000, reason: str = ""):
+        pass
+
+
+async def legacy_endpoint(websocket: FakeWebSocket, username: str):
+    """Handshake tal como era antes de cachear el welcome"""
+    await websocket.accept()
+    session, _ = chat.connection_registry.register(username, websocket)
+    await chat.notify_monitors("user_connected", {
+        "username": username,
+        "active_count": len(chat.connection_registry)
+    })
+    key_id, key_base64 = chat.crypto_manager.get_current_key_base64()
+    await websocket.send_text(json.dumps({
+        "type": "welcome",
+        "message": "Conexión establecida con cifrado",
+        "key_id": key_id,
+        "key_base64": key_base64,
+        "last_seq": chat.message_history.last_seq
+    }))
+    session.key_id = key_id
+    await websocket.receive_text()
+
+
+async def storm(endpoint, connections: int, monitor_count: int) -> tuple:
+    monitors = []
+    for i in range(monitor_count):
+        session, _ = chat.monitor_registry.register(f"monitor-bench-{i}", FakeWebSocket())
+        chat.presence.subscribe(session)
+        monitors.append(session)
+
+    welcomed = 0
+    done = asyncio.Event()
+
+    def on_welcome():
+        nonlocal welcomed
+        welcomed += 1
+        if welcomed == connections:
+            done.set()
+
+    async def presence_ticker():
+        while True:
+            await asyncio.sleep(0.25)
+            await chat.presence.flush()
+
+    worst_gap = 0.0
+    last_tick = time.perf_counter()
+
+    async def lag_probe():
+        """Mayor intervalo sin que un temporizador de 1 ms pueda ejecutarse"""
+        nonlocal worst_gap, last_tick
+        while True:
+            await asyncio.sleep(0.001)
+            now = time.perf_counter()
+            worst_gap = max(worst_gap, now - last_tick)
+            last_tick = now
+
+    background = [asyncio.create_task(presence_ticker()), asyncio.create_task(lag_probe())]
+    started = time.perf_counter()
+    clients = [
+        asyncio.create_task(endpoint(FakeWebSocket(on_welcome), f"alumno{i}"))
+        for i in range(connections)
+    ]
+    await done.wait()
+    elapsed = time.perf_counter() - started
+    worst_gap = max(worst_gap, time.perf_counter() - last_tick)
+    await chat.presence.flush()  # Las altas pendientes del último tick
+
+    frames = sum(m.websocket.frames for m in monitors)
+    size = sum(m.websocket.bytes for m in monitors)
+
+    for task in clients + background:
+        task.cancel()
+    await asyncio.gather(*clients, *background, return_exceptions=True)
+    for session in list(chat.connection_registry):
+        chat.connection_registry.unregister(session)
+    for session in monitors:
+        chat.monitor_registry.unregister(session)
+    return elapsed, frames, size, worst_gap
+
+
+def main():
+    connections = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    monitor_count = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    chat.crypto_manager.ensure_key()
+    print(f"{connections} conexiones simultáneas, {monitor_count} monitores")
+    print(f"{'handshake':<10} | {'conexiones/s':>12} | {'frames monitor':>14} | {'KiB monitor':>11} | {'bloqueo máx ms':>14}")
+    print("-" * 74)
+    for name, endpoint in (("anterior", legacy_endpoint), ("actual", chat.websocket_endpoint)):
+        with contextlib.redirect_stdout(io.StringIO()):  # Un print por conexión
+            elapsed, frames, size, lag = asyncio.run(storm(endpoint, connections, monitor_count))
+        print(f"{name:<10} | {connections / elapsed:>12.0f} | {frames:>14} | "
+              f"{size / 1024:>11.0f} | {lag * 1000:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Benchmark de memoria de la transferencia de archivos por chunks
+Sube archivos de distintos tamaños por el mismo camino que el WebSocket
+(descifrado con AAD + escritura en el spool) y mide el pico de memoria,
+que debe ser el mismo sin importar el tamaño del archivo.
+
+Uso: python bench_file_transfer.py [MiB máximo]
+"""
+import asyncio
+import base64
+import os
+import secrets
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+from file_transfer import TransferManager
+from websocket_crypto import CryptoManager
+
+CHUNK_SIZE = 64 * 1024
+
+
+async def upload(manager: TransferManager, crypto: CryptoManager, size: int) -> float:
+    key_id, key_base64 = crypto.get_current_key_base64()
+    aesgcm = AESGCM(base64.b64decode(key_base64))
+    block = os.urandom(CHUNK_SIZE)
+
+    transfer = manager.offer("bench", {"name": "bench.bin", "size": size, "chunk_size": CHUNK_SIZE})
+    started = time.perf_counter()
+    for index in range(transfer.total_chunks):
+        chunk = block[:min(CHUNK_SIZE, size - index * CHUNK_SIZE)]
+        nonce = secrets.token_bytes(12)
+        aad = f"{transfer.transfer_id}:{index}".encode()
+        # Lo que llega por el socket: base64 del chunk cifrado
+        encrypted_b64 = base64.b64encode(aesgcm.encrypt(nonce, chunk, aad)).decode()
+        manager.check_chunk("bench", transfer.transfer_id, index)
+        plain = crypto.decrypt_bytes(encrypted_b64, base64.b64encode(nonce).decode(), key_id, aad=aad)
+        await manager.write_chunk(transfer, index, plain)
+    manager.complete("bench", transfer.transfer_id)
+    return time.perf_counter() - started
+
+
+def main():
+    max_mib = int(sys.argv[1]) if len(sys.argv) > 1 else 256
+    sizes = [mib for mib in (1, 16, 64, 256, 1024) if mib <= max_mib]
+
+    print(f"{'archivo MiB':>11} | {'MiB/s':>7} | {'pico memoria KiB':>16}")
+    print("-" * 41)
+    with tempfile.TemporaryDirectory() as spool:
+        for mib in sizes:
+            manager = TransferManager(spool, max_file_size=mib * 1024 * 1024)
+            crypto = CryptoManager()
+            tracemalloc.start()
+            elapsed = asyncio.run(upload(manager, crypto, mib * 1024 * 1024))
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            manager.file_ttl = 0
+            manager.cleanup()
+            print(f"{mib:>11} | {mib / elapsed:>7.0f} | {peak / 1024:>16.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Benchmark de consultas sobre el historial
+Compara el escaneo completo (filter_rows) con los índices secundarios
+para consultas por usuario, por palabra y por rango de tiempo, con
+historiales de distintos tamaños. Con índices la latencia no debe
+crecer con el tamaño del historial.
+
+Uso: python bench_history_index.py [tamaño máximo]
+"""
+import random
+import sys
+import time
+
+from history import MessageHistory
+from history_export import filter_rows
+from history_index import HistoryIndex, tokenize
+
+SIZES = (10_000, 100_000, 1_000_000)
+WORDS = [f"palabra{i}" for i in range(2000)] + ["alerta"]
+USERS = [f"user{i}" for i in range(500)]
+
+
+def build(size: int) -> tuple:
+    history = MessageHistory(max_records=size)
+    index = HistoryIndex(history)
+    start_ms = 1_767_225_600_000  # 2026-01-01, un mensaje por segundo
+    for i in range(size):
+        words = random.sample(WORDS, 6)
+        history.append(random.choice(USERS), " ".join(words), True, timestamp_ms=start_ms + i * 1000)
+    end_ms = start_ms + size * 1000
+    return history, index, end_ms - 10 * 60_000, end_ms
+
+
+def scan(history: MessageHistory, limit: int, username=None, text=None, since_ms=None, until_ms=None) -> list:
+    tokens = tokenize(text) if text else set()
+    rows = filter_rows(history.rows(history.first_seq, history.last_seq),
+                       username=username, since_ms=since_ms, until_ms=until_ms)
+    matches = [row for row in rows if not tokens or tokens <= tokenize(row[2])]
+    return [history.to_dict(row) for row in matches[-limit:]]
+
+
+def timed(func, repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def main():
+    max_size = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+
+    print(f"{'historial':>9} | {'consulta':<9} | {'escaneo ms':>10} | {'índice ms':>9}")
+    print("-" * 47)
+    for size in SIZES:
+        if size > max_size:
+            break
+        history, index, since, until = build(size)
+        queries = {
+            "usuario": {"username": "user7"},
+            "palabra": {"text": "alerta"},
+            "tiempo": {"since_ms": since, "until_ms": until},
+        }
+        for name, filters in queries.items():
+            assert scan(history, 100, **filters) == index.query(100, **filters)
+            scan_ms = timed(lambda: scan(history, 100, **filters), repeat=1)
+            index_ms = timed(lambda: index.query(100, **filters))
+            print(f"{size:>9} | {name:<9} | {scan_ms:>10.1f} | {index_ms:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
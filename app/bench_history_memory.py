@@ -0,0 +1,70 @@
+"""
+Benchmark de memoria del historial
+Compara la lista de dicts anterior (un dict por mensaje con username,
+timestamp ISO y flag) con el almacenamiento por columnas de MessageHistory.
+Los textos de los mensajes se crean fuera de la medición: son los mismos
+objetos en ambos casos.
+
+Uso: python bench_history_memory.py [mensajes]
+"""
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+from history import MessageHistory
+
+# Como en el servidor, los mensajes de un usuario comparten el mismo str
+USERS = [f"user{i}" for i in range(500)]
+
+
+def dict_list(messages: list, start_ms: int) -> list:
+    records = []
+    for i, message in enumerate(messages):
+        records.append({
+            "seq": i + 1,
+            "username": USERS[i % len(USERS)],
+            "message": message,
+            "timestamp": datetime.fromtimestamp((start_ms + i) / 1000).isoformat(),
+            "is_encrypted": True
+        })
+    return records
+
+
+def columnar(messages: list, start_ms: int) -> MessageHistory:
+    history = MessageHistory(max_records=len(messages))
+    for i, message in enumerate(messages):
+        history.append(USERS[i % len(USERS)], message, True, timestamp_ms=start_ms + i)
+    return history
+
+
+def measure(build, messages: list) -> tuple:
+    start_ms = int(time.time() * 1000)
+    # Tiempo sin tracemalloc (su instrumentación distorsiona la medida)
+    started = time.perf_counter()
+    store = build(messages, start_ms)
+    elapsed = time.perf_counter() - started
+    del store
+
+    tracemalloc.start()
+    store = build(messages, start_ms)
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del store
+    return memory, elapsed
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    messages = [f"mensaje de prueba número {i}" for i in range(count)]
+
+    print(f"{count} mensajes")
+    print(f"{'almacenamiento':<16} | {'MiB':>7} | {'bytes/msg':>9} | {'construcción s':>14}")
+    print("-" * 56)
+    for name, build in (("lista de dicts", dict_list), ("columnas", columnar)):
+        memory, elapsed = measure(build, messages)
+        print(f"{name:<16} | {memory / 1024 / 1024:>7.1f} | {memory / count:>9.0f} | {elapsed:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
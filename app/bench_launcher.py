@@ -0,0 +1,124 @@
+"""
+Benchmark de throughput por configuración del lanzador
+Arranca el servidor con launcher.py para cada configuración y mide
+peticiones HTTP/s (keep-alive) y mensajes WebSocket cifrados/s (con ack).
+
+Uso: python bench_launcher.py [segundos] [conexiones]
+"""
+import asyncio
+import base64
+import json
+import os
+import secrets
+import socket
+import subprocess
+import sys
+import time
+
+import websockets
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+CONFIGS = [
+    ("asyncio + h11", ["--loop", "asyncio", "--http", "h11"]),
+    ("uvloop + httptools", ["--loop", "uvloop", "--http", "httptools"]),
+    ("uvloop + httptools x2", ["--loop", "uvloop", "--http", "httptools", "--workers", "2"]),
+]
+
+# Sin límites de admisión durante el benchmark
+BENCH_ENV = {
+    "CHAT_USER_RATE": "1000000",
+    "CHAT_USER_BURST": "1000000",
+    "CHAT_GLOBAL_RATE": "1000000",
+    "CHAT_GLOBAL_BURST": "1000000",
+}
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(args: list, port: int) -> subprocess.Popen:
+    launcher = os.path.join(os.path.dirname(os.path.abspath(__file__)), "launcher.py")
+    process = subprocess.Popen(
+        [sys.executable, launcher, "--no-ssl", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning", *args],
+        env={**os.environ, **BENCH_ENV},
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    deadline = time.time() + 20
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("el servidor no arrancó")
+
+
+async def http_worker(port: int, deadline: float) -> int:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    request = b"GET /crypto/keys HTTP/1.1\r\nHost: bench\r\n\r\n"
+    done = 0
+    while time.perf_counter() < deadline:
+        writer.write(request)
+        headers = await reader.readuntil(b"\r\n\r\n")
+        length = 0
+        for line in headers.split(b"\r\n"):
+            if line.lower().startswith(b"content-length:"):
+                length = int(line.split(b":")[1])
+        await reader.readexactly(length)
+        done += 1
+    writer.close()
+    return done
+
+
+async def ws_worker(port: int, index: int, deadline: float) -> int:
+    async with websockets.connect(f"ws://127.0.0.1:{port}/ws/bench{index}") as ws:
+        welcome = json.loads(await ws.recv())
+        aesgcm = AESGCM(base64.b64decode(welcome["key_base64"]))
+        done = 0
+        while time.perf_counter() < deadline:
+            nonce = secrets.token_bytes(12)
+            await ws.send(json.dumps({
+                "encrypted": base64.b64encode(aesgcm.encrypt(nonce, b"mensaje de prueba", None)).decode(),
+                "nonce": base64.b64encode(nonce).decode(),
+                "key_id": welcome["key_id"],
+                "id": done,
+            }))
+            while json.loads(await ws.recv()).get("type") != "ack":
+                pass
+            done += 1
+        return done
+
+
+async def measure(port: int, seconds: float, connections: int) -> tuple:
+    deadline = time.perf_counter() + seconds
+    http_total = sum(await asyncio.gather(*(http_worker(port, deadline) for _ in range(connections))))
+
+    deadline = time.perf_counter() + seconds
+    ws_total = sum(await asyncio.gather(*(ws_worker(port, i, deadline) for i in range(connections))))
+    return http_total / seconds, ws_total / seconds
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 5
+    connections = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    print(f"{'configuración':<24} | {'HTTP req/s':>11} | {'WS msg/s':>9}")
+    print("-" * 52)
+    for name, args in CONFIGS:
+        port = free_port()
+        server = start_server(args, port)
+        try:
+            http_rate, ws_rate = asyncio.run(measure(port, seconds, connections))
+        finally:
+            server.terminate()
+            server.wait()
+        print(f"{name:<24} | {http_rate:>11.0f} | {ws_rate:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
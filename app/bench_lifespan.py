@@ -0,0 +1,67 @@
+"""
+Benchmark de importación, arranque y apagado de la aplicación
+Mide el tiempo de `import chat` en un proceso nuevo y el de entrar y salir
+del lifespan (arranque del supervisor, cancelación de tareas).
+
+Uso: python bench_lifespan.py [repeticiones]
+"""
+import asyncio
+import statistics
+import subprocess
+import sys
+import time
+
+IMPORT_SNIPPET = (
+    "import time; t = time.perf_counter(); import chat; "
+    "print(time.perf_counter() - t)"
+)
+
+
+def measure_import() -> float:
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_SNIPPET],
+        capture_output=True, text=True, check=True
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+async def measure_lifespan(app) -> tuple:
+    context = app.router.lifespan_context(app)
+    started = time.perf_counter()
+    await context.__aenter__()
+    startup = time.perf_counter() - started
+
+    # Dejar que las tareas arranquen antes de apagar
+    await asyncio.sleep(0.01)
+
+    started = time.perf_counter()
+    await context.__aexit__(None, None, None)
+    shutdown = time.perf_counter() - started
+    return startup, shutdown
+
+
+def report(name: str, samples: list):
+    samples_ms = [s * 1000 for s in samples]
+    print(f"{name:<10} mediana {statistics.median(samples_ms):8.2f} ms | "
+          f"mín {min(samples_ms):8.2f} ms | máx {max(samples_ms):8.2f} ms")
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+    imports = [measure_import() for _ in range(repeat)]
+
+    import chat
+    startups, shutdowns = [], []
+    for _ in range(repeat):
+        startup, shutdown = asyncio.run(measure_lifespan(chat.app))
+        startups.append(startup)
+        shutdowns.append(shutdown)
+
+    report("import", imports)
+    report("arranque", startups)
+    report("apagado", shutdowns)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Benchmark del snapshot inicial de los monitores con historiales grandes
+Mide chat.monitor_snapshot_frame() (construcción + json.dumps) para
+distintos tamaños de historial y de snapshot: el coste depende de los N
+mensajes incluidos y del roster, no del tamaño del historial.
+
+Uso: python bench_monitor_snapshot.py [usuarios en línea]
+"""
+import sys
+import time
+
+import chat
+from history import MessageHistory
+from sessions import ClientSession
+
+HISTORY_SIZES = (10_000, 100_000, 1_000_000)
+SNAPSHOT_SIZES = (200, 1000)
+REPEAT = 20
+
+
+def fill_history(records: int) -> MessageHistory:
+    history = MessageHistory(max_records=records)
+    usernames = [f"alumno{i}" for i in range(500)]
+    for i in range(records):
+        history.append(usernames[i % len(usernames)], f"mensaje número {i} de la clase", True)
+    return history
+
+
+def main():
+    online = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+
+    chat.crypto_manager.ensure_key()
+    for i in range(online):
+        chat.presence.roster.join(f"alumno{i}")
+    session = ClientSession(0, "monitor-bench", None)
+
+    print(f"{online} usuarios en línea, media de {REPEAT} snapshots")
+    print(f"{'historial':>10} | {'snapshot':>8} | {'ms':>6} | {'KiB':>6}")
+    print("-" * 40)
+    for records in HISTORY_SIZES:
+        chat.message_history = fill_history(records)
+        for size in SNAPSHOT_SIZES:
+            chat.MONITOR_SNAPSHOT_SIZE = size
+            started = time.perf_counter()
+            for _ in range(REPEAT):
+                frame = chat.monitor_snapshot_frame(session)
+            elapsed = (time.perf_counter() - started) / REPEAT
+            print(f"{records:>10} | {size:>8} | {elapsed * 1000:>6.2f} | {len(frame) / 1024:>6.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Benchmark del pipeline de mensajes con un monitor lento
+Compara procesar cada mensaje en el bucle de lectura (historial, monitores
+y ack en secuencia) con encolarlo en las etapas de pipeline.Stage.
+
+Mide cuánto tardan los lectores en consumir todos sus frames, el total
+hasta el último ack y la mayor espera de un lector entre dos frames.
+
+Uso: python bench_pipeline.py [remitentes] [mensajes por remitente] [ms del monitor lento]
+"""
+import asyncio
+import json
+import sys
+import time
+
+from history import MessageHistory
+from pipeline import Stage
+
+MONITORS = 3
+
+
+class FakeWebSocket:
+    __slots__ = ('delay', 'frames', 'lock')
+
+    def __init__(self, delay: float = 0):
+        self.delay = delay
+        self.frames = 0
+        self.lock = asyncio.Lock()  # los envíos a un mismo socket van de uno en uno
+
+    async def send_text(self, text: str):
+        if self.delay:
+            async with self.lock:
+                await asyncio.sleep(self.delay)
+        self.frames += 1
+
+
+def setup(slow_ms: float) -> tuple:
+    monitors = [FakeWebSocket(slow_ms / 1000)] + [FakeWebSocket() for _ in range(MONITORS - 1)]
+
+    async def notify(message_type: str, data: dict):
+        frame = json.dumps({"type": message_type, **data})
+        for monitor in monitors:
+            await monitor.send_text(frame)
+
+    return MessageHistory(), notify
+
+
+async def run_readers(senders: int, count: int, handle) -> tuple:
+    """Lanza los lectores y retorna (segundos hasta leer todo, mayor espera entre frames)"""
+    stalls = []
+
+    async def reader(i: int, websocket: FakeWebSocket):
+        username = f"user{i}"
+        worst = 0.0
+        last = time.perf_counter()
+        for n in range(count):
+            await asyncio.sleep(0)  # receive_text
+            now = time.perf_counter()
+            worst = max(worst, now - last)
+            last = now
+            await handle(websocket, username, f"mensaje {n} de {username}", n)
+        stalls.append(worst)
+
+    clients = [FakeWebSocket() for _ in range(senders)]
+    started = time.perf_counter()
+    await asyncio.gather(*(reader(i, ws) for i, ws in enumerate(clients)))
+    return time.perf_counter() - started, max(stalls), clients
+
+
+async def inline(senders: int, count: int, slow_ms: float) -> tuple:
+    history, notify = setup(slow_ms)
+
+    async def handle(websocket, username, text, client_id):
+        record = history.append(username, text, True)
+        await notify("message", record)
+        await websocket.send_text(json.dumps({"type": "ack", "id": client_id, "seq": record["seq"]}))
+
+    started = time.perf_counter()
+    read, stall, _ = await run_readers(senders, count, handle)
+    return read, time.perf_counter() - started, stall
+
+
+async def pipelined(senders: int, count: int, slow_ms: float) -> tuple:
+    history, notify = setup(slow_ms)
+    expected = senders * count
+
+    async def store(batch):
+        for websocket, username, text, client_id in batch:
+            record = history.append(username, text, True)
+            await acks.put((websocket, client_id, record["seq"]))
+            monitors.offer(record)
+
+    async def send_acks(batch):
+        for websocket, client_id, seq in batch:
+            await websocket.send_text(json.dumps({"type": "ack", "id": client_id, "seq": seq}))
+
+    async def publish(batch):
+        await notify("messages", {"records": batch})
+
+    ingest = Stage("history", store, maxsize=10_000, max_batch=256)
+    acks = Stage("acks", send_acks, maxsize=10_000, max_batch=256)
+    monitors = Stage("monitors", publish, maxsize=10_000, max_batch=100)
+    tasks = [asyncio.create_task(stage.run()) for stage in (ingest, acks, monitors)]
+
+    async def handle(websocket, username, text, client_id):
+        await ingest.put((websocket, username, text, client_id))
+
+    started = time.perf_counter()
+    read, stall, clients = await run_readers(senders, count, handle)
+    while sum(ws.frames for ws in clients) < expected:
+        await asyncio.sleep(0.001)
+    total = time.perf_counter() - started
+
+    for task in tasks:
+        task.cancel()
+    return read, total, stall
+
+
+def main():
+    senders = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    slow_ms = float(sys.argv[3]) if len(sys.argv) > 3 else 1
+
+    print(f"{senders} remitentes x {count} mensajes, {MONITORS} monitores (uno tarda {slow_ms} ms por frame)")
+    print(f"{'estrategia':<12} | {'lectura ms':>10} | {'total ms':>9} | {'espera máx ms':>13}")
+    print("-" * 54)
+    for name, strategy in (("en línea", inline), ("pipeline", pipelined)):
+        read, total, stall = asyncio.run(strategy(senders, count, slow_ms))
+        print(f"{name:<12} | {read * 1000:>10.0f} | {total * 1000:>9.0f} | {stall * 1000:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Benchmark de presencia con muchos usuarios y churn
+Compara enviar un evento por cada alta/baja a todos los suscriptores con
+el delta agrupado de PresenceService.flush() cada tick.
+
+Uso: python bench_presence.py [usuarios] [cambios por tick]
+"""
+import asyncio
+import json
+import random
+import sys
+import time
+
+from presence import PresenceRoster, PresenceService
+from sessions import ConnectionRegistry
+
+TICKS = 20
+
+
+class FakeWebSocket:
+    __slots__ = ('frames', 'bytes')
+
+    def __init__(self):
+        self.frames = 0
+        self.bytes = 0
+
+    async def send_text(self, text: str):
+        self.frames += 1
+        self.bytes += len(text)
+
+
+def sent(registry: ConnectionRegistry) -> tuple:
+    sessions = list(registry)
+    return sum(s.websocket.frames for s in sessions), sum(s.websocket.bytes for s in sessions)
+
+
+async def per_event(users: int, churn: int) -> tuple:
+    registry = ConnectionRegistry()
+    for i in range(users):
+        registry.register(f"user{i}", FakeWebSocket())
+
+    started = time.perf_counter()
+    for _ in range(TICKS):
+        for _ in range(churn):
+            username = f"user{random.randrange(users)}"
+            frame = json.dumps({"type": "user_connected", "username": username, "active_count": users})
+            for session in registry:
+                await session.websocket.send_text(frame)
+    return (time.perf_counter() - started, *sent(registry))
+
+
+async def delta(users: int, churn: int) -> tuple:
+    presence = PresenceService(PresenceRoster())
+    registry = ConnectionRegistry(on_join=presence.join, on_leave=presence.leave)
+    for i in range(users):
+        session, _ = registry.register(f"user{i}", FakeWebSocket())
+        presence.subscribe(session)
+    await presence.flush()
+    for session in registry:
+        session.websocket.frames = session.websocket.bytes = 0
+
+    # Usuarios que entran y salen sin suscribirse (el churn)
+    guests = ConnectionRegistry(on_join=presence.join, on_leave=presence.leave)
+    started = time.perf_counter()
+    for _ in range(TICKS):
+        for _ in range(churn):
+            username = f"guest{random.randrange(churn * 2)}"
+            current = guests.get(username)
+            if current is None:
+                guests.register(username, None)
+            else:
+                guests.unregister(current)
+        await presence.flush()
+    return (time.perf_counter() - started, *sent(registry))
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    churn = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+
+    print(f"{users} suscriptores, {churn} cambios por tick, {TICKS} ticks")
+    print(f"{'estrategia':<12} | {'ms':>8} | {'frames':>9} | {'MiB':>7}")
+    print("-" * 45)
+    for name, strategy in (("por evento", per_event), ("delta", delta)):
+        elapsed, frames, size = asyncio.run(strategy(users, churn))
+        print(f"{name:<12} | {elapsed * 1000:>8.0f} | {frames:>9} | {size / 1024 / 1024:>7.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Benchmark del detector de replays
+Mide el coste por mensaje de check + remember con tasas altas de nonces
+distintos, y la memoria retenida por clave.
+
+Uso: python bench_replay.py [mensajes]
+"""
+import os
+import sys
+import time
+import tracemalloc
+
+from replay_guard import ReplayGuard
+
+GENERATION_SIZES = (10_000, 100_000, 500_000)
+
+
+def feed(guard: ReplayGuard, nonces: list):
+    for nonce in nonces:
+        guard.check("key_bench", nonce)
+        guard.remember("key_bench", nonce)
+
+
+def run(generation_size: int, nonces: list) -> tuple:
+    # Tiempo sin tracemalloc (su instrumentación distorsiona la medida)
+    guard = ReplayGuard(nonces_per_key=generation_size)
+    started = time.perf_counter()
+    feed(guard, nonces)
+    elapsed = time.perf_counter() - started
+
+    tracemalloc.start()
+    guard = ReplayGuard(nonces_per_key=generation_size)
+    feed(guard, nonces)
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return elapsed / len(nonces) * 1e9, memory / 1024 / 1024, len(nonces) / elapsed
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    nonces = [os.urandom(12) for _ in range(count)]
+
+    print(f"{'nonces/gen':>10} | {'ns/mensaje':>10} | {'mensajes/s':>12} | {'memoria MiB':>11}")
+    print("-" * 53)
+    for generation_size in GENERATION_SIZES:
+        ns, mib, rate = run(generation_size, nonces)
+        print(f"{generation_size:>10} | {ns:>10.0f} | {rate:>12.0f} | {mib:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
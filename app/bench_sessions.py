@@ -0,0 +1,70 @@
+"""
+Benchmark de memoria por conexión inactiva
+Compara el registro de sesiones (__slots__) con el esquema anterior de
+Dict[str, WebSocket] más diccionarios paralelos para el estado por conexión.
+
+Uso: python bench_sessions.py
+"""
+import gc
+import time
+import tracemalloc
+
+from sessions import ConnectionRegistry
+
+
+class FakeWebSocket:
+    """Sustituto mínimo de WebSocket (se excluye de la medición)"""
+    __slots__ = ()
+
+
+def measure(build, count: int) -> int:
+    """Retorna los bytes asignados por build() para count conexiones"""
+    sockets = [FakeWebSocket() for _ in range(count)]
+    usernames = [f"user_{i}" for i in range(count)]
+    gc.collect()
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    keep = build(usernames, sockets)
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del keep
+    return after - before
+
+
+def build_registry(usernames, sockets):
+    registry = ConnectionRegistry()
+    for username, ws in zip(usernames, sockets):
+        registry.register(username, ws)
+    return registry
+
+
+def build_parallel_dicts(usernames, sockets):
+    # Esquema anterior extendido con el mismo estado que ClientSession
+    active_connections = {}
+    key_ids = {}
+    connected_at = {}
+    last_seen = {}
+    messages_in = {}
+    bytes_in = {}
+    now = time.monotonic()
+    for username, ws in zip(usernames, sockets):
+        active_connections[username] = ws
+        key_ids[username] = None
+        connected_at[username] = now + 0.0
+        last_seen[username] = now + 0.0
+        messages_in[username] = 0
+        bytes_in[username] = 0
+    return active_connections, key_ids, connected_at, last_seen, messages_in, bytes_in
+
+
+def main():
+    print(f"{'sesiones':>10} | {'registro (B/conn)':>18} | {'dicts paralelos (B/conn)':>25}")
+    print("-" * 60)
+    for count in (10_000, 50_000):
+        registry_bytes = measure(build_registry, count)
+        dicts_bytes = measure(build_parallel_dicts, count)
+        print(f"{count:>10} | {registry_bytes / count:>18.1f} | {dicts_bytes / count:>25.1f}")
+
+
+if __name__ == "__main__":
+    main()
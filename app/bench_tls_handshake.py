@@ -0,0 +1,83 @@
+"""
+Benchmark de handshakes TLS por tipo de clave del certificado
+Levanta un servidor TLS local en otro proceso y mide handshakes completos
+por segundo (sin reanudación de sesión) y CPU del servidor por handshake.
+No necesita red: todo ocurre en 127.0.0.1 con certificados temporales.
+
+Uso: python bench_tls_handshake.py [handshakes] [tipos...]
+"""
+import multiprocessing
+import os
+import socket
+import ssl
+import sys
+import tempfile
+import time
+
+from generate_cert import KEY_TYPES, generate
+
+
+def serve(cert_path: str, key_path: str, ready, conn, count: int):
+    """Proceso servidor: acepta count handshakes y reporta su CPU"""
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert_path, key_path)
+    # Sin tickets: cada conexión hace un handshake completo
+    context.options |= ssl.OP_NO_TICKET
+
+    listener = socket.create_server(("127.0.0.1", 0), backlog=128)
+    ready.send(listener.getsockname()[1])
+
+    cpu_started = time.process_time()
+    for _ in range(count):
+        raw, _ = listener.accept()
+        try:
+            with context.wrap_socket(raw, server_side=True):
+                pass
+        except (ssl.SSLError, OSError):
+            raw.close()
+    conn.send(time.process_time() - cpu_started)
+    listener.close()
+
+
+def run(key_type: str, count: int, workdir: str) -> tuple:
+    cert_path = os.path.join(workdir, f"{key_type}-cert.pem")
+    key_path = os.path.join(workdir, f"{key_type}-key.pem")
+    generate(key_type, cert_path=cert_path, key_path=key_path, days=1)
+
+    ready_recv, ready_send = multiprocessing.Pipe(duplex=False)
+    result_recv, result_send = multiprocessing.Pipe(duplex=False)
+    server = multiprocessing.Process(
+        target=serve, args=(cert_path, key_path, ready_send, result_send, count)
+    )
+    server.start()
+    port = ready_recv.recv()
+
+    client_context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    client_context.load_verify_locations(cert_path)
+
+    started = time.perf_counter()
+    for _ in range(count):
+        with socket.create_connection(("127.0.0.1", port)) as raw:
+            with client_context.wrap_socket(raw, server_hostname="localhost"):
+                pass
+    elapsed = time.perf_counter() - started
+
+    server_cpu = result_recv.recv()
+    server.join()
+    return count / elapsed, server_cpu / count * 1000
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    key_types = sys.argv[2:] or list(KEY_TYPES)
+
+    print(f"{'clave':>8} | {'handshakes/s':>13} | {'CPU servidor ms/hs':>19}")
+    print("-" * 48)
+    with tempfile.TemporaryDirectory() as workdir:
+        for key_type in key_types:
+            rate, cpu_ms = run(key_type, count, workdir)
+            print(f"{key_type:>8} | {rate:>13.1f} | {cpu_ms:>19.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Entrada masiva para /broadcast: un array JSON o NDJSON en streaming
+
+Cada elemento es el texto del mensaje o un objeto {"message": "..."}. Los
+elementos se agrupan en lotes; el endpoint cifra cada lote una sola vez y
+lo envía como un único frame broadcast_batch a todos los destinatarios
+(todos comparten la clave actual). Con NDJSON los lotes se procesan a
+medida que llega el cuerpo, sin cargarlo entero en memoria.
+"""
+import json
+from typing import AsyncIterator, List, Tuple
+
+NDJSON_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+MAX_REPORTED_ERRORS = 100
+
+
+class BulkError(ValueError):
+    """Cuerpo que no es ni un array JSON ni NDJSON"""
+
+
+def is_ndjson(content_type: str) -> bool:
+    return content_type.split(";")[0].strip().lower() in NDJSON_TYPES
+
+
+async def iter_ndjson(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Líneas no vacías de un cuerpo NDJSON recibido por trozos"""
+    pending = b""
+    async for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield line
+    if pending.strip():
+        yield pending
+
+
+async def iter_array(body: bytes) -> AsyncIterator:
+    try:
+        items = json.loads(body)
+    except json.JSONDecodeError as e:
+        raise BulkError(f"JSON inválido: {e}")
+    if not isinstance(items, list):
+        raise BulkError("Se esperaba un array JSON o NDJSON (application/x-ndjson)")
+    for item in items:
+        yield item
+
+
+def message_text(item) -> str:
+    """Texto de un elemento (línea NDJSON o elemento del array)"""
+    if isinstance(item, bytes):
+        item = json.loads(item)
+    if isinstance(item, dict):
+        item = item.get("message")
+    if not isinstance(item, str) or not item:
+        raise ValueError("Se esperaba un texto o un objeto con 'message'")
+    return item
+
+
+async def batches(items: AsyncIterator, size: int, result: "BulkResult") -> AsyncIterator[List[str]]:
+    """Agrupa los textos válidos en lotes de hasta size; los inválidos van a result"""
+    batch: List[str] = []
+    index = 0
+    async for item in items:
+        try:
+            batch.append(message_text(item))
+        except ValueError as e:
+            result.reject(index, str(e))
+        index += 1
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class BulkResult:
+    """Resultado agregado de una petición masiva"""
+
+    def __init__(self):
+        self.accepted = 0
+        self.rejected = 0
+        self.batches = 0
+        self.frames_sent = 0
+        self.failed_deliveries = 0
+        self.first_seq = None
+        self.last_seq = None
+        self.recipients = set()
+        self.errors: List[Tuple[int, str]] = []
+
+    def reject(self, index: int, error: str):
+        self.rejected += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((index, error))
+
+    def add_batch(self, first_seq: int, last_seq: int, count: int):
+        self.batches += 1
+        self.accepted += count
+        if self.first_seq is None:
+            self.first_seq = first_seq
+        self.last_seq = last_seq
+
+    def to_dict(self) -> dict:
+        return {
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "batches": self.batches,
+            "first_seq": self.first_seq,
+            "last_seq": self.last_seq,
+            "recipients": len(self.recipients),
+            "frames_sent": self.frames_sent,
+            "failed_deliveries": self.failed_deliveries,
+            "errors": [{"index": index, "error": error} for index, error in self.errors],
+        }
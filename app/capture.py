@@ -0,0 +1,121 @@
+"""
+Captura del tráfico entrante de /ws para reproducirlo después (replay_capture.py)
+
+Opcional: sólo se activa con CHAT_CAPTURE_PATH. Por cada conexión se
+registran la conexión, los frames recibidos y la desconexión, con el
+instante relativo al inicio de la captura.
+
+Los mensajes cifrados se guardan como texto plano (MESSAGE): el cifrado
+depende de las claves de la instancia capturada y el replay los vuelve a
+cifrar con las de la instancia destino. El archivo contiene por tanto los
+mensajes en claro y se crea con permisos 0600. Los frames file_* (chunks
+con AAD y archivos en el spool) no se capturan, ni los que el rate limiter
+rechaza antes de parsearlos.
+
+Formato: miembros gzip concatenados (uno por flush). Descomprimido es una
+secuencia de registros:
+    cabecera <B I d I>  tipo, conn_id, segundos desde el inicio, longitud
+    payload            UTF-8 (username, frame o texto según el tipo)
+El primer registro es HEADER con un JSON {"version", "started_at"}.
+"""
+import asyncio
+import gzip
+import json
+import os
+import struct
+import time
+from typing import Iterator, NamedTuple
+
+HEADER, CONNECT, FRAME, MESSAGE, DISCONNECT = range(5)
+KIND_NAMES = ("header", "connect", "frame", "message", "disconnect")
+
+RECORD = struct.Struct("<BIdI")
+FORMAT_VERSION = 1
+
+
+class CaptureEvent(NamedTuple):
+    kind: int
+    conn_id: int
+    t: float       # segundos desde el inicio de la captura
+    payload: str
+
+
+class TrafficCapture:
+    def __init__(self, path: str):
+        """
+        Los eventos se acumulan en memoria; flush() (periódico) los comprime
+        y los añade al archivo
+
+        Args:
+            path: Archivo de captura (se sobrescribe si ya existe)
+        """
+        self.path = path
+        self._started = time.monotonic()
+        self._buffer = bytearray()
+        self.events = 0
+        self.bytes_written = 0
+
+        # Crear con 0600: el archivo lleva mensajes en claro
+        os.close(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600))
+        self._append(HEADER, 0, json.dumps({"version": FORMAT_VERSION, "started_at": time.time()}))
+
+    def _append(self, kind: int, conn_id: int, payload: str):
+        data = payload.encode("utf-8")
+        self._buffer += RECORD.pack(kind, conn_id, time.monotonic() - self._started, len(data))
+        self._buffer += data
+        self.events += 1
+
+    def connect(self, conn_id: int, username: str):
+        self._append(CONNECT, conn_id, username)
+
+    def frame(self, conn_id: int, text: str):
+        self._append(FRAME, conn_id, text)
+
+    def message(self, conn_id: int, plaintext: str):
+        self._append(MESSAGE, conn_id, plaintext)
+
+    def disconnect(self, conn_id: int):
+        self._append(DISCONNECT, conn_id, "")
+
+    def _write(self, data: bytes):
+        compressed = gzip.compress(data, compresslevel=6)
+        with open(self.path, "ab") as f:
+            f.write(compressed)
+        self.bytes_written += len(compressed)
+
+    async def flush(self):
+        """Comprime y escribe lo acumulado en un hilo (no bloquea el loop)"""
+        if not self._buffer:
+            return
+        data, self._buffer = bytes(self._buffer), bytearray()
+        await asyncio.to_thread(self._write, data)
+
+    def close(self):
+        if self._buffer:
+            data, self._buffer = bytes(self._buffer), bytearray()
+            self._write(data)
+        print(f"📼 Captura cerrada: {self.events} eventos en {self.path}")
+
+    def get_stats(self) -> dict:
+        return {
+            "path": self.path,
+            "events": self.events,
+            "pending_bytes": len(self._buffer),
+            "bytes_written": self.bytes_written,
+        }
+
+
+def read_capture(path: str) -> Iterator[CaptureEvent]:
+    """Itera los eventos de un archivo de captura (sin el HEADER)"""
+    with gzip.open(path, "rb") as f:
+        while True:
+            try:
+                header = f.read(RECORD.size)
+                kind, conn_id, t, length = RECORD.unpack(header)
+                data = f.read(length)
+            except (EOFError, struct.error):
+                return  # Fin, o último miembro truncado por un cierre brusco
+            if len(data) < length:
+                return
+            if kind != HEADER:
+                yield CaptureEvent(kind, conn_id, t, data.decode("utf-8"))
@@ -1,77 +1,413 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, Header, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import HTMLResponse, StreamingResponse, JSONResponse, PlainTextResponse
 import json
-from typing import Dict, List
-import uvicorn
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import List, Optional
 from datetime import datetime
 
 # 🔐 NUEVAS IMPORTACIONES
 from websocket_crypto import crypto_manager
+from replay_guard import ReplayError
 import asyncio
+import itertools
+import os
+import re
+import secrets
+import tempfile
 import time
+from urllib.parse import quote
+
+from sessions import ConnectionRegistry, ClientSession
+from heartbeat import HeartbeatScheduler
+from rate_limit import RateLimiter
+from history import MessageHistory, to_timestamp_ms
+from history_index import HistoryIndex
+from history_export import MEDIA_TYPES, filter_rows, stream_export
+from supervisor import TaskSupervisor
+from traffic_stats import TrafficStats
+from file_transfer import TransferManager
+from presence import PresenceRoster, PresenceService
+from load_shedding import EventSampler, LoadShedder
+from pipeline import Stage
+from capture import TrafficCapture
+from broadcast_bulk import BulkError, BulkResult, batches, is_ndjson, iter_array, iter_ndjson
+
+# Supervisor de todas las tareas periódicas (se arranca en lifespan)
+supervisor = TaskSupervisor()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Arranque y apagado ordenado de la aplicación"""
+    global traffic_capture, handshake_slots
+    crypto_manager.ensure_key()
+    # Colas y semáforo del loop que sirve la app, no del de una ejecución anterior
+    for stage in pipeline_stages:
+        stage.start()
+    handshake_slots = asyncio.Semaphore(HANDSHAKE_CONCURRENCY)
+    if CAPTURE_PATH:
+        # Aquí y no al importar: el archivo se trunca al abrir la captura
+        traffic_capture = TrafficCapture(CAPTURE_PATH)
+        supervisor.add_periodic("capture_flush", traffic_capture.flush, interval=1, jitter=0)
+    await supervisor.start()
+    print("🚀 Servidor iniciado con cifrado WebSocket habilitado")
+    yield
+    await supervisor.stop()
+    if traffic_capture is not None:
+        traffic_capture.close()
+        traffic_capture = None
+    print("🛑 Tareas en background detenidas")
+
+
+app = FastAPI(lifespan=lifespan)
+
+# Roster de usuarios en línea; los cambios se envían en lotes (presence_delta)
+presence = PresenceService(PresenceRoster())
+
+# Registro de sesiones activas (indexado por username y por conn_id)
+# Las altas y bajas alimentan el roster; una reconexión no cuenta como baja
+connection_registry = ConnectionRegistry(on_join=presence.join, on_leave=presence.leave)
+
+# Registro de monitores (para ver mensajes en tiempo real)
+# Cada monitor se registra con un nombre único "monitor-N"
+monitor_registry = ConnectionRegistry(on_leave=presence.unsubscribe)
+monitor_ids = itertools.count(1)
+
+# Límites de frames entrantes (configurables por variables de entorno)
+rate_limiter = RateLimiter(
+    user_rate=float(os.environ.get("CHAT_USER_RATE", 5)),
+    user_burst=float(os.environ.get("CHAT_USER_BURST", 20)),
+    global_rate=float(os.environ.get("CHAT_GLOBAL_RATE", 500)),
+    global_burst=float(os.environ.get("CHAT_GLOBAL_BURST", 1000)),
+    transfer_rate=float(os.environ.get("CHAT_TRANSFER_RATE", 4 * 1024 * 1024)),
+    transfer_burst=float(os.environ.get("CHAT_TRANSFER_BURST", 8 * 1024 * 1024)),
+)
+
+# Detección barata de chunks de archivo antes de parsear el JSON (el orden
+# de las claves y los espacios dependen del cliente; el tipo real se
+# comprueba tras json.loads)
+FILE_CHUNK_TYPE = re.compile(r'"type"\s*:\s*"file_chunk"')
+
+# Historial de mensajes con números de secuencia del servidor
+message_history = MessageHistory(max_records=int(os.environ.get("CHAT_HISTORY_MAX", 100_000)))
+
+# Índices por usuario, minuto y palabra (se actualizan en cada append y recorte)
+history_index = HistoryIndex(message_history)
+
+# Mensajes recientes incluidos en el snapshot inicial de cada monitor
+MONITOR_SNAPSHOT_SIZE = int(os.environ.get("CHAT_MONITOR_SNAPSHOT", 200))
+
+# Hueco máximo (en mensajes) que se repone al reconectar; si es mayor el
+# cliente recibe resume_gap en lugar de la repetición
+RESUME_MAX_GAP = int(os.environ.get("CHAT_RESUME_MAX_GAP", 500))
+
+# Confirmación de mensajes recibidos:
+#   "ack"  -> frame pequeño con el id del cliente y el seq (sin cifrar de nuevo)
+#   "echo" -> reenvía el texto completo cifrado ("✓ mensaje"), modo anterior
+ACK_MODE = os.environ.get("CHAT_ACK_MODE", "ack")
+
+# Rotación de claves en dos fases: antelación del anuncio y periodo de
+# gracia (segundos) durante el que se acepta la clave reemplazada
+crypto_manager.announce_lead = float(os.environ.get("CHAT_KEY_ANNOUNCE_LEAD", 30))
+crypto_manager.grace_period = float(os.environ.get("CHAT_KEY_GRACE", 120))
+
+# Captura opcional del tráfico entrante para reproducirlo con
+# replay_capture.py (el archivo guarda los mensajes en claro). Se abre en
+# lifespan; launcher.py la rechaza con más de un worker
+CAPTURE_PATH = os.environ.get("CHAT_CAPTURE_PATH")
+traffic_capture: Optional[TrafficCapture] = None
+
+# Handshakes de /ws atendidos a la vez (accept, registro y welcome); el
+# semáforo se vuelve a crear en lifespan, en el loop del servidor
+HANDSHAKE_CONCURRENCY = int(os.environ.get("CHAT_HANDSHAKE_CONCURRENCY", 32))
+handshake_slots = asyncio.Semaphore(HANDSHAKE_CONCURRENCY)
+
+# Token de los endpoints de administración costosos (sin él, el profiler
+# queda deshabilitado)
+ADMIN_TOKEN = os.environ.get("CHAT_ADMIN_TOKEN")
+
+# Estadísticas de tráfico (ventana de una hora, resolución de un segundo)
+traffic_stats = TrafficStats(window=3600)
+
+# Archivos adjuntos: los chunks se escriben directamente en el spool
+transfer_manager = TransferManager(
+    spool_dir=os.environ.get("CHAT_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "chat-spool")),
+    max_file_size=int(os.environ.get("CHAT_MAX_FILE_SIZE", 100 * 1024 * 1024)),
+    window=int(os.environ.get("CHAT_FILE_WINDOW", 8)),
+)
+
+
+# 🔐 Limpieza periódica de claves
+async def periodic_key_cleanup():
+    """Descarta las claves cuyo periodo de gracia terminó"""
+    removed = crypto_manager._clean_old_keys()
+    if removed:
+        print(f"🔑 {len(removed)} claves expiradas eliminadas")
+
+
+# Frames que sólo cambian con la clave: se serializan una vez por época y
+# no una vez por cliente cuando se conecta una clase entera de golpe
+
+@lru_cache(maxsize=1)
+def _welcome_prefix(key_id: str) -> str:
+    """Todo el welcome salvo el valor de last_seq"""
+    _, key_base64 = crypto_manager.get_current_key_base64()
+    frame = json.dumps({
+        "type": "welcome",
+        "message": "Conexión establecida con cifrado",
+        "key_id": key_id,
+        "key_base64": key_base64,
+        "last_seq": 0
+    })
+    return frame[:-len("0}")]
 
-app = FastAPI()
 
-# Diccionario para almacenar las conexiones WebSocket activas
-# Clave: username, Valor: WebSocket connection
-active_connections: Dict[str, WebSocket] = {}
+def welcome_frame() -> str:
+    return f"{_welcome_prefix(crypto_manager.ensure_key())}{message_history.last_seq}}}"
 
-# Lista para almacenar conexiones de monitores (para ver mensajes en tiempo real)
-monitor_connections: List[WebSocket] = []
 
-# Lista para almacenar historial de mensajes (opcional)
-message_history: List[dict] = []
+@lru_cache(maxsize=1)
+def _key_announce_frame(key_id: str, key_base64: str, activate_at: float) -> str:
+    return json.dumps({
+        "type": "key_announce",
+        "next_key_id": key_id,
+        "key_base64": key_base64,
+        "activate_at": int(activate_at * 1000)
+    })
 
 
-# 🔐 NUEVA FUNCIÓN: Limpieza periódica de claves
-async def periodic_key_cleanup():
-    """Tarea de limpieza automática de claves expiradas"""
-    while True:
-        await asyncio.sleep(3600)  # Ejecutar cada hora
+def key_announce_frame() -> str:
+    """Frame con la siguiente clave y el instante (epoch ms) en que se activa"""
+    return _key_announce_frame(*crypto_manager.prepare_next_key())
+
+
+async def send_to_clients(frame: str) -> int:
+    """Envía el mismo frame ya serializado a todos los clientes. Retorna los fallidos"""
+    disconnected = []
+    for session in connection_registry:
         try:
-            crypto_manager._clean_old_keys()
-            print("🔑 Claves expiradas limpiadas automáticamente")
-        except Exception as e:
-            print(f"❌ Error en limpieza de claves: {e}")
+            await session.websocket.send_text(frame)
+        except Exception:
+            disconnected.append(session)
+
+    # Limpiar desconectados
+    for session in disconnected:
+        connection_registry.unregister(session)
+    return len(disconnected)
 
 
 async def periodic_key_rotation():
-    """Rotación automática de claves cada hora"""
-    while True:
-        await asyncio.sleep(3600)  # Cada hora
+    """
+    Rotación en dos fases por antigüedad (cada hora) o por uso:
+    1. key_announce con la siguiente clave, announce_lead segundos antes
+    2. key_activate al llegar activate_at; la clave anterior se sigue
+       aceptando durante grace_period segundos
+    Cada fase es un único frame compartido por todos los clientes
+    """
+    if crypto_manager.rotation_due():
+        await send_to_clients(key_announce_frame())
+        print(f"🔑 Clave {crypto_manager.next_key_id} anunciada")
+
+    activated = crypto_manager.activate_next_key()
+    if activated:
+        key_id, previous_key_id = activated
+        await send_to_clients(json.dumps({
+            "type": "key_activate",
+            "key_id": key_id,
+            "previous_key_id": previous_key_id,
+            "grace_ms": int(crypto_manager.grace_period * 1000)
+        }))
+        for session in connection_registry:
+            session.key_id = key_id
+        print(f"🔄 Clave {key_id} activada")
+
+
+PING_FRAME_TYPE = "ping"
+
+
+async def send_pings(sessions: List[ClientSession]):
+    """Envía un ping de aplicación a cada sesión silenciosa"""
+    frame = json.dumps({"type": PING_FRAME_TYPE, "t": int(time.time() * 1000)})
+    for session in sessions:
         try:
-            if crypto_manager.rotate_key_if_needed():
-                print("🔄 Clave rotada automáticamente")
+            await session.websocket.send_text(frame)
+        except Exception:
+            # El siguiente vencimiento la expulsará
+            pass
 
-                # Notificar a todos los clientes activos
-                key_id, key_base64 = crypto_manager.get_current_key_base64()
-                disconnected = []
 
-                for username, ws in active_connections.items():
-                    try:
-                        await ws.send_text(json.dumps({
-                            "type": "key_rotation",
-                            "key_id": key_id,
-                            "key_base64": key_base64,
-                            "message": "Clave rotada, actualizando..."
-                        }))
-                    except:
-                        disconnected.append(username)
+async def close_sessions(sessions: List[ClientSession], reason: str, code: int = 4001):
+    """Cierra los sockets de sesiones ya sacadas de su registro"""
+    for session in sessions:
+        try:
+            await asyncio.wait_for(session.websocket.close(code=code, reason=reason), timeout=1)
+        except Exception:
+            pass
 
-                # Limpiar desconectados
-                for user in disconnected:
-                    del active_connections[user]
 
-        except Exception as e:
-            print(f"❌ Error en rotación de claves: {e}")
+async def evict_clients(sessions: List[ClientSession]):
+    """Expulsa clientes inactivos y avisa a los monitores en un solo evento"""
+    await close_sessions(sessions, "Inactividad")
+    usernames = [session.username for session in sessions]
+    print(f"💤 Clientes expulsados por inactividad: {', '.join(usernames)}")
 
+    await notify_monitors("users_evicted", {
+        "usernames": usernames,
+        "active_count": len(connection_registry)
+    })
 
-@app.on_event("startup")
-async def startup_event():
-    """Iniciar tareas en background al arrancar la aplicación"""
-    asyncio.create_task(periodic_key_cleanup())
-    asyncio.create_task(periodic_key_rotation())  # NUEVA LÍNEA
-    print("🚀 Servidor iniciado con cifrado WebSocket habilitado")
+
+async def evict_monitors(sessions: List[ClientSession]):
+    """Expulsa monitores inactivos"""
+    await close_sessions(sessions, "Inactividad")
+    print(f"💤 Monitores expulsados por inactividad: {len(sessions)}")
+
+
+client_heartbeat = HeartbeatScheduler(
+    connection_registry, send_pings, evict_clients,
+    ping_interval=25, idle_timeout=90
+)
+monitor_heartbeat = HeartbeatScheduler(
+    monitor_registry, send_pings, evict_monitors,
+    ping_interval=25, idle_timeout=90
+)
+
+
+async def periodic_heartbeat():
+    """Un único temporizador para pings y expulsiones de clientes y monitores"""
+    for scheduler in (client_heartbeat, monitor_heartbeat):
+        await scheduler.tick()
+    rate_limiter.prune()
+
+
+async def push_traffic_stats():
+    """Envía a los monitores un único frame de estadísticas por tick"""
+    if len(monitor_registry):
+        await notify_monitors("traffic_stats", traffic_stats.snapshot(len(connection_registry)))
+        dropped = monitor_sampler.drain()
+        if dropped:
+            # Resumen de los mensajes no enviados mientras hay carga
+            await notify_monitors("messages_sampled", {
+                "dropped": dropped,
+                "sample_every": monitor_sampler.every
+            })
+
+
+async def on_load_level_change(previous: int, level: int):
+    """Aplica el nivel de degradación y lo anuncia a los monitores"""
+    if level >= 2:
+        history_index.pause()
+    else:
+        history_index.resume()
+    await notify_monitors("load_level", {"previous": previous, **load_shedder.get_stats()})
+
+
+async def periodic_index_catch_up():
+    """Pone al día el índice del historial en lotes tras una pausa por carga"""
+    if not history_index.paused and history_index.lag:
+        history_index.catch_up(5000)
+
+
+# Degradación por lag del event loop (umbrales en ms para los niveles 1, 2 y 3)
+load_shedder = LoadShedder(
+    thresholds=[int(ms) / 1000 for ms in os.environ.get("CHAT_LAG_THRESHOLDS", "50,200,500").split(",")],
+    on_change=on_load_level_change,
+)
+# Con nivel >= 1 los monitores reciben 1 de cada N mensajes
+monitor_sampler = EventSampler(every=int(os.environ.get("CHAT_MONITOR_SAMPLE_EVERY", 10)))
+
+
+async def periodic_file_cleanup():
+    """Elimina subidas abandonadas y archivos caducados del spool"""
+    removed = transfer_manager.cleanup()
+    if removed:
+        print(f"🧹 {removed} archivos eliminados del spool")
+
+
+# === Pipeline de mensajes entrantes ===
+# Los lectores de cada conexión sólo parsean y descifran; historial,
+# monitores y confirmaciones los procesan tareas dedicadas en lotes, así un
+# monitor o un cliente lento no frena el bucle de lectura de los demás.
+# historial -> acks con contrapresión; historial -> monitores con descarte.
+
+async def store_messages(batch: list):
+    """Etapa history: asigna seq en orden de llegada y reparte a acks y monitores"""
+    for session, client_id, decrypted, size in batch:
+        record = message_history.append(session.username, decrypted, True)
+        traffic_stats.record(session.username, size)
+        # Antes del put (que puede esperar): los monitores deben recibir los
+        # seq en orden aunque un broadcast ofrezca los suyos mientras tanto
+        if load_shedder.level == 0 or monitor_sampler.admit():
+            monitor_stage.offer(record)
+        await ack_stage.put((session, client_id, decrypted, record["seq"]))
+
+
+async def send_session_acks(session: ClientSession, frames: List[str]):
+    """Envía los acks de una sesión; si no los lee a tiempo se expulsa"""
+    try:
+        for frame in frames:
+            await asyncio.wait_for(session.websocket.send_text(frame), timeout=ACK_SEND_TIMEOUT)
+    except asyncio.TimeoutError:
+        if connection_registry.unregister(session):
+            print(f"🐢 {session.username} no lee sus confirmaciones, sesión cerrada")
+            await close_sessions([session], "Cliente lento")
+    except Exception:
+        # El lector de la sesión se encarga de la desconexión
+        pass
+
+
+async def send_acks(batch: list):
+    """Etapa acks: confirma cada mensaje a su remitente (sesiones en paralelo)"""
+    frames_by_session = {}
+    for session, client_id, decrypted, seq in batch:
+        if connection_registry.get_by_conn_id(session.conn_id) is not session:
+            continue  # Desconectada, reemplazada o expulsada por lenta
+        if ACK_MODE == "echo":
+            # Responder cifrado
+            encrypted_response = crypto_manager.encrypt_message(f"✓ {decrypted}")
+            encrypted_response["seq"] = seq
+            frame = json.dumps(encrypted_response)
+        else:
+            frame = json.dumps({"type": "ack", "id": client_id, "seq": seq})
+        frames_by_session.setdefault(session, []).append(frame)
+
+    # Un cliente que no lee sólo retrasa este lote hasta ACK_SEND_TIMEOUT
+    await asyncio.gather(*(send_session_acks(session, frames)
+                           for session, frames in frames_by_session.items()))
+
+
+async def publish_messages(batch: list):
+    """Etapa monitors: un único frame por lote"""
+    if len(batch) == 1:
+        await notify_monitors("message", batch[0])
+    else:
+        await notify_monitors("messages", {"records": batch})
+
+
+PIPELINE_QUEUE_SIZE = int(os.environ.get("CHAT_PIPELINE_QUEUE", 10_000))
+# Segundos que un remitente puede tardar en aceptar un ack antes de expulsarlo
+ACK_SEND_TIMEOUT = float(os.environ.get("CHAT_ACK_TIMEOUT", 2))
+history_stage = Stage("history", store_messages, maxsize=PIPELINE_QUEUE_SIZE, max_batch=256)
+ack_stage = Stage("acks", send_acks, maxsize=PIPELINE_QUEUE_SIZE, max_batch=256)
+monitor_stage = Stage("monitors", publish_messages, maxsize=PIPELINE_QUEUE_SIZE, max_batch=100)
+pipeline_stages = (history_stage, ack_stage, monitor_stage)
+
+
+# Orden de arranque: rotación y limpieza de claves, después el heartbeat
+# La rotación se comprueba cada segundo: anuncia pronto al agotarse el uso
+# y activa la clave anunciada cerca de su activate_at
+supervisor.add_periodic("key_rotation", periodic_key_rotation, interval=1, jitter=0)
+supervisor.add_periodic("key_cleanup", periodic_key_cleanup, interval=60)
+supervisor.add_periodic("heartbeat", periodic_heartbeat, interval=5, jitter=0.2)
+supervisor.add_periodic("traffic_stats", push_traffic_stats, interval=2, jitter=0)
+supervisor.add_periodic("file_cleanup", periodic_file_cleanup, interval=300)
+# Los cambios de presencia se agrupan en un delta cada 250 ms
+supervisor.add_periodic("presence", presence.flush, interval=0.25, jitter=0)
+supervisor.add_service("loop_lag", load_shedder.run)
+for stage in pipeline_stages:
+    supervisor.add_service(f"pipeline_{stage.name}", stage.run)
+supervisor.add_periodic("index_catch_up", periodic_index_catch_up, interval=0.5, jitter=0)
 
 
 @app.get("/monitor")
@@ -145,6 +481,13 @@ async def monitor_page():
                     color: #1976d2;
                     display: block;
                 }
+                .stat-list {
+                    display: block;
+                    color: #1976d2;
+                    font-size: 0.9rem;
+                    line-height: 1.5;
+                    white-space: pre-line;
+                }
                 .stat-label {
                     color: #5f6368;
                     font-size: 0.9rem;
@@ -242,17 +585,28 @@ async def monitor_page():
                 .messages-area {
                     flex: 1;
                     overflow-y: auto;
-                    padding: 1rem;
+                    padding: 0 1rem;
                     background: #fafbfc;
                 }
+                .virtual-spacer {
+                    position: relative;
+                    margin-top: 1rem;
+                }
+                .virtual-window {
+                    position: absolute;
+                    top: 0;
+                    left: 0;
+                    right: 0;
+                }
                 .message-item {
                     background: white;
                     border: 1px solid #e8eaed;
                     border-radius: 12px;
                     padding: 1rem;
-                    margin-bottom: 0.75rem;
-                    animation: slideIn 0.3s ease;
-                    transition: all 0.2s ease;
+                    margin-bottom: 12px;
+                    height: 84px;
+                    overflow: hidden;
+                    transition: box-shadow 0.2s ease;
                 }
                 .message-item:hover {
                     box-shadow: 0 2px 8px rgba(0,0,0,0.1);
@@ -271,10 +625,6 @@ async def monitor_page():
                     border-left: 4px solid #9c27b0;
                     background: #f3e5f5;
                 }
-                @keyframes slideIn {
-                    from { opacity: 0; transform: translateX(-10px); }
-                    to { opacity: 1; transform: translateX(0); }
-                }
                 .message-header {
                     display: flex;
                     align-items: center;
@@ -296,7 +646,9 @@ async def monitor_page():
                 .message-content {
                     color: #3c4043;
                     line-height: 1.4;
-                    word-wrap: break-word;
+                    white-space: nowrap;
+                    overflow: hidden;
+                    text-overflow: ellipsis;
                 }
                 .encryption-badge {
                     font-size: 0.7rem;
@@ -362,6 +714,22 @@ async def monitor_page():
                             <span class="stat-number" id="activeKeys">0</span>
                             <div class="stat-label">Claves Activas</div>
                         </div>
+                        <div class="stat-card">
+                            <span class="stat-number" id="rateLimited">0</span>
+                            <div class="stat-label">Frames Rechazados</div>
+                        </div>
+                        <div class="stat-card">
+                            <span class="stat-number" id="loadLevel">0</span>
+                            <div class="stat-label">Nivel de Carga</div>
+                        </div>
+                        <div class="stat-card">
+                            <span class="stat-list" id="onlineUsers">-</span>
+                            <div class="stat-label">En Línea</div>
+                        </div>
+                        <div class="stat-card">
+                            <span class="stat-list" id="topTalkers">-</span>
+                            <div class="stat-label">Más Activos (última hora)</div>
+                        </div>
                     </div>
 
                     <div class="controls-section">
@@ -416,10 +784,13 @@ async def monitor_page():
                     </div>
 
                     <div class="messages-area" id="messagesArea">
-                        <div class="empty-state">
+                        <div class="empty-state" id="emptyState">
                             <i class="material-icons">chat_bubble_outline</i>
                             <p>Esperando mensajes...</p>
                         </div>
+                        <div class="virtual-spacer" id="virtualSpacer">
+                            <div class="virtual-window" id="virtualWindow"></div>
+                        </div>
                     </div>
                 </div>
             </div>
@@ -427,14 +798,33 @@ async def monitor_page():
             <script>
                 // Variables globales para el monitor
                 let monitorWS = null;
-                let messageCount = 0;
                 let autoScroll = true;
                 let currentFilter = 'all';
-                let messagesPerMinute = 0;
-                let messageTimestamps = [];
+
+                // Feed acotado: ring de eventos y render sólo de las filas visibles
+                const MAX_EVENTS = 5000;
+                const ROW_HEIGHT = 96;  // .message-item (84px) + margen (12px)
+                const OVERSCAN = 5;
+                const events = new Array(MAX_EVENTS);
+                let nextEventId = 0;     // el evento con id N vive en events[N % MAX_EVENTS]
+                let visibleIds = [];     // ids que pasan el filtro actual
+                let visibleStart = 0;    // posiciones de visibleIds ya descartadas
+                let renderScheduled = false;
+                let newEvents = false;   // hay eventos nuevos para el auto-scroll
+
+                // seq del último mensaje mostrado: el snapshot y los eventos
+                // en vivo pueden solaparse, lo ya visto se descarta
+                let lastMessageSeq = 0;
+
+                // Roster de presencia (snapshot + deltas del servidor)
+                const onlineUsers = new Set();
+                const ROSTER_SHOWN = 20;
 
                 // Referencias DOM
                 const messagesArea = document.getElementById('messagesArea');
+                const virtualSpacer = document.getElementById('virtualSpacer');
+                const virtualWindow = document.getElementById('virtualWindow');
+                const emptyState = document.getElementById('emptyState');
                 const connectionStatus = document.getElementById('connectionStatus');
                 const autoScrollBtn = document.getElementById('autoScrollBtn');
 
@@ -456,23 +846,54 @@ async def monitor_page():
                         
                                 if (data.type === 'message') {
                                     // Mostrar mensaje del usuario
-                                    addMessage(data.username, data.message, data.timestamp, data.is_encrypted ? 'encrypted' : 'user');
-                                    updateMessageStats();
-                                } 
-                                else if (data.type === 'user_connected') {
-                                    addSystemMessage(`Usuario conectado: ${data.username}`);
-                                    updateUserCount(data.active_count);
+                                    addRecord(data);
                                 } 
-                                else if (data.type === 'user_disconnected') {
-                                    addSystemMessage(`Usuario desconectado: ${data.username}`);
-                                    updateUserCount(data.active_count);
-                                } 
-                                else if (data.type === 'status_update') {
+                                else if (data.type === 'messages') {
+                                    // Lote de mensajes del pipeline
+                                    data.records.forEach(addRecord);
+                                }
+                                else if (data.type === 'monitor_snapshot') {
+                                    applySnapshot(data);
+                                }
+                                else if (data.type === 'users_evicted') {
+                                    addSystemMessage(`Usuarios expulsados por inactividad: ${data.usernames.join(', ')}`);
                                     updateUserCount(data.active_count);
+                                }
+                                else if (data.type === 'presence_snapshot') {
+                                    onlineUsers.clear();
+                                    data.users.forEach(user => onlineUsers.add(user));
+                                    updateRoster();
+                                }
+                                else if (data.type === 'presence_delta') {
+                                    data.joined.forEach(user => onlineUsers.add(user));
+                                    data.left.forEach(user => onlineUsers.delete(user));
+                                    if (data.joined.length) {
+                                        addSystemMessage(`Usuarios conectados: ${summarizeUsers(data.joined)}`);
+                                    }
+                                    if (data.left.length) {
+                                        addSystemMessage(`Usuarios desconectados: ${summarizeUsers(data.left)}`);
+                                    }
+                                    updateRoster();
+                                }
+                                else if (data.type === 'load_level') {
+                                    document.getElementById('loadLevel').textContent = data.level;
+                                    addSystemMessage(`Nivel de carga ${data.previous} → ${data.level} (${data.level_name}), lag ${data.lag_smoothed_ms} ms`, data.level > data.previous);
+                                }
+                                else if (data.type === 'messages_sampled') {
+                                    addSystemMessage(`Carga alta: ${data.dropped} mensajes no mostrados (se muestra 1 de cada ${data.sample_every})`);
+                                }
+                                else if (data.type === 'file_shared') {
+                                    addSystemMessage(`Archivo compartido por ${data.from}: ${data.name} (${data.size} bytes)`);
+                                }
+                                else if (data.type === 'ping') {
+                                    monitorWS.send(JSON.stringify({ type: 'pong', t: data.t }));
+                                }
+                                else if (data.type === 'rate_limit') {
+                                    updateRateLimit(data);
                                     // No mostrar en el feed
-                                } 
-                                else if (data.type === 'key_info') {
-                                    updateKeyInfo(data.key_info);
+                                }
+                                else if (data.type === 'traffic_stats') {
+                                    updateTrafficStats(data);
                                     // No mostrar en el feed
                                 }
                             } catch (e) {
@@ -501,84 +922,185 @@ async def monitor_page():
                     connectionStatus.querySelector('span').textContent = text;
                 }
 
+                function summarizeUsers(users) {
+                    const more = users.length > 10 ? ` y ${users.length - 10} más` : '';
+                    return users.slice(0, 10).join(', ') + more;
+                }
+
                 function updateUserCount(count) {
                     document.getElementById('activeUsers').textContent = count;
                 }
 
+                function updateRoster() {
+                    updateUserCount(onlineUsers.size);
+                    const users = Array.from(onlineUsers).sort();
+                    const shown = users.slice(0, ROSTER_SHOWN).join('\\n');
+                    document.getElementById('onlineUsers').textContent = users.length > ROSTER_SHOWN
+                        ? `${shown}\\n… y ${users.length - ROSTER_SHOWN} más`
+                        : (shown || '-');
+                }
+
+                function updateRateLimit(stats) {
+                    document.getElementById('rateLimited').textContent = stats.rejected_user + stats.rejected_global;
+                }
+
                 function updateKeyInfo(keyInfo) {
                     document.getElementById('activeKeys').textContent = keyInfo.total_keys;
                 }
 
-                function updateMessageStats() {
-                    messageCount++;
-                    document.getElementById('totalMessages').textContent = messageCount;
-
-                    // Calcular mensajes por minuto
-                    const now = Date.now();
-                    messageTimestamps.push(now);
+                function updateTrafficStats(stats) {
+                    // Estadísticas calculadas en el servidor: iguales para todos los monitores
+                    document.getElementById('totalMessages').textContent = stats.total_messages;
+                    document.getElementById('messagesPerMinute').textContent = stats.messages_per_minute;
+                    document.getElementById('activeUsers').textContent = stats.active_users;
+                    document.getElementById('topTalkers').textContent = stats.top_talkers.length
+                        ? stats.top_talkers.map(([user, count]) => `${user}: ${count}`).join('\\n')
+                        : '-';
+                }
 
-                    // Mantener solo timestamps de los últimos 60 segundos
-                    messageTimestamps = messageTimestamps.filter(time => now - time < 60000);
-                    messagesPerMinute = messageTimestamps.length;
-                    document.getElementById('messagesPerMinute').textContent = messagesPerMinute;
+                function matchesFilter(type) {
+                    switch(currentFilter) {
+                        case 'users':
+                            return type === 'user' || type === 'encrypted';
+                        case 'system':
+                            return type === 'system' || type === 'error';
+                        case 'encrypted':
+                            return type === 'encrypted';
+                        default:
+                            return true;
+                    }
                 }
 
                 function addMessage(username, message, timestamp, type = 'user') {
-                    // Limpiar empty state si existe
-                    if (messagesArea.querySelector('.empty-state')) {
-                        messagesArea.innerHTML = '';
+                    // El ring sobrescribe el evento más antiguo al llenarse
+                    const id = nextEventId++;
+                    events[id % MAX_EVENTS] = { id, username, message: String(message), timestamp, type };
+                    if (matchesFilter(type)) {
+                        visibleIds.push(id);
                     }
+                    newEvents = true;
+                    scheduleRender();
+                }
 
-                    const messageDiv = document.createElement('div');
-                    messageDiv.className = `message-item ${type}`;
-                    messageDiv.setAttribute('data-type', type);
+                function addRecord(record) {
+                    if (record.seq <= lastMessageSeq) return;
+                    lastMessageSeq = record.seq;
+                    addMessage(record.username, record.message, record.timestamp, record.is_encrypted ? 'encrypted' : 'user');
+                }
 
-                    const time = new Date(timestamp).toLocaleTimeString();
-                    const userInitial = username.charAt(0).toUpperCase();
+                function applySnapshot(data) {
+                    if (data.seq < lastMessageSeq) {
+                        // El servidor se reinició y los seq empiezan de nuevo
+                        lastMessageSeq = 0;
+                    }
+                    data.messages.forEach(addRecord);
+                    lastMessageSeq = data.seq;
+                    onlineUsers.clear();
+                    data.presence.users.forEach(user => onlineUsers.add(user));
+                    updateRoster();
+                    updateRateLimit(data.status.rate_limit);
+                    updateTrafficStats(data.status.traffic);
+                    document.getElementById('loadLevel').textContent = data.status.load.level;
+                    updateKeyInfo(data.key_info);
+                    if (data.messages.length) {
+                        addSystemMessage(`${data.messages.length} mensajes recientes cargados (hasta #${data.seq})`);
+                    }
+                }
 
-                    let encryptionBadge = '';
-                    if (type === 'encrypted') {
-                        encryptionBadge = '<span class="encryption-badge">CIFRADO</span>';
+                function addSystemMessage(message, isError = false) {
+                    addMessage('Sistema', message, new Date().toISOString(), isError ? 'error' : 'system');
+                }
+
+                function pruneVisibleIds() {
+                    // Descartar ids que ya salieron del ring
+                    const oldest = Math.max(0, nextEventId - MAX_EVENTS);
+                    while (visibleStart < visibleIds.length && visibleIds[visibleStart] < oldest) {
+                        visibleStart++;
+                    }
+                    if (visibleStart > 1024 && visibleStart * 2 > visibleIds.length) {
+                        visibleIds = visibleIds.slice(visibleStart);
+                        visibleStart = 0;
                     }
+                }
 
-                    messageDiv.innerHTML = `
-                        <div class="message-header">
-                            <div class="message-user">
-                                <div class="user-avatar">${userInitial}</div>
-                                <span>${username}</span>
-                                ${encryptionBadge}
-                            </div>
-                            <div class="message-time">${time}</div>
-                        </div>
-                        <div class="message-content">${message}</div>
-                    `;
+                function scheduleRender() {
+                    // Todas las escrituras al DOM se agrupan en un frame de animación
+                    if (!renderScheduled) {
+                        renderScheduled = true;
+                        requestAnimationFrame(render);
+                    }
+                }
 
-                    messagesArea.appendChild(messageDiv);
+                function buildRow(item) {
+                    const row = document.createElement('div');
+                    row.className = `message-item ${item.type}`;
+
+                    const header = document.createElement('div');
+                    header.className = 'message-header';
+
+                    const user = document.createElement('div');
+                    user.className = 'message-user';
+                    const avatar = document.createElement('div');
+                    avatar.className = 'user-avatar';
+                    avatar.textContent = item.username.charAt(0).toUpperCase();
+                    const name = document.createElement('span');
+                    name.textContent = item.username;
+                    user.append(avatar, name);
+                    if (item.type === 'encrypted') {
+                        const badge = document.createElement('span');
+                        badge.className = 'encryption-badge';
+                        badge.textContent = 'CIFRADO';
+                        user.appendChild(badge);
+                    }
 
-                    // Aplicar filtro
-                    applyCurrentFilter();
+                    const time = document.createElement('div');
+                    time.className = 'message-time';
+                    time.textContent = new Date(item.timestamp).toLocaleTimeString();
+                    header.append(user, time);
 
-                    // Auto-scroll
-                    if (autoScroll) {
+                    const content = document.createElement('div');
+                    content.className = 'message-content';
+                    content.textContent = item.message;
+                    content.title = item.message;
+
+                    row.append(header, content);
+                    return row;
+                }
+
+                function render() {
+                    renderScheduled = false;
+                    pruneVisibleIds();
+
+                    const total = visibleIds.length - visibleStart;
+                    emptyState.style.display = total === 0 ? 'block' : 'none';
+                    virtualSpacer.style.height = (total * ROW_HEIGHT) + 'px';
+
+                    if (autoScroll && newEvents) {
                         messagesArea.scrollTop = messagesArea.scrollHeight;
                     }
-                }
+                    newEvents = false;
+
+                    // Sólo se construyen las filas visibles (más un margen)
+                    const scrollTop = messagesArea.scrollTop;
+                    const first = Math.max(0, Math.floor(scrollTop / ROW_HEIGHT) - OVERSCAN);
+                    const last = Math.min(total, Math.ceil((scrollTop + messagesArea.clientHeight) / ROW_HEIGHT) + OVERSCAN);
+
+                    const fragment = document.createDocumentFragment();
+                    for (let i = first; i < last; i++) {
+                        fragment.appendChild(buildRow(events[visibleIds[visibleStart + i] % MAX_EVENTS]));
+                    }
+                    virtualWindow.style.transform = `translateY(${first * ROW_HEIGHT}px)`;
+                    virtualWindow.replaceChildren(fragment);
 
-                function addSystemMessage(message, isError = false) {
-                    addMessage('Sistema', message, new Date().toISOString(), isError ? 'error' : 'system');
                 }
 
                 function clearMessages() {
-                    messagesArea.innerHTML = `
-                        <div class="empty-state">
-                            <i class="material-icons">chat_bubble_outline</i>
-                            <p>Monitor limpiado. Esperando nuevos mensajes...</p>
-                        </div>
-                    `;
-                    messageCount = 0;
-                    document.getElementById('totalMessages').textContent = messageCount;
-                    messageTimestamps = [];
-                    document.getElementById('messagesPerMinute').textContent = 0;
+                    events.fill(undefined);
+                    nextEventId = 0;
+                    visibleIds = [];
+                    visibleStart = 0;
+                    emptyState.querySelector('p').textContent = 'Monitor limpiado. Esperando nuevos mensajes...';
+                    scheduleRender();
                 }
 
                 function toggleAutoScroll() {
@@ -602,50 +1124,26 @@ async def monitor_page():
                 }
 
                 function applyCurrentFilter() {
-                    const messages = messagesArea.querySelectorAll('.message-item');
-                    messages.forEach(msg => {
-                        const type = msg.getAttribute('data-type');
-                        let show = false;
-
-                        switch(currentFilter) {
-                            case 'all':
-                                show = true;
-                                break;
-                            case 'users':
-                                show = type === 'user' || type === 'encrypted';
-                                break;
-                            case 'system':
-                                show = type === 'system' || type === 'error';
-                                break;
-                            case 'encrypted':
-                                show = type === 'encrypted';
-                                break;
+                    // Recalcular la vista filtrada desde el ring (como máximo MAX_EVENTS)
+                    visibleIds = [];
+                    visibleStart = 0;
+                    for (let id = Math.max(0, nextEventId - MAX_EVENTS); id < nextEventId; id++) {
+                        if (matchesFilter(events[id % MAX_EVENTS].type)) {
+                            visibleIds.push(id);
                         }
-
-                        msg.style.display = show ? 'block' : 'none';
-                    });
+                    }
+                    scheduleRender();
                 }
 
                 function exportMessages() {
-                    const messages = messagesArea.querySelectorAll('.message-item:not([style*="display: none"])');
-                    let exportData = 'REPORTE DE CHAT - ' + new Date().toLocaleString() + '\\n';
-                    exportData += '='.repeat(50) + '\\n\\n';
-
-                    messages.forEach(msg => {
-                        const user = msg.querySelector('.message-user span').textContent;
-                        const time = msg.querySelector('.message-time').textContent;
-                        const content = msg.querySelector('.message-content').textContent;
-                        const isEncrypted = msg.classList.contains('encrypted');
-                        exportData += `[${time}] ${user}${isEncrypted ? ' [CIFRADO]' : ''}: ${content}\\n`;
-                    });
-
-                    const blob = new Blob([exportData], { type: 'text/plain' });
-                    const url = window.URL.createObjectURL(blob);
+                    // El servidor filtra y genera la exportación en streaming
+                    const params = new URLSearchParams({ format: 'ndjson' });
+                    if (currentFilter === 'encrypted') {
+                        params.set('is_encrypted', 'true');
+                    }
                     const a = document.createElement('a');
-                    a.href = url;
-                    a.download = `chat-monitor-${new Date().toISOString().slice(0,19).replace(/:/g,'-')}.txt`;
+                    a.href = '/messages/export?' + params.toString();
                     a.click();
-                    window.URL.revokeObjectURL(url);
                 }
 
                 // Inicialización
@@ -654,6 +1152,10 @@ async def monitor_page():
                     initializeMonitorWebSocket();
                 });
 
+                messagesArea.addEventListener('scroll', scheduleRender, { passive: true });
+                window.addEventListener('resize', scheduleRender);
+
+
                 // Reconexión automática
                 setInterval(function() {
                     if (monitorWS && monitorWS.readyState === WebSocket.CLOSED) {
@@ -800,12 +1302,17 @@ async def client_page(username: str):
         <div class="encryption-info" id="encryptionInfo">
             Inicializando...
         </div>
+        <div class="encryption-info" id="presenceInfo"></div>
     </div>
 
     <div class="chat-container">
         <div class="messages-area" id="messages"></div>
         <div class="input-area">
             <input type="text" id="messageText" placeholder="Escribe tu mensaje...">
+            <input type="file" id="fileInput" hidden>
+            <button id="attachButton" title="Adjuntar archivo" disabled>
+                <i class="material-icons">attach_file</i>
+            </button>
             <button id="sendButton" disabled>
                 <i class="material-icons">send</i> Enviar
             </button>
@@ -816,6 +1323,9 @@ async def client_page(username: str):
         let ws = null;
         let cryptoKey = null;
         let currentKeyId = null;
+        // key_id -> clave importada: la actual, la anunciada y las anteriores en gracia
+        const keyring = new Map();
+        let keyActivationTimer = null;
         let useWebCrypto = false;
         const username = window.location.pathname.split('/').pop(); // Obtiene el username de la URL
 
@@ -857,7 +1367,7 @@ async def client_page(username: str):
 
         async function importKeyWebCrypto(keyBase64) {
             const keyBuffer = base64ToArrayBuffer(keyBase64);
-            cryptoKey = await crypto.subtle.importKey(
+            return await crypto.subtle.importKey(
                 'raw',
                 keyBuffer,
                 { name: 'AES-GCM', length: 256 },
@@ -881,12 +1391,12 @@ async def client_page(username: str):
             };
         }
 
-        async function decryptWebCrypto(encryptedBase64, nonceBase64) {
+        async function decryptWebCrypto(encryptedBase64, nonceBase64, key) {
             const encryptedBuffer = base64ToArrayBuffer(encryptedBase64);
             const nonce = base64ToArrayBuffer(nonceBase64);
             const decryptedBuffer = await crypto.subtle.decrypt(
                 { name: 'AES-GCM', iv: nonce },
-                cryptoKey,
+                key,
                 encryptedBuffer
             );
             const decoder = new TextDecoder();
@@ -895,7 +1405,7 @@ async def client_page(username: str):
 
         // === CIFRADO CON CRYPTOJS (fallback para HTTP) ===
         function importKeyCryptoJS(keyBase64) {
-            cryptoKey = keyBase64;
+            return keyBase64;
         }
 
         function encryptCryptoJS(message) {
@@ -918,8 +1428,8 @@ async def client_page(username: str):
             };
         }
 
-        function decryptCryptoJS(encryptedBase64, nonceBase64) {
-            const keyWordArray = CryptoJS.enc.Base64.parse(cryptoKey);
+        function decryptCryptoJS(encryptedBase64, nonceBase64, key) {
+            const keyWordArray = CryptoJS.enc.Base64.parse(key);
             const iv = CryptoJS.enc.Base64.parse(nonceBase64);
             const ciphertext = CryptoJS.enc.Base64.parse(encryptedBase64);
             
@@ -937,16 +1447,14 @@ async def client_page(username: str):
         }
 
         // === FUNCIONES UNIFICADAS ===
-        async function importKey(keyBase64) {
+        async function importKey(keyBase64, keyId, activate = true) {
             try {
-                if (useWebCrypto) {
-                    await importKeyWebCrypto(keyBase64);
-                } else {
-                    importKeyCryptoJS(keyBase64);
+                const key = useWebCrypto ? await importKeyWebCrypto(keyBase64) : importKeyCryptoJS(keyBase64);
+                keyring.set(keyId, key);
+                if (activate) {
+                    activateKey(keyId);
+                    addMessage('Sistema', '✅ Clave importada correctamente', 'system');
                 }
-                addMessage('Sistema', '✅ Clave importada correctamente', 'system');
-                document.getElementById('sendButton').disabled = false;
-                updateEncryptionInfo();
                 return true;
             } catch (error) {
                 addMessage('Sistema', '❌ Error importando clave: ' + error.message, 'system');
@@ -954,6 +1462,40 @@ async def client_page(username: str):
             }
         }
 
+        function activateKey(keyId) {
+            if (!keyring.has(keyId) || keyId === currentKeyId) return;
+            cryptoKey = keyring.get(keyId);
+            currentKeyId = keyId;
+            document.getElementById('sendButton').disabled = false;
+            document.getElementById('attachButton').disabled = !useWebCrypto;
+            updateEncryptionInfo();
+        }
+
+        function forgetKeysExcept(keepIds) {
+            for (const keyId of [...keyring.keys()]) {
+                if (!keepIds.includes(keyId)) keyring.delete(keyId);
+            }
+        }
+
+        async function onKeyAnnounce(data) {
+            // Fase 1: la siguiente clave llega antes de usarse y se activa en activate_at
+            if (!await importKey(data.key_base64, data.next_key_id, false)) return;
+            clearTimeout(keyActivationTimer);
+            keyActivationTimer = setTimeout(
+                () => activateKey(data.next_key_id),
+                Math.max(0, data.activate_at - Date.now())
+            );
+        }
+
+        function onKeyActivate(data) {
+            // Fase 2: por si el reloj local va atrasado respecto al servidor
+            clearTimeout(keyActivationTimer);
+            activateKey(data.key_id);
+            addMessage('Sistema', '🔄 Clave rotada', 'system');
+            // La anterior sólo sirve para los frames en vuelo durante la gracia
+            setTimeout(() => forgetKeysExcept([currentKeyId]), data.grace_ms);
+        }
+
         async function encryptMessage(message) {
             if (useWebCrypto) {
                 return await encryptWebCrypto(message);
@@ -962,11 +1504,13 @@ async def client_page(username: str):
             }
         }
 
-        async function decryptMessage(encryptedBase64, nonceBase64) {
+        async function decryptMessage(encryptedBase64, nonceBase64, keyId) {
+            const key = keyring.get(keyId);
+            if (!key) throw new Error('Clave desconocida: ' + keyId);
             if (useWebCrypto) {
-                return await decryptWebCrypto(encryptedBase64, nonceBase64);
+                return await decryptWebCrypto(encryptedBase64, nonceBase64, key);
             } else {
-                return decryptCryptoJS(encryptedBase64, nonceBase64);
+                return decryptCryptoJS(encryptedBase64, nonceBase64, key);
             }
         }
 
@@ -976,12 +1520,161 @@ async def client_page(username: str):
                 `🔐 Cifrado Activo: <strong>${method}</strong> | Clave: ${currentKeyId ? currentKeyId.substring(0, 12) + '...' : 'N/A'}`;
         }
 
+        // Último seq del servidor visto (sobrevive a recargas de la pestaña)
+        const seqStorageKey = 'lastSeq:' + username;
+        let lastSeq = parseInt(sessionStorage.getItem(seqStorageKey) || '0', 10);
+        let reconnectAttempts = 0;
+        let nextMessageId = 1;
+        const pendingAcks = new Map();  // id del mensaje -> elemento en pantalla
+        let overloadRetryMs = 0;  // retry-after indicado por un servidor sobrecargado
+
+        function updateLastSeq(seq) {
+            if (seq > lastSeq) {
+                resetLastSeq(seq);
+            }
+        }
+
+        function resetLastSeq(seq) {
+            lastSeq = seq;
+            sessionStorage.setItem(seqStorageKey, String(lastSeq));
+        }
+
+        // === PRESENCIA: snapshot al suscribirse y deltas después ===
+        const onlineUsers = new Set();
+
+        function updatePresenceInfo() {
+            const others = Array.from(onlineUsers).filter(user => user !== username).sort();
+            const shown = others.slice(0, 8).join(', ');
+            document.getElementById('presenceInfo').textContent =
+                `👥 ${onlineUsers.size} en línea` + (shown ? ': ' + shown + (others.length > 8 ? '…' : '') : '');
+        }
+
+        // === ARCHIVOS: chunks AES-GCM con ventana de envío ===
+        // Cada chunk se cifra con AAD "transfer_id:index" y sólo hay
+        // `window` chunks sin confirmar, así que el archivo nunca se carga entero
+        const FILE_CHUNK_SIZE = 64 * 1024;
+        let upload = null;  // subida en curso
+
+        function escapeHtml(text) {
+            const div = document.createElement('div');
+            div.textContent = text;
+            return div.innerHTML;
+        }
+
+        function formatSize(bytes) {
+            if (bytes < 1024) return bytes + ' B';
+            if (bytes < 1024 * 1024) return (bytes / 1024).toFixed(1) + ' KiB';
+            return (bytes / 1024 / 1024).toFixed(1) + ' MiB';
+        }
+
+        function startUpload(file) {
+            if (!useWebCrypto) {
+                addMessage('Sistema', '❌ Enviar archivos requiere Web Crypto (HTTPS)', 'warning');
+                return;
+            }
+            if (upload) {
+                addMessage('Sistema', '⏳ Ya hay un archivo enviándose', 'warning');
+                return;
+            }
+            upload = {
+                file: file, transferId: null, chunkSize: FILE_CHUNK_SIZE,
+                totalChunks: 0, nextIndex: 0, inFlight: 0, window: 1,
+                element: addMessage(username, '📎 ' + escapeHtml(file.name) + ' (0%)', 'encrypted')
+            };
+            ws.send(JSON.stringify({
+                type: 'file_offer', name: file.name, size: file.size, chunk_size: FILE_CHUNK_SIZE
+            }));
+        }
+
+        function resumeUpload() {
+            // El servidor responde con file_accept y el primer chunk que le falta
+            if (upload && upload.transferId && ws && ws.readyState === WebSocket.OPEN) {
+                ws.send(JSON.stringify({ type: 'file_offer', transfer_id: upload.transferId }));
+            }
+        }
+
+        async function encryptChunk(bytes, aad) {
+            const nonce = crypto.getRandomValues(new Uint8Array(12));
+            const encryptedBuffer = await crypto.subtle.encrypt(
+                { name: 'AES-GCM', iv: nonce, additionalData: new TextEncoder().encode(aad) },
+                cryptoKey,
+                bytes
+            );
+            return {
+                encrypted: arrayBufferToBase64(encryptedBuffer),
+                nonce: arrayBufferToBase64(nonce)
+            };
+        }
+
+        async function pumpUpload() {
+            const current = upload;
+            while (current === upload && current.inFlight < current.window
+                   && current.nextIndex < current.totalChunks) {
+                const index = current.nextIndex++;
+                current.inFlight++;
+                const start = index * current.chunkSize;
+                // Sólo se lee del disco el chunk que se va a enviar
+                const bytes = await current.file.slice(start, start + current.chunkSize).arrayBuffer();
+                const encrypted = await encryptChunk(bytes, current.transferId + ':' + index);
+                if (current !== upload || ws.readyState !== WebSocket.OPEN) return;
+                // "type" va primero: el servidor reconoce los chunks sin parsear el JSON
+                ws.send(JSON.stringify({
+                    type: 'file_chunk',
+                    transfer_id: current.transferId,
+                    index: index,
+                    ...encrypted,
+                    key_id: currentKeyId
+                }));
+            }
+        }
+
+        function handleFileFrame(data) {
+            if (data.type === 'file_accept' && upload) {
+                upload.transferId = data.transfer_id;
+                upload.chunkSize = data.chunk_size;
+                upload.totalChunks = data.total_chunks;
+                upload.window = data.window;
+                upload.nextIndex = data.next_index;
+                upload.inFlight = 0;
+                pumpUpload();
+            }
+            else if (data.type === 'file_ack' && upload && data.transfer_id === upload.transferId) {
+                upload.inFlight = Math.max(0, upload.inFlight - 1);
+                const percent = Math.floor(100 * data.received / upload.totalChunks);
+                upload.element.innerHTML = `<strong>${username}:</strong> 📎 ${escapeHtml(upload.file.name)} (${percent}%)`;
+                if (data.received === upload.totalChunks) {
+                    ws.send(JSON.stringify({ type: 'file_complete', transfer_id: upload.transferId }));
+                } else {
+                    pumpUpload();
+                }
+            }
+            else if (data.type === 'file_available') {
+                if (upload && data.transfer_id === upload.transferId) {
+                    upload.element.remove();
+                    upload = null;
+                }
+                const url = data.url + '?username=' + encodeURIComponent(username);
+                addMessage(
+                    escapeHtml(data.from),
+                    `📎 <a href="${url}" download>${escapeHtml(data.name)}</a> (${formatSize(data.size)})`,
+                    'decrypted'
+                );
+            }
+            else if (data.type === 'file_error') {
+                addMessage('Sistema', '❌ Archivo: ' + escapeHtml(data.error), 'warning');
+                if (upload && (!data.transfer_id || data.transfer_id === upload.transferId)) {
+                    upload = null;
+                }
+            }
+        }
+
         // WebSocket
         function connectWebSocket() {
             ws = new WebSocket("wss://" + window.location.host + "/ws/" + username);
 
             ws.onopen = function() {
                 addMessage('Sistema', '🔌 Conectado al servidor', 'system');
+                reconnectAttempts = 0;
                 checkWebCryptoAvailability();
             };
 
@@ -993,19 +1686,84 @@ async def client_page(username: str):
                         addMessage('Sistema', data.message, 'system');
                         
                         if (data.key_base64) {
-                            currentKeyId = data.key_id;
-                            await importKey(data.key_base64);
+                            forgetKeysExcept([]);
+                            currentKeyId = null;
+                            await importKey(data.key_base64, data.key_id);
+                        }
+                        if (lastSeq === 0) {
+                            updateLastSeq(data.last_seq || 0);
+                        } else {
+                            // Con la clave ya importada: pedir sólo el hueco desde el último seq visto
+                            ws.send(JSON.stringify({ type: 'resume', last_seq: lastSeq }));
+                        }
+                        resumeUpload();
+                        ws.send(JSON.stringify({ type: 'presence_subscribe' }));
+                    }
+                    else if (data.type === 'presence_snapshot') {
+                        onlineUsers.clear();
+                        data.users.forEach(user => onlineUsers.add(user));
+                        updatePresenceInfo();
+                    }
+                    else if (data.type === 'presence_delta') {
+                        data.joined.forEach(user => onlineUsers.add(user));
+                        data.left.forEach(user => onlineUsers.delete(user));
+                        updatePresenceInfo();
+                    }
+                    else if (data.type === 'overloaded') {
+                        overloadRetryMs = data.retry_after_ms;
+                        addMessage('Sistema', `⏳ Servidor sobrecargado, reintentando en ${Math.ceil(data.retry_after_ms / 1000)} s`, 'warning');
+                    }
+                    else if (data.type && data.type.startsWith('file_')) {
+                        handleFileFrame(data);
+                    }
+                    else if (data.type === 'replay') {
+                        const records = JSON.parse(await decryptMessage(data.encrypted, data.nonce, data.key_id));
+                        records.forEach(record => {
+                            addMessage(escapeHtml(record.username), escapeHtml(record.message), 'decrypted');
+                        });
+                        updateLastSeq(data.to_seq);
+                        addMessage('Sistema', `🔁 ${data.count} mensajes recuperados`, 'system');
+                    }
+                    else if (data.type === 'broadcast_batch') {
+                        const records = JSON.parse(await decryptMessage(data.encrypted, data.nonce, data.key_id));
+                        records.forEach(record => {
+                            addMessage(escapeHtml(record.username), escapeHtml(record.message), 'decrypted');
+                        });
+                        updateLastSeq(data.to_seq);
+                    }
+                    else if (data.type === 'resume_gap') {
+                        addMessage('Sistema', '⚠️ Se perdieron demasiados mensajes durante la desconexión', 'warning');
+                        resetLastSeq(data.last_seq);  // Puede ser menor si el servidor se reinició
+                    }
+                    else if (data.type === 'ack') {
+                        const element = pendingAcks.get(data.id);
+                        if (element) {
+                            element.innerHTML += ' ✓';
+                            pendingAcks.delete(data.id);
                         }
+                        updateLastSeq(data.seq);
+                    }
+                    else if (data.type === 'ping') {
+                        ws.send(JSON.stringify({ type: 'pong', t: data.t }));
+                    }
+                    else if (data.type === 'rate_limited' && data.scope === 'transfer') {
+                        // Chunk descartado: retomar la subida cuando haya cupo
+                        setTimeout(resumeUpload, data.retry_after_ms);
+                    }
+                    else if (data.type === 'rate_limited') {
+                        addMessage('Sistema', `⏳ Demasiados mensajes, espera ${Math.ceil(data.retry_after_ms / 1000)} s`, 'warning');
+                    }
+                    else if (data.type === 'key_announce') {
+                        await onKeyAnnounce(data);
                     }
-                    else if (data.type === 'key_rotation') {
-                        addMessage('Sistema', '🔄 Rotación de clave detectada', 'warning');
-                        currentKeyId = data.key_id;
-                        await importKey(data.key_base64);
+                    else if (data.type === 'key_activate') {
+                        onKeyActivate(data);
                     }
                     else if (data.encrypted && data.nonce && data.key_id) {
                         // NO mostrar el mensaje cifrado, solo descifrar y mostrar
                         try {
-                            const decrypted = await decryptMessage(data.encrypted, data.nonce);
+                            const decrypted = await decryptMessage(data.encrypted, data.nonce, data.key_id);
+                            if (data.seq) updateLastSeq(data.seq);
                         } catch (error) {
                             addMessage('Sistema', '❌ Error descifrando: ' + error.message, 'system');
                         }
@@ -1018,9 +1776,23 @@ async def client_page(username: str):
                 }
             };
             
-            ws.onclose = function() {
+            ws.onclose = function(event) {
                 addMessage('Sistema', '❌ Conexión cerrada', 'system');
                 document.getElementById('sendButton').disabled = true;
+                document.getElementById('attachButton').disabled = true;
+                pendingAcks.clear();
+                if (event.code === 4000) return;  // Sesión reemplazada por otra pestaña
+                if (event.code === 1013 && overloadRetryMs) {
+                    const delay = overloadRetryMs;
+                    overloadRetryMs = 0;
+                    setTimeout(connectWebSocket, delay);
+                    return;
+                }
+
+                // Reconexión con backoff exponencial y jitter
+                const delay = Math.min(30000, 1000 * 2 ** reconnectAttempts) * (0.5 + Math.random() / 2);
+                reconnectAttempts++;
+                setTimeout(connectWebSocket, delay);
             };
         }
 
@@ -1032,13 +1804,16 @@ async def client_page(username: str):
         
             try {
                 // Mostrar mensaje enviado con el username de la URL
-                addMessage(username, message, 'encrypted');
+                const element = addMessage(username, message, 'encrypted');
+                const id = nextMessageId++;
+                pendingAcks.set(id, element);
                 
                 const encrypted = await encryptMessage(message);
                 
                 ws.send(JSON.stringify({
                     ...encrypted,
                     key_id: currentKeyId,
+                    id: id,
                     timestamp: Date.now()
                 }));
                 
@@ -1055,9 +1830,17 @@ async def client_page(username: str):
             messageElement.innerHTML = `<strong>${user}:</strong> ${text}`;
             messagesDiv.appendChild(messageElement);
             messagesDiv.scrollTop = messagesDiv.scrollHeight;
+            return messageElement;
         }
 
         document.getElementById('sendButton').addEventListener('click', sendEncryptedMessage);
+        document.getElementById('attachButton').addEventListener('click', function() {
+            document.getElementById('fileInput').click();
+        });
+        document.getElementById('fileInput').addEventListener('change', function(e) {
+            if (e.target.files.length) startUpload(e.target.files[0]);
+            e.target.value = '';
+        });
         document.getElementById('messageText').addEventListener('keypress', function(e) {
             if (e.key === 'Enter' && !document.getElementById('sendButton').disabled) {
                 sendEncryptedMessage();
@@ -1127,7 +1910,10 @@ async def test_crypto_client():
             ws.onmessage = (event) => {
                 try {
                     const data = JSON.parse(event.data);
-                    if (data.type === 'welcome') {
+                    if (data.type === 'ping') {
+                        ws.send(JSON.stringify({ type: 'pong', t: data.t }));
+                    }
+                    else if (data.type === 'welcome') {
                         currentKeyId = data.current_key_id || data.key_info?.current_key_id;
                         addLog(`🔑 Clave actual del servidor: ${currentKeyId}`, "decrypted");
                     }
@@ -1200,36 +1986,76 @@ async def test_crypto_client():
 async def monitor_websocket(websocket: WebSocket):
     """WebSocket para el monitor de mensajes en tiempo real"""
     await websocket.accept()
-    monitor_connections.append(websocket)
+    session, _ = monitor_registry.register(f"monitor-{next(monitor_ids)}", websocket)
+    monitor_heartbeat.watch(session)
 
     print("🖥️ Monitor conectado")
 
     try:
-        # Enviar estado inicial
-        await websocket.send_text(json.dumps({
-            "type": "status_update",
-            "active_count": len(active_connections)
-        }))
+        # Estado inicial en un único frame. El monitor ya está registrado:
+        # los mensajes posteriores a "seq" le llegan en vivo y los que
+        # todavía estén en el pipeline los descarta por seq
+        await websocket.send_text(monitor_snapshot_frame(session))
 
-        # Enviar información de claves
-        key_info = crypto_manager.get_key_info()
-        await websocket.send_text(json.dumps({
-            "type": "key_info",
-            "key_info": key_info
-        }))
-
-        # Mantener la conexión activa
+        # Mantener la conexión activa (los pongs actualizan last_seen)
         while True:
-            await websocket.receive_text()
+            data = await websocket.receive_text()
+            session.touch(len(data))
 
     except WebSocketDisconnect:
-        monitor_connections.remove(websocket)
         print("🖥️ Monitor desconectado")
+    finally:
+        monitor_registry.unregister(session)
+
+
+def monitor_snapshot_frame(session: ClientSession) -> str:
+    """
+    monitor_snapshot: últimos MONITOR_SNAPSHOT_SIZE mensajes, roster,
+    estadísticas y claves. O(N) sobre el historial, no O(tamaño del historial)
+    """
+    return json.dumps({
+        "type": "monitor_snapshot",
+        "seq": message_history.last_seq,
+        "messages": message_history.recent(MONITOR_SNAPSHOT_SIZE),
+        # Los monitores siempre reciben la presencia: snapshot ahora, deltas después
+        "presence": presence.subscribe_snapshot(session),
+        "status": {
+            "active_count": len(connection_registry),
+            "rate_limit": rate_limiter.get_stats(),
+            "traffic": traffic_stats.snapshot(len(connection_registry)),
+            "load": load_shedder.get_stats()
+        },
+        "key_info": crypto_manager.get_key_info()
+    })
+
+
+async def send_resume(websocket: WebSocket, last_seen_seq: int):
+    """Repone a un cliente que reconecta los mensajes posteriores a last_seen_seq"""
+    records = message_history.since(last_seen_seq, RESUME_MAX_GAP)
+
+    if records is None:
+        await websocket.send_text(json.dumps({
+            "type": "resume_gap",
+            "last_seen_seq": last_seen_seq,
+            "oldest_seq": message_history.first_seq,
+            "last_seq": message_history.last_seq
+        }))
+        return
+
+    # Un único frame cifrado con todo el hueco
+    replay = crypto_manager.encrypt_message(json.dumps(records))
+    await websocket.send_text(json.dumps({
+        "type": "replay",
+        "from_seq": last_seen_seq + 1,
+        "to_seq": message_history.last_seq,
+        "count": len(records),
+        **replay
+    }))
 
 
 async def notify_monitors(message_type: str, data: dict):
     """Función para notificar a todos los monitores conectados"""
-    if not monitor_connections:
+    if not len(monitor_registry):
         return
 
     message = json.dumps({
@@ -1240,46 +2066,166 @@ async def notify_monitors(message_type: str, data: dict):
     # Lista de monitores desconectados para limpiar
     disconnected_monitors = []
 
-    for monitor in monitor_connections:
+    for monitor in monitor_registry:
         try:
-            await monitor.send_text(message)
+            await monitor.websocket.send_text(message)
         except:
             disconnected_monitors.append(monitor)
 
     # Limpiar monitores desconectados
     for monitor in disconnected_monitors:
-        if monitor in monitor_connections:
-            monitor_connections.remove(monitor)
-
-@app.websocket("/ws/{username}")
-async def websocket_endpoint(websocket: WebSocket, username: str):
-    await websocket.accept()
-    active_connections[username] = websocket
+        monitor_registry.unregister(monitor)
+
+async def announce_file(transfer):
+    """Avisa a los destinatarios (y al emisor) de que un archivo está disponible"""
+    frame = json.dumps({"type": "file_available", **transfer.to_dict()})
+    for session in connection_registry:
+        if transfer.recipients is None or session.username == transfer.owner \
+                or session.username in transfer.recipients:
+            try:
+                await session.websocket.send_text(frame)
+            except Exception:
+                pass
+    await notify_monitors("file_shared", transfer.to_dict())
 
-    print(f"✅ Cliente conectado: {username}")
-
-    await notify_monitors("user_connected", {
-        "username": username,
-        "active_count": len(active_connections)
-    })
 
+async def handle_file_frame(websocket: WebSocket, username: str, frame: dict):
+    """Procesa file_offer, file_chunk y file_complete de un cliente"""
+    frame_type = frame.get("type")
+    transfer_id = frame.get("transfer_id")
     try:
-        # ENVIAR CLAVE AL CLIENTE
-        key_id, key_base64 = crypto_manager.get_current_key_base64()
+        if frame_type == "file_offer":
+            transfer = transfer_manager.offer(username, frame)
+            await websocket.send_text(json.dumps(transfer_manager.accept_frame(transfer)))
+
+        elif frame_type == "file_chunk":
+            index = int(frame.get("index", -1))
+            # Ventana y pertenencia se validan antes de decodificar o descifrar
+            transfer = transfer_manager.check_chunk(username, transfer_id, index)
+            chunk = crypto_manager.decrypt_bytes(
+                frame["encrypted"], frame["nonce"], frame["key_id"],
+                aad=f"{transfer_id}:{index}".encode()
+            )
+            await transfer_manager.write_chunk(transfer, index, chunk)
+            await websocket.send_text(json.dumps({
+                "type": "file_ack",
+                "transfer_id": transfer_id,
+                "index": index,
+                "received": transfer.received
+            }))
+
+        elif frame_type == "file_complete":
+            transfer = transfer_manager.complete(username, transfer_id)
+            print(f"📎 {username} compartió {transfer.name} ({transfer.size} bytes)")
+            await announce_file(transfer)
+
+    except Exception as e:
+        # TransferError, ReplayError, chunk manipulado (InvalidTag) o frame incompleto
         await websocket.send_text(json.dumps({
-            "type": "welcome",
-            "message": "Conexión establecida con cifrado",
-            "key_id": key_id,
-            "key_base64": key_base64
+            "type": "file_error",
+            "transfer_id": transfer_id,
+            "error": str(e) or type(e).__name__
         }))
 
+
+async def send_rate_limited(websocket: WebSocket, rejection: tuple):
+    """Avisa al cliente de un frame rechazado por el rate limiter"""
+    scope, retry_after = rejection
+    await websocket.send_text(
+        f'{{"type":"rate_limited","scope":"{scope}","retry_after_ms":{int(retry_after * 1000) + 1}}}'
+    )
+    if rate_limiter.should_report():
+        await notify_monitors("rate_limit", rate_limiter.get_stats())
+
+
+@app.websocket("/ws/{username}")
+async def websocket_endpoint(websocket: WebSocket, username: str):
+    session = None
+    try:
+        # Handshakes acotados: en una avalancha de conexiones las sesiones
+        # abiertas se siguen atendiendo entre un accept y el siguiente
+        async with handshake_slots:
+            await websocket.accept()
+
+            if load_shedder.level >= 3:
+                # Sobrecarga: no aceptar sesiones nuevas, el cliente reintenta más tarde
+                await websocket.send_text(json.dumps({
+                    "type": "overloaded",
+                    "retry_after_ms": load_shedder.reject_connection()
+                }))
+                await websocket.close(code=1013, reason="Servidor sobrecargado")
+                return
+            session, replaced = connection_registry.register(username, websocket)
+            client_heartbeat.watch(session)
+            if traffic_capture is not None:
+                traffic_capture.connect(session.conn_id, username)
+
+            if replaced is not None:
+                # Reconexión con el mismo username: cerrar la sesión anterior
+                print(f"🔁 Sesión de {username} reemplazada por una reconexión")
+                await close_sessions([replaced], "Sesión reemplazada", code=4000)
+
+            print(f"✅ Cliente conectado: {username}")
+            # Los monitores se enteran por el siguiente presence_delta
+
+            # ENVIAR CLAVE AL CLIENTE
+            session.key_id = crypto_manager.ensure_key()
+            await websocket.send_text(welcome_frame())
+            if crypto_manager.next_key_id is not None:
+                # Conectado entre el anuncio y la activación
+                await websocket.send_text(key_announce_frame())
+
         while True:
             data = await websocket.receive_text()
-            timestamp = datetime.now().isoformat()
+            session.touch(len(data))
+
+            # Admisión antes de cualquier trabajo de JSON, base64 o AES
+            # Los chunks de archivo se limitan por bytes en lugar de por frames
+            as_transfer = FILE_CHUNK_TYPE.search(data) is not None
+            if as_transfer:
+                rejection = rate_limiter.check_transfer(username, len(data))
+            else:
+                rejection = rate_limiter.check(username)
+            if rejection is not None:
+                await send_rate_limited(websocket, rejection)
+                continue
 
             try:
                 message_data = json.loads(data)
 
+                if as_transfer and not (isinstance(message_data, dict)
+                                        and message_data.get("type") == "file_chunk"):
+                    # Admitido como chunk sin serlo: cobrarlo también como frame
+                    rejection = rate_limiter.check(username)
+                    if rejection is not None:
+                        await send_rate_limited(websocket, rejection)
+                        continue
+
+                if traffic_capture is not None and isinstance(message_data, dict) \
+                        and "encrypted" not in message_data \
+                        and not str(message_data.get("type", "")).startswith("file_"):
+                    # Los mensajes cifrados se capturan ya descifrados (más abajo)
+                    traffic_capture.frame(session.conn_id, data)
+
+                if isinstance(message_data, dict) and message_data.get("type") == "resume":
+                    # Primer frame de un cliente que reconecta
+                    last_seen_seq = message_data.get("last_seq")
+                    if type(last_seen_seq) is int and last_seen_seq >= 0:
+                        await send_resume(websocket, last_seen_seq)
+                    continue
+
+                if isinstance(message_data, dict) and message_data.get("type") == "presence_subscribe":
+                    await websocket.send_text(presence.subscribe(session))
+                    continue
+
+                if isinstance(message_data, dict) and message_data.get("type") == "presence_unsubscribe":
+                    presence.unsubscribe(session)
+                    continue
+
+                if isinstance(message_data, dict) and str(message_data.get("type", "")).startswith("file_"):
+                    await handle_file_frame(websocket, username, message_data)
+                    continue
+
                 if all(k in message_data for k in ['encrypted', 'nonce', 'key_id']):
                     try:
                         # Intentar descifrado (funciona con ambos tipos)
@@ -1290,26 +2236,19 @@ async def websocket_endpoint(websocket: WebSocket, username: str):
                         )
 
                         print(f"🔐 {username}: {decrypted}")
+                        if traffic_capture is not None:
+                            traffic_capture.message(session.conn_id, decrypted)
 
-                        message_history.append({
-                            "username": username,
-                            "message": decrypted,
-                            "timestamp": timestamp,
-                            "is_encrypted": True
-                        })
-
-                        await notify_monitors("message", {
-                            "username": username,
-                            "message": decrypted,
-                            "timestamp": timestamp,
-                            "is_encrypted": True
-                        })
-
-                        # Responder cifrado
-                        encrypted_response = crypto_manager.encrypt_message(
-                            f"✓ {decrypted}"
-                        )
-                        await websocket.send_text(json.dumps(encrypted_response))
+                        # Historial, monitores y ack siguen en el pipeline;
+                        # sólo se espera aquí si la etapa history está llena
+                        await history_stage.put((session, message_data.get("id"), decrypted, len(data)))
+
+                    except ReplayError as e:
+                        # Frame capturado y reenviado: no se procesa ni entra al historial
+                        await websocket.send_text(json.dumps({
+                            "error": "Frame repetido",
+                            "details": str(e)
+                        }))
 
                     except Exception as e:
                         print(f"❌ Error descifrando de {username}: {e}")
@@ -1322,20 +2261,76 @@ async def websocket_endpoint(websocket: WebSocket, username: str):
                 print(f"{username}: {data}")
 
     except WebSocketDisconnect:
-        if username in active_connections:
-            del active_connections[username]
         print(f"❌ Cliente desconectado: {username}")
+    finally:
+        if session is not None:
+            if traffic_capture is not None:
+                traffic_capture.disconnect(session.conn_id)
+            connection_registry.unregister(session)
+            # Una sesión reemplazada no pasa por on_leave pero tampoco debe recibir deltas
+            presence.unsubscribe(session)
 
 
 @app.get("/messages/history")
-async def get_message_history(limit: int = 100):
-    """Endpoint para obtener el historial de mensajes"""
+async def get_message_history(limit: int = 100, username: Optional[str] = None,
+                              q: Optional[str] = None, since: Optional[datetime] = None,
+                              until: Optional[datetime] = None):
+    """
+    Endpoint para obtener el historial de mensajes
+
+    Sin filtros retorna los últimos limit mensajes. Con username, q (palabras
+    que deben aparecer todas), since o until usa los índices secundarios.
+    """
+    if username is None and not q and since is None and until is None:
+        messages = message_history.recent(limit)
+    else:
+        messages = history_index.query(
+            limit=min(max(limit, 0), 1000),
+            username=username,
+            text=q,
+            since_ms=to_timestamp_ms(since) if since else None,
+            until_ms=to_timestamp_ms(until) if until else None
+        )
     return {
-        "messages": message_history[-limit:],
-        "total": len(message_history)
+        "messages": messages,
+        "total": len(message_history),
+        "last_seq": message_history.last_seq
     }
 
 
+# Filas recorridas por la exportación entre dos cesiones del event loop
+EXPORT_SCAN_YIELD = 2000
+
+
+@app.get("/messages/export")
+async def export_message_history(format: str = "ndjson", username: Optional[str] = None,
+                                 since: Optional[datetime] = None, until: Optional[datetime] = None,
+                                 is_encrypted: Optional[bool] = None):
+    """Endpoint para exportar el historial en streaming (NDJSON o CSV)"""
+    if format not in MEDIA_TYPES:
+        return {"error": f"Formato no soportado: {format}. Usa ndjson o csv"}
+
+    # Fijar el final al inicio de la petición: lo que llegue después no se exporta
+    rows = filter_rows(
+        message_history.rows(message_history.first_seq, message_history.last_seq),
+        username=username,
+        since_ms=to_timestamp_ms(since) if since else None,
+        until_ms=to_timestamp_ms(until) if until else None,
+        is_encrypted=is_encrypted,
+        yield_every=EXPORT_SCAN_YIELD
+    )
+    # Los registros (con timestamp ISO) sólo se crean para las filas exportadas;
+    # los None de filter_rows pasan tal cual (stream_export cede el loop)
+    records = (None if row is None else message_history.to_dict(row) for row in rows)
+    filename = f"chat-history-{datetime.now().strftime('%Y%m%d-%H%M%S')}.{format}"
+
+    return StreamingResponse(
+        stream_export(records, format),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
 @app.post("/broadcast/{sender_username}")
 async def broadcast_message(sender_username: str, message: dict):
     """Endpoint para enviar mensajes a todos los clientes conectados"""
@@ -1347,32 +2342,195 @@ async def broadcast_message(sender_username: str, message: dict):
     # Mostrar en consola
     print(f"{sender_username}: {message_text}")
 
+    record = message_history.append(sender_username, message_text, True)
+    traffic_stats.record(sender_username, len(message_text))
+    if load_shedder.level == 0 or monitor_sampler.admit():
+        monitor_stage.offer(record)
+
     # Enviar a todos los clientes conectados excepto al remitente
-    disconnected_users = []
-    for username, websocket in active_connections.items():
+    disconnected_sessions = []
+    for username, session in connection_registry.items():
         if username != sender_username:
             try:
                 # Cifrar mensaje específicamente para cada usuario
                 encrypted_message = crypto_manager.encrypt_message(
                     f"{sender_username}: {message_text}"
                 )
-                await websocket.send_text(json.dumps(encrypted_message))
+                encrypted_message["seq"] = record["seq"]
+                await session.websocket.send_text(json.dumps(encrypted_message))
             except Exception as e:
                 print(f"❌ Error enviando mensaje cifrado a {username}: {e}")
-                disconnected_users.append(username)
+                disconnected_sessions.append(session)
 
     # Limpiar conexiones desconectadas
-    for user in disconnected_users:
-        if user in active_connections:
-            del active_connections[user]
-        print(f"❌ Cliente desconectado (error): {user}")
+    for session in disconnected_sessions:
+        connection_registry.unregister(session)
+        print(f"❌ Cliente desconectado (error): {session.username}")
 
     return {
         "message": "Mensaje cifrado enviado a todos los clientes",
-        "recipients": len(active_connections) - (1 if sender_username in active_connections else 0)
+        "recipients": len(connection_registry) - (1 if sender_username in connection_registry else 0)
     }
 
 
+# Mensajes por frame broadcast_batch en /broadcast/{sender}/bulk
+BROADCAST_BATCH = int(os.environ.get("CHAT_BROADCAST_BATCH", 200))
+
+
+async def fan_out_batch(sender_username: str, records: List[dict], result: BulkResult):
+    """Cifra un lote una vez y envía el mismo frame a todos menos al remitente"""
+    encrypted = crypto_manager.encrypt_message(json.dumps(records))
+    frame = json.dumps({
+        "type": "broadcast_batch",
+        "from_seq": records[0]["seq"],
+        "to_seq": records[-1]["seq"],
+        "count": len(records),
+        **encrypted
+    })
+
+    disconnected_sessions = []
+    for username, session in connection_registry.items():
+        if username == sender_username:
+            continue
+        try:
+            await session.websocket.send_text(frame)
+            result.frames_sent += 1
+            result.recipients.add(username)
+        except Exception as e:
+            print(f"❌ Error enviando lote cifrado a {username}: {e}")
+            result.failed_deliveries += 1
+            disconnected_sessions.append(session)
+
+    for session in disconnected_sessions:
+        connection_registry.unregister(session)
+
+
+@app.post("/broadcast/{sender_username}/bulk")
+async def broadcast_bulk(sender_username: str, request: Request):
+    """
+    Envío masivo: array JSON o NDJSON (application/x-ndjson) en streaming
+
+    Cada lote de hasta CHAT_BROADCAST_BATCH mensajes entra al historial,
+    se cifra una vez y llega a cada destinatario en un único frame
+    broadcast_batch. Retorna el resultado agregado de toda la petición.
+    """
+    if is_ndjson(request.headers.get("content-type", "")):
+        items = iter_ndjson(request.stream())
+    else:
+        items = iter_array(await request.body())
+
+    result = BulkResult()
+    try:
+        async for texts in batches(items, BROADCAST_BATCH, result):
+            records = [message_history.append(sender_username, text, True) for text in texts]
+            for text in texts:
+                traffic_stats.record(sender_username, len(text))
+            for record in records:
+                if load_shedder.level == 0 or monitor_sampler.admit():
+                    monitor_stage.offer(record)
+            result.add_batch(records[0]["seq"], records[-1]["seq"], len(records))
+            await fan_out_batch(sender_username, records, result)
+    except BulkError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+
+    print(f"📢 {sender_username}: {result.accepted} mensajes en {result.batches} lotes")
+    return result.to_dict()
+
+
+@app.get("/files/{transfer_id}")
+async def download_file(transfer_id: str, username: str):
+    """Descarga en streaming de un archivo compartido (sólo destinatarios)"""
+    transfer = transfer_manager.get(transfer_id)
+    if transfer is None or not transfer.can_download(username):
+        return JSONResponse({"error": "Archivo no disponible"}, status_code=404)
+
+    return StreamingResponse(
+        transfer_manager.stream(transfer),
+        media_type="application/octet-stream",
+        headers={
+            "Content-Length": str(transfer.size),
+            "Content-Disposition": f"attachment; filename*=UTF-8''{quote(transfer.name)}",
+        }
+    )
+
+
+@app.get("/presence")
+async def get_presence():
+    """Roster actual de usuarios en línea y estadísticas de envío"""
+    return {**presence.roster.snapshot(), "stats": presence.get_stats()}
+
+
+@app.get("/stats/traffic")
+async def get_traffic_stats():
+    """Endpoint con las estadísticas de tráfico de la ventana actual"""
+    return traffic_stats.snapshot(len(connection_registry))
+
+
+@app.get("/ratelimit/stats")
+async def get_rate_limit_stats():
+    """Endpoint para obtener los contadores del limitador de frames"""
+    return rate_limiter.get_stats()
+
+
+@app.get("/admin/load")
+async def get_load_status():
+    """Lag del event loop, nivel de degradación y su efecto"""
+    return {
+        **load_shedder.get_stats(),
+        "monitor_events_dropped": monitor_sampler.dropped_total,
+        "index": {"paused": history_index.paused, "lag": history_index.lag},
+    }
+
+
+@app.get("/admin/pipeline")
+async def get_pipeline_status():
+    """Profundidad y rendimiento de cada etapa del pipeline de mensajes"""
+    return {stage.name: stage.get_stats() for stage in pipeline_stages}
+
+
+@app.get("/admin/capture")
+async def get_capture_status():
+    """Estado de la captura de tráfico (CHAT_CAPTURE_PATH)"""
+    if traffic_capture is None:
+        return {"enabled": False}
+    return {"enabled": True, **traffic_capture.get_stats()}
+
+
+@app.post("/admin/profile")
+async def profile_server(seconds: float = 10, interval_ms: float = 5, format: str = "json",
+                         x_admin_token: Optional[str] = Header(None)):
+    """
+    Perfila el event loop durante `seconds` segundos
+
+    Retorna pilas en formato collapsed (format=collapsed para texto plano,
+    listo para flamegraph.pl o speedscope), los callbacks más lentos y el
+    estado de las tareas asyncio. Sólo se permite un perfilado a la vez y
+    sólo con CHAT_ADMIN_TOKEN configurado (perfilar ralentiza el proceso).
+    """
+    if not ADMIN_TOKEN:
+        return JSONResponse({"error": "Perfilado deshabilitado: configura CHAT_ADMIN_TOKEN"},
+                            status_code=403)
+    if not secrets.compare_digest(x_admin_token or "", ADMIN_TOKEN):
+        return JSONResponse({"error": "Token de administración inválido"}, status_code=403)
+
+    import profiler  # Se carga en el primer uso: sin coste mientras no se perfila
+
+    try:
+        result = await profiler.profile(seconds, interval=interval_ms / 1000)
+    except profiler.ProfilerBusy as e:
+        return JSONResponse({"error": str(e)}, status_code=409)
+
+    if format == "collapsed":
+        return PlainTextResponse("\n".join(result["collapsed"]) + "\n")
+    return result
+
+
+@app.get("/admin/jobs")
+async def get_background_jobs():
+    """Endpoint para obtener las estadísticas de las tareas en background"""
+    return supervisor.get_stats()
+
+
 @app.get("/crypto/keys")
 async def get_crypto_keys():
     """Endpoint para obtener información de las claves de cifrado"""
@@ -1381,11 +2539,15 @@ async def get_crypto_keys():
 
 @app.post("/crypto/rotate")
 async def rotate_crypto_key():
-    """Endpoint para forzar la rotación de claves"""
-    crypto_manager._generate_new_key()
+    """Endpoint para forzar la rotación de claves (se anuncia ya y se activa tras announce_lead)"""
+    announced = crypto_manager.next_key_id is None
+    frame = key_announce_frame()
+    if announced:
+        await send_to_clients(frame)
     return {
-        "message": "Clave rotada manualmente",
-        "new_key_id": crypto_manager.current_key_id
+        "message": "Rotación de clave anunciada" if announced else "Ya había una rotación en curso",
+        "new_key_id": crypto_manager.next_key_id,
+        "activate_at": crypto_manager.activate_at
     }
 
 
@@ -1419,44 +2581,6 @@ async def test_encryption():
 
 
 if __name__ == "__main__":
-    import socket
-    import os
-
-    hostname = socket.gethostname()
-    local_ip = socket.gethostbyname(hostname)
-
-    use_ssl = os.path.exists("cert.pem") and os.path.exists("key.pem")
-    protocol = "https" if use_ssl else "http"
-
-    print("🚀 Iniciando servidor FastAPI con WebSockets y Cifrado...")
-
-    if use_ssl:
-        print(f"📍 Acceso local: https://localhost:8000")
-        print(f"🌐 Acceso en red: https://{local_ip}:8000")
-        print("🔒 SSL/TLS habilitado - Cifrado completamente funcional")
-        print("⚠️  Los navegadores mostrarán advertencia de certificado (es normal)")
-        print("\n🔗 Endpoints:")
-        print(f"   Cliente: https://localhost:8000/imAClient/{{username}}")
-        print(f"   Monitor: https://localhost:8000/monitor")
-        print(f"   Testing: https://localhost:8000/test/crypto-client")
-
-        uvicorn.run(
-            app,
-            host="0.0.0.0",
-            port=8000,
-            ssl_keyfile="key.pem",
-            ssl_certfile="cert.pem"
-        )
-    else:
-        print(f"📍 Acceso local: http://localhost:8000")
-        print(f"🌐 Acceso en red: http://{local_ip}:8000")
-        print("⚠️  IMPORTANTE: El cifrado solo funciona en:")
-        print("   - http://localhost:8000 (Web Crypto disponible)")
-        print("   - https://... (Web Crypto disponible)")
-        print(f"   - http://{local_ip}:8000 NO tendrá cifrado funcional")
-        print("\n🔗 Endpoints:")
-        print(f"   Cliente: http://localhost:8000/imAClient/{{username}}")
-        print(f"   Monitor: http://localhost:8000/monitor")
-        print(f"   Testing: http://localhost:8000/test/crypto-client")
-
-        uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    # Configuración por CLI/entorno: ver launcher.py
+    from launcher import main
+    main()
@@ -0,0 +1,219 @@
+"""
+Transferencia de archivos por chunks cifrados sobre el WebSocket del chat
+
+Protocolo (cliente -> servidor):
+    file_offer    {name, size, chunk_size, recipients?, transfer_id?}
+                  (con transfer_id reanuda una subida interrumpida)
+    file_chunk    {transfer_id, index, encrypted, nonce, key_id}
+                  AES-GCM por chunk con AAD "transfer_id:index", de modo que
+                  un chunk no se puede mover a otra posición ni a otra subida
+    file_complete {transfer_id}
+
+Servidor -> cliente: file_accept {transfer_id, next_index, window, ...},
+file_ack {transfer_id, index, received} y file_available para los destinatarios.
+
+Cada chunk se descifra y se escribe directamente en su offset del archivo
+de spool, y como máximo `window` chunks pueden estar sin confirmar, así que
+la memoria no depende del tamaño del archivo.
+"""
+import asyncio
+import os
+import secrets
+import time
+from typing import AsyncIterator, Dict, List, Optional, Set
+
+
+class TransferError(ValueError):
+    """Error de protocolo en una transferencia"""
+
+
+class Transfer:
+    __slots__ = ('transfer_id', 'owner', 'name', 'size', 'chunk_size', 'total_chunks',
+                 'recipients', 'contiguous', 'pending', 'fd', 'complete', 'updated_at')
+
+    def __init__(self, transfer_id: str, owner: str, name: str, size: int, chunk_size: int,
+                 recipients: Optional[List[str]]):
+        self.transfer_id = transfer_id
+        self.owner = owner
+        self.name = name
+        self.size = size
+        self.chunk_size = chunk_size
+        self.total_chunks = max(1, -(-size // chunk_size))
+        self.recipients = recipients
+        self.contiguous = 0           # chunks 0..contiguous-1 ya escritos
+        self.pending: Set[int] = set()  # chunks escritos por delante de contiguous (< window)
+        self.fd: Optional[int] = None
+        self.complete = False
+        self.updated_at = time.time()
+
+    @property
+    def received(self) -> int:
+        return self.contiguous + len(self.pending)
+
+    def can_download(self, username: str) -> bool:
+        return self.complete and (
+            self.recipients is None or username == self.owner or username in self.recipients
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "transfer_id": self.transfer_id,
+            "name": self.name,
+            "size": self.size,
+            "from": self.owner,
+            "url": f"/files/{self.transfer_id}",
+        }
+
+
+class TransferManager:
+    def __init__(self, spool_dir: str, max_file_size: int = 100 * 1024 * 1024,
+                 max_chunk_size: int = 64 * 1024, window: int = 8,
+                 upload_ttl: float = 3600, file_ttl: float = 24 * 3600):
+        """
+        Gestor de subidas y descargas por chunks
+
+        Args:
+            spool_dir: Directorio donde se escriben los archivos recibidos
+            max_file_size: Tamaño máximo aceptado por archivo
+            max_chunk_size: Tamaño máximo de chunk (texto plano)
+            window: Chunks en vuelo sin confirmar permitidos por subida
+            upload_ttl: Segundos que se guarda una subida incompleta para reanudarla
+            file_ttl: Segundos que un archivo completo queda disponible
+        """
+        self.spool_dir = spool_dir
+        self.max_file_size = max_file_size
+        self.max_chunk_size = max_chunk_size
+        self.window = window
+        self.upload_ttl = upload_ttl
+        self.file_ttl = file_ttl
+        self._transfers: Dict[str, Transfer] = {}
+        os.makedirs(spool_dir, exist_ok=True)
+
+    def _path(self, transfer: Transfer) -> str:
+        suffix = "" if transfer.complete else ".part"
+        return os.path.join(self.spool_dir, transfer.transfer_id + suffix)
+
+    def get(self, transfer_id: str) -> Optional[Transfer]:
+        return self._transfers.get(transfer_id)
+
+    def offer(self, owner: str, data: dict) -> Transfer:
+        """Crea una subida o retoma la indicada en data['transfer_id']"""
+        transfer_id = data.get("transfer_id")
+        if transfer_id:
+            transfer = self._transfers.get(transfer_id)
+            if transfer is None or transfer.owner != owner or transfer.complete:
+                raise TransferError("Transferencia no encontrada para reanudar")
+            # Los chunks por delante de contiguous se vuelven a pedir
+            transfer.pending.clear()
+            transfer.updated_at = time.time()
+            return transfer
+
+        size = int(data.get("size", -1))
+        chunk_size = int(data.get("chunk_size", self.max_chunk_size))
+        if not 0 <= size <= self.max_file_size:
+            raise TransferError(f"Tamaño no permitido (máximo {self.max_file_size} bytes)")
+        if not 0 < chunk_size <= self.max_chunk_size:
+            raise TransferError(f"chunk_size debe estar entre 1 y {self.max_chunk_size}")
+
+        recipients = data.get("recipients")
+        if recipients is not None:
+            recipients = [str(r) for r in recipients]
+        name = os.path.basename(str(data.get("name") or "archivo"))[:255]
+
+        transfer = Transfer(secrets.token_hex(12), owner, name, size, chunk_size, recipients)
+        self._transfers[transfer.transfer_id] = transfer
+        return transfer
+
+    def accept_frame(self, transfer: Transfer) -> dict:
+        return {
+            "type": "file_accept",
+            "transfer_id": transfer.transfer_id,
+            "chunk_size": transfer.chunk_size,
+            "total_chunks": transfer.total_chunks,
+            "next_index": transfer.contiguous,
+            "window": self.window,
+        }
+
+    def check_chunk(self, owner: str, transfer_id: str, index: int) -> Transfer:
+        """Valida un chunk antes de descifrarlo (ventana y pertenencia)"""
+        transfer = self._transfers.get(transfer_id)
+        if transfer is None or transfer.owner != owner or transfer.complete:
+            raise TransferError("Transferencia desconocida")
+        if not 0 <= index < transfer.total_chunks:
+            raise TransferError(f"Chunk {index} fuera de rango")
+        if index >= transfer.contiguous + self.window:
+            raise TransferError(f"Chunk {index} fuera de la ventana")
+        return transfer
+
+    async def write_chunk(self, transfer: Transfer, index: int, chunk: bytes):
+        """Escribe un chunk ya descifrado en su posición del archivo"""
+        expected = min(transfer.chunk_size, transfer.size - index * transfer.chunk_size)
+        if len(chunk) != max(expected, 0):
+            raise TransferError(f"Chunk {index} con tamaño incorrecto")
+
+        if index < transfer.contiguous or index in transfer.pending:
+            return  # Duplicado (reenvío tras reanudar): ya está escrito
+
+        if transfer.fd is None:
+            transfer.fd = os.open(self._path(transfer), os.O_WRONLY | os.O_CREAT, 0o600)
+        await asyncio.to_thread(os.pwrite, transfer.fd, chunk, index * transfer.chunk_size)
+
+        transfer.pending.add(index)
+        while transfer.contiguous in transfer.pending:
+            transfer.pending.remove(transfer.contiguous)
+            transfer.contiguous += 1
+        transfer.updated_at = time.time()
+
+    def complete(self, owner: str, transfer_id: str) -> Transfer:
+        """Cierra una subida con todos sus chunks y la deja disponible"""
+        transfer = self._transfers.get(transfer_id)
+        if transfer is None or transfer.owner != owner:
+            raise TransferError("Transferencia desconocida")
+        if transfer.size and transfer.contiguous < transfer.total_chunks:
+            raise TransferError(f"Faltan chunks: {transfer.contiguous}/{transfer.total_chunks}")
+
+        part_path = self._path(transfer)
+        if transfer.fd is not None:
+            os.close(transfer.fd)
+            transfer.fd = None
+        elif not os.path.exists(part_path):
+            open(part_path, "wb").close()  # Archivo vacío
+
+        transfer.complete = True
+        os.replace(part_path, self._path(transfer))
+        transfer.updated_at = time.time()
+        return transfer
+
+    async def stream(self, transfer: Transfer, block_size: int = 64 * 1024) -> AsyncIterator[bytes]:
+        """Lee el archivo en bloques para una descarga en streaming"""
+        with open(self._path(transfer), "rb") as f:
+            while True:
+                block = await asyncio.to_thread(f.read, block_size)
+                if not block:
+                    break
+                yield block
+
+    def cleanup(self) -> int:
+        """Elimina subidas abandonadas y archivos caducados. Retorna cuántos eliminó"""
+        now = time.time()
+        expired = [
+            transfer for transfer in self._transfers.values()
+            if now - transfer.updated_at > (self.file_ttl if transfer.complete else self.upload_ttl)
+        ]
+        for transfer in expired:
+            if transfer.fd is not None:
+                os.close(transfer.fd)
+            try:
+                os.remove(self._path(transfer))
+            except FileNotFoundError:
+                pass
+            del self._transfers[transfer.transfer_id]
+        return len(expired)
+
+    def get_stats(self) -> dict:
+        uploading = [t for t in self._transfers.values() if not t.complete]
+        return {
+            "uploading": len(uploading),
+            "available": len(self._transfers) - len(uploading),
+            "bytes_in_flight_max": self.window * self.max_chunk_size,
+        }
@@ -1,45 +1,114 @@
+"""
+Generador de certificados autofirmados para el servidor HTTPS/WSS
+
+Uso:
+    python generate_cert.py                          # ECDSA P-256, localhost
+    python generate_cert.py --key-type rsa4096       # como antes
+    python generate_cert.py --san 192.168.1.20 --san chat.local --days 30
+"""
 from cryptography import x509
 from cryptography.x509.oid import NameOID
 from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
 from cryptography.hazmat.primitives import serialization
+import argparse
 import datetime
+import ipaddress
+import os
+
+KEY_TYPES = ("p256", "ed25519", "rsa2048", "rsa4096")
+
+
+def generate_private_key(key_type: str):
+    """Genera la clave privada del tipo indicado"""
+    if key_type == "p256":
+        return ec.generate_private_key(ec.SECP256R1())
+    if key_type == "ed25519":
+        return ed25519.Ed25519PrivateKey.generate()
+    if key_type in ("rsa2048", "rsa4096"):
+        return rsa.generate_private_key(public_exponent=65537, key_size=int(key_type[3:]))
+    raise ValueError(f"Tipo de clave no soportado: {key_type}")
+
+
+def parse_san(entry: str) -> x509.GeneralName:
+    """Convierte una entrada SAN en IP o nombre DNS"""
+    try:
+        return x509.IPAddress(ipaddress.ip_address(entry))
+    except ValueError:
+        return x509.DNSName(entry)
+
+
+def build_certificate(private_key, common_name: str, sans: list, days: int) -> x509.Certificate:
+    """Crea un certificado autofirmado para private_key"""
+    subject = issuer = x509.Name([
+        x509.NameAttribute(NameOID.COMMON_NAME, common_name),
+    ])
+    now = datetime.datetime.now(datetime.timezone.utc)
+
+    builder = x509.CertificateBuilder().subject_name(
+        subject
+    ).issuer_name(
+        issuer
+    ).public_key(
+        private_key.public_key()
+    ).serial_number(
+        x509.random_serial_number()
+    ).not_valid_before(
+        now - datetime.timedelta(minutes=5)
+    ).not_valid_after(
+        now + datetime.timedelta(days=days)
+    ).add_extension(
+        x509.SubjectAlternativeName([parse_san(entry) for entry in sans]),
+        critical=False
+    )
+
+    # Ed25519 firma sin función hash externa
+    algorithm = None if isinstance(private_key, ed25519.Ed25519PrivateKey) else hashes.SHA256()
+    return builder.sign(private_key, algorithm)
+
+
+def write_pem_files(private_key, cert: x509.Certificate, cert_path: str, key_path: str):
+    """Guarda el certificado y la clave privada en PEM"""
+    # Crear con 0600 (nunca legible por otros, ni durante la escritura) y
+    # corregir los permisos si ya existía una clave anterior
+    fd = os.open(key_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    os.chmod(key_path, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(private_key.private_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PrivateFormat.PKCS8,
+            encryption_algorithm=serialization.NoEncryption()
+        ))
+
+    with open(cert_path, "wb") as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+
+
+def generate(key_type: str = "p256", common_name: str = "localhost", sans: list = None,
+             days: int = 365, cert_path: str = "cert.pem", key_path: str = "key.pem"):
+    """Genera y guarda un par certificado/clave"""
+    if sans is None:
+        sans = ["localhost", "127.0.0.1"]
+    private_key = generate_private_key(key_type)
+    cert = build_certificate(private_key, common_name, sans, days)
+    write_pem_files(private_key, cert, cert_path, key_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera un certificado autofirmado (funciona sin red)")
+    parser.add_argument("--key-type", choices=KEY_TYPES, default="p256",
+                        help="Tipo de clave (default: p256, handshakes mucho más baratos que RSA-4096)")
+    parser.add_argument("--cn", default="localhost", help="Common Name del certificado")
+    parser.add_argument("--san", action="append",
+                        help="Nombre DNS o IP alternativa; repetible (default: localhost y 127.0.0.1)")
+    parser.add_argument("--days", type=int, default=365, help="Días de validez")
+    parser.add_argument("--cert", default="cert.pem", help="Ruta del certificado")
+    parser.add_argument("--key", default="key.pem", help="Ruta de la clave privada")
+    args = parser.parse_args()
+
+    generate(args.key_type, args.cn, args.san, args.days, args.cert, args.key)
+    print(f"✅ Certificados generados: {args.cert} y {args.key} ({args.key_type}, {args.days} días)")
+
 
-# Generar clave privada
-private_key = rsa.generate_private_key(
-    public_exponent=65537,
-    key_size=4096,
-)
-
-# Crear certificado
-subject = issuer = x509.Name([
-    x509.NameAttribute(NameOID.COMMON_NAME, u"localhost"),
-])
-
-cert = x509.CertificateBuilder().subject_name(
-    subject
-).issuer_name(
-    issuer
-).public_key(
-    private_key.public_key()
-).serial_number(
-    x509.random_serial_number()
-).not_valid_before(
-    datetime.datetime.utcnow()
-).not_valid_after(
-    datetime.datetime.utcnow() + datetime.timedelta(days=365)
-).sign(private_key, hashes.SHA256())
-
-# Guardar clave privada
-with open("key.pem", "wb") as f:
-    f.write(private_key.private_bytes(
-        encoding=serialization.Encoding.PEM,
-        format=serialization.PrivateFormat.TraditionalOpenSSL,
-        encryption_algorithm=serialization.NoEncryption()
-    ))
-
-# Guardar certificado
-with open("cert.pem", "wb") as f:
-    f.write(cert.public_bytes(serialization.Encoding.PEM))
-
-print("✅ Certificados generados: cert.pem y key.pem")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Heartbeat a nivel de aplicación y expulsión de sesiones inactivas
+Un único heap de vencimientos por registro (no una tarea por conexión)
+"""
+import heapq
+import time
+from typing import Awaitable, Callable, List, Tuple
+
+from sessions import ClientSession, ConnectionRegistry
+
+
+class HeartbeatScheduler:
+    def __init__(self, registry: ConnectionRegistry,
+                 on_ping: Callable[[List[ClientSession]], Awaitable[None]],
+                 on_evict: Callable[[List[ClientSession]], Awaitable[None]],
+                 ping_interval: float = 25, idle_timeout: float = 90):
+        """
+        Planificador de pings y expulsiones sobre un registro de sesiones
+
+        Args:
+            registry: Registro cuyas sesiones se vigilan
+            on_ping: Corrutina que recibe el lote de sesiones a las que hacer ping
+            on_evict: Corrutina que recibe el lote de sesiones expulsadas
+            ping_interval: Segundos de silencio antes de enviar un ping
+            idle_timeout: Segundos de silencio antes de expulsar la sesión
+        """
+        self.registry = registry
+        self.on_ping = on_ping
+        self.on_evict = on_evict
+        self.ping_interval = ping_interval
+        self.idle_timeout = idle_timeout
+        # Heap de (vencimiento, conn_id). Las entradas de sesiones que ya no
+        # están registradas se descartan al salir del heap (borrado perezoso)
+        self._heap: List[Tuple[float, int]] = []
+        self.pings_sent = 0
+        self.evicted = 0
+
+    def watch(self, session: ClientSession):
+        """Empieza a vigilar una sesión recién registrada"""
+        heapq.heappush(self._heap, (session.last_seen + self.ping_interval, session.conn_id))
+
+    def collect_due(self, now: float = None) -> Tuple[List[ClientSession], List[ClientSession]]:
+        """
+        Saca del heap todas las sesiones vencidas
+
+        Returns:
+            (sesiones a las que hacer ping, sesiones a expulsar)
+        """
+        if now is None:
+            now = time.monotonic()
+
+        to_ping = []
+        to_evict = []
+        heap = self._heap
+
+        while heap and heap[0][0] <= now:
+            _, conn_id = heapq.heappop(heap)
+            session = self.registry.get_by_conn_id(conn_id)
+            if session is None:
+                continue
+
+            idle = now - session.last_seen
+            if idle >= self.idle_timeout:
+                to_evict.append(session)
+            elif idle >= self.ping_interval:
+                to_ping.append(session)
+                heapq.heappush(heap, (session.last_seen + self.idle_timeout, conn_id))
+            else:
+                # Hubo actividad desde que se programó: reprogramar
+                heapq.heappush(heap, (session.last_seen + self.ping_interval, conn_id))
+
+        return to_ping, to_evict
+
+    async def tick(self):
+        """Procesa los vencimientos pendientes (pings y expulsiones en lote)"""
+        to_ping, to_evict = self.collect_due()
+
+        for session in to_evict:
+            self.registry.unregister(session)
+
+        if to_ping:
+            self.pings_sent += len(to_ping)
+            await self.on_ping(to_ping)
+        if to_evict:
+            self.evicted += len(to_evict)
+            await self.on_evict(to_evict)
+
+    def get_stats(self) -> dict:
+        return {
+            'watched': len(self.registry),
+            'scheduled': len(self._heap),
+            'pings_sent': self.pings_sent,
+            'evicted': self.evicted,
+            'ping_interval': self.ping_interval,
+            'idle_timeout': self.idle_timeout,
+        }
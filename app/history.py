@@ -0,0 +1,190 @@
+"""
+Historial de mensajes con números de secuencia del servidor
+Los seq son consecutivos, así que cualquier registro se localiza en O(1)
+
+Almacenamiento por columnas: id de usuario (array 'I', los usernames se
+guardan una sola vez), timestamp en epoch ms (array 'q') y flags
+empaquetados (bytearray). Sólo el texto del mensaje es un objeto por
+registro. Los dicts con timestamp ISO 8601 se crean al serializar.
+
+Los listeners (p. ej. los índices secundarios) reciben on_append(row) por
+cada mensaje y on_evict(rows) con las filas que se descartan justo antes
+de recortarlas. Una fila es la tupla (seq, username, message,
+timestamp_ms, is_encrypted).
+"""
+import time
+from array import array
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+
+FLAG_ENCRYPTED = 0x01
+
+
+def format_timestamp(timestamp_ms: int) -> str:
+    """epoch ms -> ISO 8601 en hora local (el formato de datetime.now().isoformat())"""
+    return datetime.fromtimestamp(timestamp_ms / 1000).isoformat()
+
+
+def to_timestamp_ms(value: datetime) -> int:
+    return int(value.timestamp() * 1000)
+
+
+class MessageHistory:
+    def __init__(self, max_records: int = 100_000):
+        """
+        Historial acotado de mensajes
+
+        Args:
+            max_records: Registros retenidos; los más antiguos se descartan
+                         en bloques para que el recorte sea O(1) amortizado
+        """
+        self.max_records = max_records
+        self._user_ids = array('I')
+        self._messages: List[str] = []
+        self._timestamps = array('q')
+        self._flags = bytearray()
+        # Los usernames se internan una vez y no se liberan al recortar:
+        # su número está acotado por los usuarios distintos, no por los mensajes
+        self._usernames: List[str] = []        # id -> username
+        self._user_lookup: Dict[str, int] = {}  # username -> id
+        self._first_seq = 1  # seq de la posición 0 de las columnas
+        self._next_seq = 1
+        self._listeners: list = []
+
+    def add_listener(self, listener):
+        """Registra un objeto con on_append(row) y on_evict(rows)"""
+        self._listeners.append(listener)
+
+    @property
+    def first_seq(self) -> int:
+        """seq del registro más antiguo retenido"""
+        return self._first_seq
+
+    @property
+    def last_seq(self) -> int:
+        """seq del último registro (0 si aún no hay mensajes)"""
+        return self._next_seq - 1
+
+    def _user_id(self, username: str) -> int:
+        user_id = self._user_lookup.get(username)
+        if user_id is None:
+            user_id = self._user_lookup[username] = len(self._usernames)
+            self._usernames.append(username)
+        return user_id
+
+    def _row(self, i: int) -> tuple:
+        return (
+            self._first_seq + i,
+            self._usernames[self._user_ids[i]],
+            self._messages[i],
+            self._timestamps[i],
+            bool(self._flags[i] & FLAG_ENCRYPTED),
+        )
+
+    @staticmethod
+    def to_dict(row: tuple) -> dict:
+        """Fila -> registro serializable (el formato de la API)"""
+        seq, username, message, timestamp_ms, is_encrypted = row
+        return {
+            "seq": seq,
+            "username": username,
+            "message": message,
+            "timestamp": format_timestamp(timestamp_ms),
+            "is_encrypted": is_encrypted
+        }
+
+    def append(self, username: str, message: str, is_encrypted: bool,
+               timestamp_ms: Optional[int] = None) -> dict:
+        """Añade un mensaje, le asigna el siguiente seq y retorna su registro"""
+        if timestamp_ms is None:
+            timestamp_ms = int(time.time() * 1000)
+
+        self._user_ids.append(self._user_id(username))
+        self._messages.append(message)
+        self._timestamps.append(timestamp_ms)
+        self._flags.append(FLAG_ENCRYPTED if is_encrypted else 0)
+        row = (self._next_seq, username, message, timestamp_ms, is_encrypted)
+        self._next_seq += 1
+
+        for listener in self._listeners:
+            listener.on_append(row)
+
+        # Recortar en bloques del 10% para no mover las columnas en cada append
+        if len(self._messages) > self.max_records + self.max_records // 10:
+            excess = len(self._messages) - self.max_records
+            if self._listeners:
+                evicted = [self._row(i) for i in range(excess)]
+                for listener in self._listeners:
+                    listener.on_evict(evicted)
+            del self._user_ids[:excess]
+            del self._messages[:excess]
+            del self._timestamps[:excess]
+            del self._flags[:excess]
+            self._first_seq += excess
+
+        return self.to_dict(row)
+
+    def row(self, seq: int) -> Optional[tuple]:
+        """Fila sin materializar (sin crear el timestamp ISO)"""
+        if self._first_seq <= seq <= self.last_seq:
+            return self._row(seq - self._first_seq)
+        return None
+
+    def get(self, seq: int) -> Optional[dict]:
+        row = self.row(seq)
+        return self.to_dict(row) if row is not None else None
+
+    def recent(self, limit: int) -> List[dict]:
+        """Últimos limit registros"""
+        if limit <= 0:
+            return []
+        start = max(0, len(self._messages) - limit)
+        return [self.to_dict(self._row(i)) for i in range(start, len(self._messages))]
+
+    def rows(self, start_seq: int, end_seq: int) -> Iterator[tuple]:
+        """
+        Itera las filas retenidas con start_seq <= seq <= end_seq
+
+        Es seguro intercalar appends entre yields: el índice se recalcula en
+        cada paso y los registros recortados mientras tanto se saltan.
+        """
+        seq = max(start_seq, self._first_seq)
+        while seq <= end_seq and seq <= self.last_seq:
+            if seq < self._first_seq:
+                seq = self._first_seq
+                continue
+            yield self._row(seq - self._first_seq)
+            seq += 1
+
+    def range(self, start_seq: int, end_seq: int) -> Iterator[dict]:
+        """Como rows() pero con registros serializables"""
+        for row in self.rows(start_seq, end_seq):
+            yield self.to_dict(row)
+
+    def since(self, last_seen_seq: int, max_gap: int) -> Optional[List[dict]]:
+        """
+        Registros posteriores a last_seen_seq
+
+        Returns:
+            Lista de registros (posiblemente vacía), o None si el hueco es
+            mayor que max_gap, ya no está retenido o last_seen_seq es de un
+            historial anterior (mayor que last_seq tras reiniciar el servidor)
+        """
+        if last_seen_seq == self.last_seq:
+            return []
+        if last_seen_seq > self.last_seq:
+            return None
+        if last_seen_seq + 1 < self._first_seq or self.last_seq - last_seen_seq > max_gap:
+            return None
+        return list(self.range(last_seen_seq + 1, self.last_seq))
+
+    def get_stats(self) -> dict:
+        return {
+            "records": len(self._messages),
+            "first_seq": self._first_seq,
+            "last_seq": self.last_seq,
+            "interned_users": len(self._usernames),
+        }
+
+    def __len__(self) -> int:
+        return len(self._messages)
@@ -0,0 +1,107 @@
+"""
+Exportación en streaming del historial (NDJSON o CSV)
+Trabaja sobre cualquier iterable de registros del historial, ya sea el
+MessageHistory en memoria o el cursor de un backend persistente que
+produzca los mismos dicts, así que la memoria usada no depende del tamaño
+de la exportación.
+
+Los filtros muy selectivos pueden recorrer miles de filas sin exportar
+ninguna; filter_rows(..., yield_every=N) intercala entonces un None cada N
+filas recorridas y stream_export cede el event loop al encontrarlo.
+
+El filtrado se hace sobre filas (seq, username, message, timestamp_ms,
+is_encrypted) para no crear el dict ni el timestamp ISO de los registros
+descartados.
+"""
+import asyncio
+import csv
+import io
+import json
+from typing import AsyncIterator, Iterable, Iterator, Optional
+
+EXPORT_FIELDS = ("seq", "username", "message", "timestamp", "is_encrypted")
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def filter_rows(rows: Iterable[tuple], username: Optional[str] = None,
+                since_ms: Optional[int] = None, until_ms: Optional[int] = None,
+                is_encrypted: Optional[bool] = None,
+                yield_every: Optional[int] = None) -> Iterator[Optional[tuple]]:
+    """
+    Filtra filas del historial en el servidor
+
+    Args:
+        username: Sólo mensajes de este usuario
+        since_ms / until_ms: Límites inclusivos en epoch ms
+        is_encrypted: Sólo mensajes con este valor del flag
+        yield_every: Si se indica, produce None cada yield_every filas
+            recorridas (punto en el que stream_export cede el event loop)
+    """
+    scanned = 0
+    for row in rows:
+        if yield_every is not None:
+            scanned += 1
+            if scanned >= yield_every:
+                scanned = 0
+                yield None
+        _, row_username, _, timestamp_ms, row_encrypted = row
+        if username is not None and row_username != username:
+            continue
+        if since_ms is not None and timestamp_ms < since_ms:
+            continue
+        if until_ms is not None and timestamp_ms > until_ms:
+            continue
+        if is_encrypted is not None and row_encrypted != is_encrypted:
+            continue
+        yield row
+
+
+def _ndjson_lines(records: Iterable[Optional[dict]]) -> Iterator[Optional[str]]:
+    for record in records:
+        if record is None:
+            yield None
+            continue
+        yield json.dumps({field: record[field] for field in EXPORT_FIELDS}, ensure_ascii=False) + "\n"
+
+
+def _csv_lines(records: Iterable[Optional[dict]]) -> Iterator[Optional[str]]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    for record in records:
+        if record is None:
+            yield None
+            continue
+        writer.writerow([record[field] for field in EXPORT_FIELDS])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+async def stream_export(records: Iterable[Optional[dict]], fmt: str = "ndjson",
+                        chunk_size: int = 500) -> AsyncIterator[str]:
+    """
+    Genera la exportación en bloques de chunk_size registros
+
+    Entre bloques, y en cada None de records (ver filter_rows), se cede el
+    event loop para no bloquear otras conexiones.
+    """
+    lines = _csv_lines(records) if fmt == "csv" else _ndjson_lines(records)
+    chunk = []
+    for line in lines:
+        if line is None:
+            await asyncio.sleep(0)
+            continue
+        chunk.append(line)
+        if len(chunk) >= chunk_size:
+            yield "".join(chunk)
+            chunk = []
+            await asyncio.sleep(0)
+    if chunk:
+        yield "".join(chunk)
@@ -0,0 +1,201 @@
+"""
+Índices secundarios sobre el historial de mensajes
+Se mantienen incrementalmente como listener de MessageHistory:
+- por usuario: seqs de cada username
+- por minuto: primer seq de cada minuto (los seq crecen con el tiempo,
+  así que un minuto es un rango contiguo de seqs)
+- invertido: seqs de los mensajes que contienen cada token
+
+Las listas de seqs están ordenadas, de modo que el recorte del historial
+sólo quita elementos por la izquierda y una consulta de los N más
+recientes recorre la lista desde la derecha sin tocar el resto.
+
+La indexación se puede pausar (degradación por carga): los mensajes
+nuevos quedan sin indexar hasta que catch_up() los recorre en lotes.
+"""
+import bisect
+import re
+from collections import deque
+from typing import Dict, Iterator, List, Optional, Set
+
+from history import MessageHistory
+
+TOKEN_RE = re.compile(r"\w{2,}")
+MAX_TOKENS_PER_MESSAGE = 64
+
+
+def tokenize(text: str) -> Set[str]:
+    """Tokens en minúsculas (palabras de 2+ caracteres), sin repetir"""
+    tokens = set(TOKEN_RE.findall(text.lower()))
+    if len(tokens) > MAX_TOKENS_PER_MESSAGE:
+        # Acotar sin depender del orden de iteración del set
+        tokens = set(sorted(tokens)[:MAX_TOKENS_PER_MESSAGE])
+    return tokens
+
+
+class HistoryIndex:
+    def __init__(self, history: MessageHistory):
+        """Crea los índices y se registra como listener del historial"""
+        self.history = history
+        self._by_user: Dict[str, deque] = {}
+        self._by_token: Dict[str, deque] = {}
+        self._minutes: List[int] = []       # minutos desde epoch, en orden
+        self._minute_first: List[int] = []  # primer seq de cada minuto
+        self.indexed_seq = history.first_seq - 1  # último seq indexado
+        self.paused = False
+
+        for row in history.rows(history.first_seq, history.last_seq):
+            self._index(row)
+        history.add_listener(self)
+
+    # === Mantenimiento (llamado por MessageHistory) ===
+
+    @property
+    def lag(self) -> int:
+        """Mensajes del historial todavía sin indexar"""
+        return self.history.last_seq - self.indexed_seq
+
+    def on_append(self, row: tuple):
+        # Con retraso acumulado el orden se mantiene: lo indexa catch_up()
+        if not self.paused and row[0] == self.indexed_seq + 1:
+            self._index(row)
+
+    def pause(self):
+        self.paused = True
+
+    def resume(self):
+        self.paused = False
+
+    def catch_up(self, max_rows: int = 5000) -> int:
+        """Indexa hasta max_rows mensajes pendientes. Retorna cuántos indexó"""
+        if self.paused:
+            return 0
+        # Lo recortado sin llegar a indexarse ya no hace falta
+        self.indexed_seq = max(self.indexed_seq, self.history.first_seq - 1)
+        end = min(self.history.last_seq, self.indexed_seq + max_rows)
+        done = 0
+        for row in self.history.rows(self.indexed_seq + 1, end):
+            self._index(row)
+            done += 1
+        return done
+
+    def _index(self, row: tuple):
+        seq, username, message, timestamp_ms, _ = row
+        self.indexed_seq = seq
+
+        seqs = self._by_user.get(username)
+        if seqs is None:
+            seqs = self._by_user[username] = deque()
+        seqs.append(seq)
+
+        for token in tokenize(message):
+            seqs = self._by_token.get(token)
+            if seqs is None:
+                seqs = self._by_token[token] = deque()
+            seqs.append(seq)
+
+        # Un reloj que retrocede deja el registro en el minuto abierto
+        minute = timestamp_ms // 60_000
+        if not self._minutes or minute > self._minutes[-1]:
+            self._minutes.append(minute)
+            self._minute_first.append(seq)
+
+    def on_evict(self, rows: List[tuple]):
+        # Los registros descartados son los más antiguos: siempre a la izquierda
+        for seq, username, message, _, _ in rows:
+            if seq > self.indexed_seq:
+                break  # Nunca se indexaron
+            self._popleft(self._by_user, username)
+            for token in tokenize(message):
+                self._popleft(self._by_token, token)
+
+        first_seq = rows[-1][0] + 1
+        # Se conserva el minuto que contiene first_seq
+        drop = bisect.bisect_right(self._minute_first, first_seq) - 1
+        if drop > 0:
+            del self._minutes[:drop]
+            del self._minute_first[:drop]
+
+    @staticmethod
+    def _popleft(index: Dict[str, deque], key: str):
+        seqs = index.get(key)
+        if seqs:
+            seqs.popleft()
+            if not seqs:
+                del index[key]
+
+    # === Consultas ===
+
+    def _seq_bounds(self, since_ms: Optional[int], until_ms: Optional[int]) -> tuple:
+        """Rango de seqs que puede contener timestamps en [since_ms, until_ms]"""
+        low, high = self.history.first_seq, self.history.last_seq
+        if since_ms is not None:
+            i = bisect.bisect_left(self._minutes, since_ms // 60_000)
+            # Más allá del último minuto indexado sólo queda la cola sin indexar
+            low = self._minute_first[i] if i < len(self._minutes) else self.indexed_seq + 1
+        if until_ms is not None:
+            i = bisect.bisect_right(self._minutes, until_ms // 60_000)
+            if i < len(self._minutes):
+                high = self._minute_first[i] - 1
+        return max(low, self.history.first_seq), high
+
+    def _candidates(self, username: Optional[str], tokens: Set[str],
+                    low: int, high: int) -> Iterator[int]:
+        """seqs candidatos <= high de más reciente a más antiguo (el llamador corta en low)"""
+        lists = []
+        if username is not None:
+            lists.append(self._by_user.get(username, ()))
+        lists.extend(self._by_token.get(token, ()) for token in tokens)
+
+        if not lists:
+            return iter(range(high, low - 1, -1))
+        # La lista más corta es la más selectiva
+        return (seq for seq in reversed(min(lists, key=len)) if seq <= high)
+
+    def query(self, limit: int = 100, username: Optional[str] = None, text: Optional[str] = None,
+              since_ms: Optional[int] = None, until_ms: Optional[int] = None) -> List[dict]:
+        """
+        Últimos `limit` mensajes que cumplen todos los filtros, en orden cronológico
+
+        Args:
+            username: Sólo mensajes de este usuario
+            text: Palabras que deben aparecer todas en el mensaje
+            since_ms / until_ms: Límites inclusivos en epoch ms
+        """
+        tokens = tokenize(text) if text else set()
+        if text and not tokens:
+            return []
+        low, high = self._seq_bounds(since_ms, until_ms)
+
+        matches = []
+        for seq in self._candidates(username, tokens, low, high):
+            if seq < low:
+                break
+            row = self.history.row(seq)
+            if row is None:
+                continue
+            _, row_username, message, timestamp_ms, _ = row
+            if username is not None and row_username != username:
+                continue
+            if since_ms is not None and timestamp_ms < since_ms:
+                continue
+            if until_ms is not None and timestamp_ms > until_ms:
+                continue
+            if tokens and not tokens <= tokenize(message):
+                continue
+            matches.append(row)
+            if len(matches) >= limit:
+                break
+
+        matches.reverse()
+        return [self.history.to_dict(row) for row in matches]
+
+    def get_stats(self) -> dict:
+        return {
+            "users": len(self._by_user),
+            "tokens": len(self._by_token),
+            "minutes": len(self._minutes),
+            "postings": sum(len(seqs) for seqs in self._by_token.values()),
+            "paused": self.paused,
+            "lag": self.lag,
+        }
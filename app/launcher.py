@@ -0,0 +1,147 @@
+"""
+Lanzador del servidor de chat
+Configuración por línea de comandos o variables de entorno (CHAT_*);
+la línea de comandos tiene prioridad.
+
+Uso:
+    python launcher.py                               # igual que python chat.py
+    python launcher.py --workers 4 --port 8443
+    CHAT_UDS=/run/chat.sock python launcher.py       # detrás de un proxy
+"""
+import argparse
+import importlib.util
+import os
+import socket
+import sys
+
+APP_IMPORT = "chat:app"
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def env(name: str, default=None, cast=str):
+    value = os.environ.get(f"CHAT_{name}")
+    if value is None or value == "":
+        return default
+    return cast(value)
+
+
+def parse_bool(value: str) -> bool:
+    return value.lower() in ("1", "true", "yes", "on")
+
+
+def has_module(name: str) -> bool:
+    return importlib.util.find_spec(name) is not None
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Servidor FastAPI con WebSockets cifrados")
+    parser.add_argument("--host", default=env("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=env("PORT", 8000, int))
+    parser.add_argument("--uds", default=env("UDS"),
+                        help="Escuchar en un socket Unix en lugar de host:port")
+    parser.add_argument("--workers", type=int, default=env("WORKERS", 1, int),
+                        help="Procesos worker (el estado del chat NO se comparte entre ellos)")
+    parser.add_argument("--loop", choices=("auto", "uvloop", "asyncio"), default=env("LOOP", "auto"))
+    parser.add_argument("--http", choices=("auto", "httptools", "h11"), default=env("HTTP", "auto"))
+    parser.add_argument("--backlog", type=int, default=env("BACKLOG", 2048, int),
+                        help="Cola de conexiones pendientes del socket")
+    parser.add_argument("--ws-max-size", type=int, default=env("WS_MAX_SIZE", 1024 * 1024, int),
+                        help="Tamaño máximo de un frame WebSocket en bytes")
+    parser.add_argument("--ws-ping-interval", type=float, default=env("WS_PING_INTERVAL", 20.0, float))
+    parser.add_argument("--ws-ping-timeout", type=float, default=env("WS_PING_TIMEOUT", 20.0, float))
+    parser.add_argument("--ssl-certfile", default=env("SSL_CERTFILE", "cert.pem"))
+    parser.add_argument("--ssl-keyfile", default=env("SSL_KEYFILE", "key.pem"))
+    parser.add_argument("--no-ssl", action="store_true", default=env("NO_SSL", False, parse_bool),
+                        help="Servir HTTP aunque existan los certificados")
+    parser.add_argument("--log-level", default=env("LOG_LEVEL", "info"))
+    return parser
+
+
+def resolve(args: argparse.Namespace) -> dict:
+    """Calcula la configuración efectiva (resuelve 'auto' y el SSL)"""
+    loop = args.loop
+    if loop == "auto":
+        loop = "uvloop" if has_module("uvloop") and sys.platform != "win32" else "asyncio"
+    http = args.http
+    if http == "auto":
+        http = "httptools" if has_module("httptools") else "h11"
+
+    use_ssl = (not args.no_ssl
+               and os.path.exists(args.ssl_certfile) and os.path.exists(args.ssl_keyfile))
+
+    config = {
+        "loop": loop,
+        "http": http,
+        "ws": "websockets",
+        "workers": args.workers,
+        "backlog": args.backlog,
+        "ws_max_size": args.ws_max_size,
+        "ws_ping_interval": args.ws_ping_interval,
+        "ws_ping_timeout": args.ws_ping_timeout,
+        "log_level": args.log_level,
+    }
+    if args.uds:
+        config["uds"] = args.uds
+    else:
+        config["host"] = args.host
+        config["port"] = args.port
+    if use_ssl:
+        config["ssl_certfile"] = args.ssl_certfile
+        config["ssl_keyfile"] = args.ssl_keyfile
+    return config
+
+
+def print_report(config: dict):
+    """Muestra la configuración efectiva y las URLs de acceso"""
+    use_ssl = "ssl_certfile" in config
+    protocol = "https" if use_ssl else "http"
+
+    print("🚀 Iniciando servidor FastAPI con WebSockets y Cifrado...")
+    print("\n⚙️  Configuración efectiva:")
+    for key in sorted(config):
+        print(f"   {key:<17} {config[key]}")
+
+    if config["workers"] > 1:
+        print("⚠️  Con varios workers cada proceso tiene sus propias sesiones, historial y claves")
+
+    if "uds" in config:
+        print(f"\n🔌 Escuchando en socket Unix: {config['uds']}")
+        return
+
+    port = config["port"]
+    try:
+        local_ip = socket.gethostbyname(socket.gethostname())
+    except OSError:
+        local_ip = "127.0.0.1"
+
+    print(f"\n📍 Acceso local: {protocol}://localhost:{port}")
+    print(f"🌐 Acceso en red: {protocol}://{local_ip}:{port}")
+    if use_ssl:
+        print("🔒 SSL/TLS habilitado - Cifrado completamente funcional")
+        print("⚠️  Los navegadores mostrarán advertencia de certificado (es normal)")
+    else:
+        print("⚠️  IMPORTANTE: El cifrado solo funciona en:")
+        print(f"   - http://localhost:{port} (Web Crypto disponible)")
+        print("   - https://... (Web Crypto disponible)")
+        print(f"   - http://{local_ip}:{port} NO tendrá cifrado funcional")
+    print("\n🔗 Endpoints:")
+    print(f"   Cliente: {protocol}://localhost:{port}/imAClient/{{username}}")
+    print(f"   Monitor: {protocol}://localhost:{port}/monitor")
+    print(f"   Testing: {protocol}://localhost:{port}/test/crypto-client")
+
+
+def main(argv=None):
+    import uvicorn
+
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.workers > 1 and env("CAPTURE_PATH"):
+        # Cada worker truncaría el mismo archivo y numeraría sus conexiones desde 1
+        parser.error("CHAT_CAPTURE_PATH sólo admite --workers 1")
+    config = resolve(args)
+    print_report(config)
+    uvicorn.run(APP_IMPORT, app_dir=APP_DIR, **config)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Monitor de lag del event loop y política de degradación por niveles
+
+El lag se mide como el retraso con el que despierta un sleep periódico.
+Niveles:
+    0  normal
+    1  monitores: los eventos "message" se muestrean (1 de cada N) y el
+       resto se resume en un contador
+    2  además se pausa la indexación del historial (se pone al día al bajar)
+    3  además se rechazan conexiones nuevas a /ws con un frame retry-after
+
+Se sube de nivel en cuanto el lag suavizado supera el umbral; se baja de
+uno en uno tras `cooldown` segundos por debajo de la mitad del umbral
+inferior, para no oscilar.
+"""
+import asyncio
+import random
+import time
+from typing import Awaitable, Callable, Optional, Sequence
+
+LEVEL_NAMES = ("normal", "monitores muestreados", "indexación pausada", "rechazando conexiones")
+
+
+class LoadShedder:
+    def __init__(self, thresholds: Sequence[float] = (0.05, 0.2, 0.5), interval: float = 0.1,
+                 cooldown: float = 5.0, smoothing: float = 0.5,
+                 on_change: Optional[Callable[[int, int], Awaitable[None]]] = None):
+        """
+        Args:
+            thresholds: Lag (segundos) a partir del cual se entra en los niveles 1, 2 y 3
+            interval: Periodo del sleep de muestreo
+            cooldown: Segundos con lag bajo antes de bajar un nivel
+            smoothing: Peso de la muestra nueva en la media exponencial
+            on_change: Corrutina on_change(nivel_anterior, nivel_nuevo)
+        """
+        self.thresholds = tuple(thresholds)
+        self.interval = interval
+        self.cooldown = cooldown
+        self.smoothing = smoothing
+        self.on_change = on_change
+
+        self.level = 0
+        self.lag = 0.0           # última muestra
+        self.lag_smoothed = 0.0
+        self.lag_max = 0.0
+        self.samples = 0
+        self.level_changes = 0
+        self.rejected_connections = 0
+        self._calm_since: Optional[float] = None
+        self._level_since = time.monotonic()
+        self._time_in_level = [0.0] * (len(self.thresholds) + 1)
+
+    def sample(self, lag: float, now: Optional[float] = None) -> Optional[tuple]:
+        """
+        Registra una muestra de lag
+
+        Returns:
+            (nivel_anterior, nivel_nuevo) si cambió el nivel, None si no
+        """
+        now = time.monotonic() if now is None else now
+        self.samples += 1
+        self.lag = lag
+        self.lag_max = max(self.lag_max, lag)
+        self.lag_smoothed += self.smoothing * (lag - self.lag_smoothed)
+
+        target = sum(1 for threshold in self.thresholds if self.lag_smoothed >= threshold)
+        if target > self.level:
+            self._calm_since = None
+            return self._set_level(target, now)
+
+        if self.level and self.lag_smoothed < self.thresholds[self.level - 1] / 2:
+            if self._calm_since is None:
+                self._calm_since = now
+            elif now - self._calm_since >= self.cooldown:
+                self._calm_since = now
+                return self._set_level(self.level - 1, now)
+        else:
+            self._calm_since = None
+        return None
+
+    def _set_level(self, level: int, now: float) -> tuple:
+        previous = self.level
+        self._time_in_level[previous] += now - self._level_since
+        self._level_since = now
+        self.level = level
+        self.level_changes += 1
+        print(f"⚖️ Nivel de carga {previous} -> {level} ({LEVEL_NAMES[level]}), "
+              f"lag {self.lag_smoothed * 1000:.0f} ms")
+        return previous, level
+
+    def reject_connection(self) -> int:
+        """Cuenta una conexión rechazada y retorna el retry-after en ms (con jitter)"""
+        self.rejected_connections += 1
+        return int(self.cooldown * 1000 * (1 + random.random()))
+
+    async def run(self):
+        """Servicio de muestreo (se registra en el supervisor)"""
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            change = self.sample(max(0.0, loop.time() - started - self.interval))
+            if change is not None and self.on_change is not None:
+                await self.on_change(*change)
+
+    def get_stats(self) -> dict:
+        now = time.monotonic()
+        time_in_level = list(self._time_in_level)
+        time_in_level[self.level] += now - self._level_since
+        return {
+            "level": self.level,
+            "level_name": LEVEL_NAMES[self.level],
+            "lag_ms": round(self.lag * 1000, 1),
+            "lag_smoothed_ms": round(self.lag_smoothed * 1000, 1),
+            "lag_max_ms": round(self.lag_max * 1000, 1),
+            "thresholds_ms": [round(t * 1000) for t in self.thresholds],
+            "samples": self.samples,
+            "level_changes": self.level_changes,
+            "seconds_in_level": [round(t, 1) for t in time_in_level],
+            "rejected_connections": self.rejected_connections,
+        }
+
+
+class EventSampler:
+    def __init__(self, every: int = 10):
+        """Deja pasar 1 de cada `every` eventos y cuenta el resto"""
+        self.every = every
+        self._counter = 0
+        self.dropped = 0
+        self.dropped_total = 0
+
+    def admit(self) -> bool:
+        self._counter += 1
+        if self._counter >= self.every:
+            self._counter = 0
+            return True
+        self.dropped += 1
+        self.dropped_total += 1
+        return False
+
+    def drain(self) -> int:
+        """Eventos descartados desde la última llamada"""
+        dropped, self.dropped = self.dropped, 0
+        return dropped
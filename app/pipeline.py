@@ -0,0 +1,107 @@
+"""
+Pipeline interno por etapas
+Cada etapa es una cola asyncio acotada con una tarea consumidora propia que
+procesa los elementos en lotes: toma uno (esperando) y después todo lo que
+ya esté en cola hasta max_batch, sin volver a esperar.
+
+Dos formas de encolar cuando la cola está llena:
+- put(): espera a que haya hueco (contrapresión hacia el productor), para
+  etapas que no pueden perder elementos
+- offer(): descarta el elemento y lo cuenta, para etapas de mejor esfuerzo
+"""
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, List
+
+
+class Stage:
+    def __init__(self, name: str, handler: Callable[[List[Any]], Awaitable[None]],
+                 maxsize: int = 1000, max_batch: int = 100):
+        """
+        Args:
+            name: Nombre de la etapa (estadísticas y logs)
+            handler: Corrutina handler(lote) que procesa una lista de elementos
+            maxsize: Capacidad de la cola
+            max_batch: Elementos máximos por llamada al handler
+        """
+        self.name = name
+        self.handler = handler
+        self.max_batch = max_batch
+        self.maxsize = maxsize
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+
+        self.enqueued = 0
+        self.processed = 0
+        self.batches = 0
+        self.dropped = 0
+        self.errors = 0
+        self.max_depth = 0
+        self.busy_time = 0.0  # segundos dentro del handler
+
+    def start(self):
+        """
+        Cola nueva para el event loop actual (se llama al arrancar la app)
+
+        Una asyncio.Queue queda ligada al primer loop que espera en ella; sin
+        esto un segundo arranque en el mismo proceso (tests, benchmarks) no
+        podría usar la etapa.
+        """
+        self.queue = asyncio.Queue(maxsize=self.maxsize)
+
+    @property
+    def depth(self) -> int:
+        return self.queue.qsize()
+
+    def _count_enqueued(self):
+        self.enqueued += 1
+        depth = self.queue.qsize()
+        if depth > self.max_depth:
+            self.max_depth = depth
+
+    async def put(self, item):
+        """Encola esperando si la etapa va atrasada"""
+        await self.queue.put(item)
+        self._count_enqueued()
+
+    def offer(self, item) -> bool:
+        """Encola sin esperar; si la cola está llena descarta el elemento"""
+        try:
+            self.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+        self._count_enqueued()
+        return True
+
+    async def run(self):
+        """Consumidor de la etapa (se registra como servicio en el supervisor)"""
+        queue = self.queue
+        while True:
+            batch = [await queue.get()]
+            while len(batch) < self.max_batch and not queue.empty():
+                batch.append(queue.get_nowait())
+
+            started = time.perf_counter()
+            try:
+                await self.handler(batch)
+            except Exception as e:
+                # Un lote fallido no detiene la etapa
+                self.errors += 1
+                print(f"❌ Etapa {self.name}: error procesando lote de {len(batch)} ({e})")
+            self.busy_time += time.perf_counter() - started
+            self.batches += 1
+            self.processed += len(batch)
+
+    def get_stats(self) -> dict:
+        return {
+            "depth": self.depth,
+            "maxsize": self.maxsize,
+            "max_depth": self.max_depth,
+            "enqueued": self.enqueued,
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "batches": self.batches,
+            "avg_batch": round(self.processed / self.batches, 1) if self.batches else 0,
+            "errors": self.errors,
+            "busy_ms": round(self.busy_time * 1000, 1),
+        }
@@ -0,0 +1,155 @@
+"""
+Presencia: roster versionado de usuarios en línea con envío de diferencias
+
+Cada alta o baja incrementa la versión del roster y queda en un log acotado.
+Los suscriptores reciben un presence_snapshot al suscribirse y después
+presence_delta con las altas/bajas netas desde su última versión: un
+usuario que sale y vuelve a entrar entre dos envíos no aparece en el delta.
+"""
+import json
+from collections import deque
+from typing import Dict, Optional
+
+from sessions import ClientSession
+
+
+class PresenceRoster:
+    def __init__(self, max_log: int = 10_000):
+        """
+        Args:
+            max_log: Cambios recordados; un suscriptor más atrasado que eso
+                     recibe un snapshot completo en lugar de un delta
+        """
+        self.version = 0
+        self._online: Dict[str, int] = {}  # username -> versión en que entró
+        self._log: deque = deque(maxlen=max_log)  # (versión, username, en línea)
+
+    def join(self, username: str) -> bool:
+        if username in self._online:
+            return False
+        self.version += 1
+        self._online[username] = self.version
+        self._log.append((self.version, username, True))
+        return True
+
+    def leave(self, username: str) -> bool:
+        if self._online.pop(username, None) is None:
+            return False
+        self.version += 1
+        self._log.append((self.version, username, False))
+        return True
+
+    def snapshot(self) -> dict:
+        return {"version": self.version, "users": sorted(self._online)}
+
+    def diff_since(self, version: int) -> Optional[dict]:
+        """
+        Altas y bajas netas entre `version` y la versión actual
+
+        Returns:
+            dict con joined/left, o None si el log ya no cubre `version`
+        """
+        if version >= self.version:
+            return {"from_version": version, "version": self.version, "joined": [], "left": []}
+        if not self._log or self._log[0][0] > version + 1:
+            return None
+
+        # Estado previo (primer evento) y final (último evento) de cada usuario
+        first: Dict[str, bool] = {}
+        last: Dict[str, bool] = {}
+        for event_version, username, online in reversed(self._log):
+            if event_version <= version:
+                break
+            if username not in last:
+                last[username] = online
+            first[username] = online
+
+        joined = [u for u, online in last.items() if online and first[u]]
+        left = [u for u, online in last.items() if not online and not first[u]]
+        return {"from_version": version, "version": self.version, "joined": joined, "left": left}
+
+    def __contains__(self, username: str) -> bool:
+        return username in self._online
+
+    def __len__(self) -> int:
+        return len(self._online)
+
+
+class PresenceService:
+    def __init__(self, roster: PresenceRoster):
+        """
+        Suscriptores de presencia (clientes que lo piden y monitores)
+
+        Se guarda la última versión enviada a cada suscriptor; flush() agrupa
+        a los que están en la misma versión y serializa un único frame por grupo.
+        """
+        self.roster = roster
+        self._subscribers: Dict[ClientSession, int] = {}
+        self.deltas_sent = 0
+        self.snapshots_sent = 0
+
+    def join(self, session: ClientSession):
+        self.roster.join(session.username)
+
+    def leave(self, session: ClientSession):
+        self.roster.leave(session.username)
+        self._subscribers.pop(session, None)
+
+    def subscribe(self, session: ClientSession) -> str:
+        """Suscribe una sesión y retorna el frame presence_snapshot a enviarle"""
+        return json.dumps({"type": "presence_snapshot", **self.subscribe_snapshot(session)})
+
+    def subscribe_snapshot(self, session: ClientSession) -> dict:
+        """Como subscribe(), con el snapshot sin serializar para incluirlo en otro frame"""
+        snapshot = self.roster.snapshot()
+        self._subscribers[session] = snapshot["version"]
+        self.snapshots_sent += 1
+        return snapshot
+
+    def unsubscribe(self, session: ClientSession):
+        self._subscribers.pop(session, None)
+
+    async def flush(self):
+        """Envía a cada suscriptor los cambios desde su última versión"""
+        version = self.roster.version
+        groups: Dict[int, list] = {}
+        for session, seen in self._subscribers.items():
+            if seen != version:
+                groups.setdefault(seen, []).append(session)
+
+        failed = []
+        for seen, sessions in groups.items():
+            diff = self.roster.diff_since(seen)
+            if diff is None:
+                frame = json.dumps({"type": "presence_snapshot", **self.roster.snapshot()})
+                self.snapshots_sent += len(sessions)
+            elif not diff["joined"] and not diff["left"]:
+                # Altas y bajas que se anulan (join + leave entre dos flush)
+                for session in sessions:
+                    self._subscribers[session] = version
+                continue
+            else:
+                frame = json.dumps({"type": "presence_delta", **diff})
+                self.deltas_sent += len(sessions)
+
+            for session in sessions:
+                try:
+                    await session.websocket.send_text(frame)
+                except Exception:
+                    failed.append(session)
+                    continue
+                # Durante el await pudo darse de baja o volver a suscribirse
+                if self._subscribers.get(session) == seen:
+                    self._subscribers[session] = version
+
+        for session in failed:
+            self._subscribers.pop(session, None)
+
+    def get_stats(self) -> dict:
+        return {
+            "version": self.roster.version,
+            "online": len(self.roster),
+            "subscribers": len(self._subscribers),
+            "deltas_sent": self.deltas_sent,
+            "snapshots_sent": self.snapshots_sent,
+        }
@@ -0,0 +1,198 @@
+"""
+Profiler por muestreo para el servidor en ejecución
+Se importa sólo desde el endpoint /admin/profile: mientras no se usa no
+hay hilos, hooks ni parches activos.
+
+Durante `seconds` segundos:
+- un hilo toma la pila del hilo del event loop cada `interval` segundos
+  (sys._current_frames) y la acumula en formato collapsed (flamegraph.pl,
+  speedscope)
+- Handle._run de asyncio se envuelve para medir cada callback y quedarse
+  con los más lentos (no disponible con uvloop, cuyos handles son C)
+- al terminar se toma una foto de las tareas asyncio agrupadas por
+  corrutina y por el punto donde están esperando
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, Optional
+
+MAX_SECONDS = 60
+MAX_DEPTH = 64
+
+
+class ProfilerBusy(RuntimeError):
+    """Ya hay un perfilado en curso"""
+
+
+_running = False
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+def _collapse(frame) -> str:
+    """Pila raíz;...;hoja de un frame"""
+    labels = []
+    while frame is not None and len(labels) < MAX_DEPTH:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.reverse()
+    return ";".join(labels)
+
+
+class StackSampler(threading.Thread):
+    def __init__(self, thread_id: int, interval: float):
+        super().__init__(name="chat-profiler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[_collapse(frame)] += 1
+                self.samples += 1
+                del frame
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class SlowCallbacks:
+    """Envuelve asyncio.events.Handle._run mientras está instalado"""
+
+    def __init__(self, keep: int = 20):
+        self.keep = keep
+        self.by_callback: Dict[str, list] = {}  # descripción -> [llamadas, total, máximo]
+        self.count = 0
+        self.total = 0.0
+        self._original = None
+
+    def install(self) -> bool:
+        loop = asyncio.get_running_loop()
+        if not isinstance(loop, asyncio.BaseEventLoop):
+            return False  # uvloop u otro loop sin Handle de Python
+
+        original = self._original = asyncio.events.Handle._run
+        collector = self
+
+        def timed_run(handle):
+            started = time.perf_counter()
+            try:
+                return original(handle)
+            finally:
+                collector.record(handle, time.perf_counter() - started)
+
+        asyncio.events.Handle._run = timed_run
+        return True
+
+    def uninstall(self):
+        if self._original is not None:
+            asyncio.events.Handle._run = self._original
+            self._original = None
+
+    def record(self, handle, duration: float):
+        self.count += 1
+        self.total += duration
+        key = self._describe(handle)
+        entry = self.by_callback.get(key)
+        if entry is None:
+            self.by_callback[key] = [1, duration, duration]
+        else:
+            entry[0] += 1
+            entry[1] += duration
+            if duration > entry[2]:
+                entry[2] = duration
+
+    @staticmethod
+    def _describe(handle) -> str:
+        callback = handle._callback
+        # Los pasos de una tarea se describen por su corrutina
+        task = getattr(callback, "__self__", None)
+        if isinstance(task, asyncio.Task):
+            coro = task.get_coro()
+            return f"Task {task.get_name()} ({getattr(coro, '__qualname__', coro)})"
+        return getattr(callback, "__qualname__", repr(callback))
+
+    def to_dict(self) -> dict:
+        slowest = sorted(self.by_callback.items(), key=lambda item: item[1][2], reverse=True)
+        return {
+            "callbacks": self.count,
+            "total_ms": round(self.total * 1000, 1),
+            "slowest": [
+                {
+                    "callback": description,
+                    "max_ms": round(longest * 1000, 2),
+                    "calls": calls,
+                    "total_ms": round(total * 1000, 1),
+                }
+                for description, (calls, total, longest) in slowest[:self.keep]
+            ],
+        }
+
+
+def task_states() -> dict:
+    """Tareas asyncio agrupadas por corrutina y punto de espera"""
+    groups: Dict[tuple, int] = Counter()
+    for task in asyncio.all_tasks():
+        coro = task.get_coro()
+        name = getattr(coro, "__qualname__", repr(coro))
+        stack = task.get_stack(limit=1)
+        where = f"{os.path.basename(stack[0].f_code.co_filename)}:{stack[0].f_lineno}" if stack else "-"
+        groups[(name, where)] += 1
+
+    return {
+        "total": sum(groups.values()),
+        "groups": [
+            {"coroutine": name, "waiting_at": where, "count": count}
+            for (name, where), count in groups.most_common()
+        ],
+    }
+
+
+async def profile(seconds: float, interval: float = 0.005, collect_callbacks: bool = True) -> dict:
+    """
+    Perfila el event loop actual durante `seconds` segundos
+
+    Raises:
+        ProfilerBusy: si ya hay otro perfilado en curso
+    """
+    global _running
+    if _running:
+        raise ProfilerBusy("Ya hay un perfilado en curso")
+    _running = True
+
+    seconds = min(max(seconds, 0.1), MAX_SECONDS)
+    sampler = StackSampler(threading.get_ident(), max(interval, 0.001))
+    callbacks: Optional[SlowCallbacks] = SlowCallbacks() if collect_callbacks else None
+    try:
+        callbacks_supported = callbacks.install() if callbacks else False
+        sampler.start()
+        started = time.perf_counter()
+        await asyncio.sleep(seconds)
+        elapsed = time.perf_counter() - started
+    finally:
+        if sampler.is_alive():
+            sampler.stop()
+        if callbacks:
+            callbacks.uninstall()
+        _running = False
+
+    return {
+        "seconds": round(elapsed, 3),
+        "interval_ms": interval * 1000,
+        "samples": sampler.samples,
+        "collapsed": [f"{stack} {count}" for stack, count in sampler.stacks.most_common()],
+        "slow_callbacks": callbacks.to_dict() if callbacks_supported else None,
+        "tasks": task_states(),
+    }
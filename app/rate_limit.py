@@ -0,0 +1,159 @@
+"""
+Control de admisión por token bucket (por usuario y global)
+El rellenado es perezoso: sólo se calcula al consultar el bucket
+"""
+import time
+from typing import Dict, Optional
+
+
+class TokenBucket:
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def consume(self, now: float, cost: float = 1) -> float:
+        """
+        Intenta consumir `cost` tokens
+
+        Returns:
+            0 si se admitió, o los segundos hasta que haya tokens suficientes
+        """
+        tokens = self.tokens + (now - self.updated) * self.rate
+        if tokens > self.capacity:
+            tokens = self.capacity
+        self.updated = now
+
+        if tokens >= cost:
+            self.tokens = tokens - cost
+            return 0
+        self.tokens = tokens
+        return (cost - tokens) / self.rate
+
+    def is_full(self, now: float) -> bool:
+        return self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+
+class RateLimiter:
+    def __init__(self, user_rate: float = 5, user_burst: float = 20,
+                 global_rate: float = 500, global_burst: float = 1000,
+                 transfer_rate: float = 4 * 1024 * 1024, transfer_burst: float = 8 * 1024 * 1024,
+                 report_interval: float = 1):
+        """
+        Limitador de frames entrantes
+
+        Args:
+            user_rate: Frames por segundo sostenidos por usuario
+            user_burst: Ráfaga máxima por usuario
+            global_rate: Frames por segundo sostenidos para todo el servidor
+            global_burst: Ráfaga máxima global
+            transfer_rate: Bytes por segundo de chunks de archivo por usuario
+            transfer_burst: Ráfaga máxima de bytes de chunks por usuario
+            report_interval: Segundos mínimos entre reportes a monitores
+        """
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.report_interval = report_interval
+        self._global = TokenBucket(global_rate, global_burst, time.monotonic())
+        self._users: Dict[str, TokenBucket] = {}
+        self.transfer_rate = transfer_rate
+        self.transfer_burst = transfer_burst
+        self._transfers: Dict[str, TokenBucket] = {}
+        self._last_report = 0.0
+
+        self.allowed = 0
+        self.rejected_user = 0
+        self.rejected_global = 0
+        self.rejected_transfer = 0
+
+    def check(self, username: str) -> Optional[tuple]:
+        """
+        Admite o rechaza un frame de username
+
+        Returns:
+            None si se admite, o (scope, retry_after_segundos) si se rechaza
+        """
+        now = time.monotonic()
+
+        bucket = self._users.get(username)
+        if bucket is None:
+            bucket = self._users[username] = TokenBucket(self.user_rate, self.user_burst, now)
+
+        wait = bucket.consume(now)
+        if wait:
+            self.rejected_user += 1
+            return 'user', wait
+
+        wait = self._global.consume(now)
+        if wait:
+            # Devolver el token del usuario: el rechazo no es culpa suya
+            bucket.tokens += 1
+            self.rejected_global += 1
+            return 'global', wait
+
+        self.allowed += 1
+        return None
+
+    def check_transfer(self, username: str, size: int) -> Optional[tuple]:
+        """
+        Admite o rechaza un chunk de archivo de `size` bytes
+
+        Los chunks se limitan por bytes y no por frames: un archivo grande son
+        cientos de frames y agotaría el cupo de mensajes del usuario. Sí
+        cuentan como un frame en el bucket global.
+        """
+        now = time.monotonic()
+
+        bucket = self._transfers.get(username)
+        if bucket is None:
+            bucket = self._transfers[username] = TokenBucket(self.transfer_rate, self.transfer_burst, now)
+
+        cost = min(size, self.transfer_burst)
+        wait = bucket.consume(now, cost)
+        if wait:
+            self.rejected_transfer += 1
+            return 'transfer', wait
+
+        # Cada chunk es además un frame para el cupo global del servidor
+        wait = self._global.consume(now)
+        if wait:
+            bucket.tokens += cost
+            self.rejected_global += 1
+            return 'global', wait
+
+        self.allowed += 1
+        return None
+
+    def should_report(self) -> bool:
+        """True como máximo una vez por report_interval (para avisar a monitores)"""
+        now = time.monotonic()
+        if now - self._last_report >= self.report_interval:
+            self._last_report = now
+            return True
+        return False
+
+    def prune(self):
+        """Elimina buckets llenos (usuarios sin actividad reciente)"""
+        now = time.monotonic()
+        for buckets in (self._users, self._transfers):
+            idle = [username for username, bucket in buckets.items() if bucket.is_full(now)]
+            for username in idle:
+                del buckets[username]
+
+    def get_stats(self) -> dict:
+        """Retorna los contadores del limitador"""
+        return {
+            'allowed': self.allowed,
+            'rejected_user': self.rejected_user,
+            'rejected_global': self.rejected_global,
+            'rejected_transfer': self.rejected_transfer,
+            'tracked_users': len(self._users),
+            'user_rate': self.user_rate,
+            'user_burst': self.user_burst,
+            'global_rate': self._global.rate,
+            'global_burst': self._global.capacity,
+            'transfer_rate': self.transfer_rate,
+        }
@@ -0,0 +1,296 @@
+"""
+Reproduce una captura (capture.py, CHAT_CAPTURE_PATH) contra una instancia
+del chat y mide latencia y throughput
+
+Cada username se reproduce en una tarea propia con sus conexiones en el
+orden capturado. Los mensajes (MESSAGE) se cifran con la clave que la
+instancia destino entrega en el welcome; los demás frames se envían tal
+cual. La latencia es desde el envío de un mensaje hasta su ack, así que
+la instancia debe usar CHAT_ACK_MODE=ack (el valor por defecto).
+
+A velocidades altas conviene subir los límites de la instancia destino
+(CHAT_USER_RATE, CHAT_GLOBAL_RATE...); los rate_limited se cuentan aparte.
+
+Uso:
+    python replay_capture.py captura.bin                       # 1x
+    python replay_capture.py captura.bin --speed 10            # 10x
+    python replay_capture.py captura.bin --speed max --json    # sin esperas
+    python replay_capture.py captura.bin --url wss://localhost:8000 --insecure
+"""
+import argparse
+import asyncio
+import base64
+import itertools
+import json
+import os
+import ssl
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import websockets
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+from capture import CONNECT, DISCONNECT, FRAME, MESSAGE, CaptureEvent, read_capture
+
+ACK_TIMEOUT = 5.0
+
+
+class ReplayStats:
+    def __init__(self):
+        self.connections = 0
+        self.failed_connections = 0
+        self.frames = 0
+        self.messages = 0
+        self.acked = 0
+        self.rate_limited = 0
+        self.errors = 0
+        self.skipped = 0  # frames y mensajes sin conexión a la que enviarlos
+        self.latencies: List[float] = []
+
+    def to_dict(self, elapsed: float, capture_duration: float) -> dict:
+        latencies = sorted(self.latencies)
+
+        def percentile(p: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 2)
+
+        return {
+            "capture_seconds": round(capture_duration, 3),
+            "replay_seconds": round(elapsed, 3),
+            "connections": self.connections,
+            "failed_connections": self.failed_connections,
+            "frames": self.frames,
+            "messages": self.messages,
+            "acked": self.acked,
+            "lost": self.messages - self.acked,
+            "rate_limited": self.rate_limited,
+            "errors": self.errors,
+            "skipped": self.skipped,
+            "messages_per_second": round(self.acked / elapsed, 1) if elapsed else None,
+            "latency_ms": {
+                "p50": percentile(0.5),
+                "p95": percentile(0.95),
+                "p99": percentile(0.99),
+                "max": round(latencies[-1] * 1000, 2) if latencies else None,
+            },
+        }
+
+
+class ReplayConnection:
+    """Una conexión a /ws/{username} con sus claves y acks pendientes"""
+
+    def __init__(self, websocket, stats: ReplayStats):
+        self.websocket = websocket
+        self.stats = stats
+        self.keys: Dict[str, AESGCM] = {}
+        self.key_id: Optional[str] = None
+        self.pending: Dict[int, float] = {}  # id del mensaje -> instante de envío
+        self.ids = itertools.count(1)
+        self.welcome = asyncio.Event()
+        self.drained = asyncio.Event()
+        self._reader = asyncio.create_task(self._read())
+
+    async def _read(self):
+        try:
+            async for raw in self.websocket:
+                self._handle(json.loads(raw))
+        except (websockets.ConnectionClosed, json.JSONDecodeError):
+            pass
+        finally:
+            self.welcome.set()
+            self.drained.set()
+
+    def _handle(self, frame: dict):
+        frame_type = frame.get("type")
+        if frame_type == "welcome":
+            self.keys[frame["key_id"]] = AESGCM(base64.b64decode(frame["key_base64"]))
+            self.key_id = frame["key_id"]
+            self.welcome.set()
+        elif frame_type == "key_announce":
+            self.keys[frame["next_key_id"]] = AESGCM(base64.b64decode(frame["key_base64"]))
+        elif frame_type == "key_activate":
+            if frame["key_id"] in self.keys:
+                self.key_id = frame["key_id"]
+        elif frame_type == "ack":
+            sent = self.pending.pop(frame.get("id"), None)
+            if sent is not None:
+                self.stats.acked += 1
+                self.stats.latencies.append(time.perf_counter() - sent)
+                if not self.pending:
+                    self.drained.set()
+        elif frame_type == "rate_limited":
+            self.stats.rate_limited += 1
+        elif frame_type == "ping":
+            asyncio.ensure_future(self.send_raw(json.dumps({"type": "pong", "t": frame["t"]})))
+        elif "error" in frame:
+            self.stats.errors += 1
+
+    async def send_raw(self, text: str):
+        try:
+            await self.websocket.send(text)
+        except websockets.ConnectionClosed:
+            pass
+
+    async def send_message(self, plaintext: str):
+        if self.key_id is None:
+            return
+        nonce = os.urandom(12)
+        encrypted = self.keys[self.key_id].encrypt(nonce, plaintext.encode("utf-8"), None)
+        message_id = next(self.ids)
+        self.pending[message_id] = time.perf_counter()
+        self.drained.clear()
+        self.stats.messages += 1
+        await self.send_raw(json.dumps({
+            "encrypted": base64.b64encode(encrypted).decode(),
+            "nonce": base64.b64encode(nonce).decode(),
+            "key_id": self.key_id,
+            "id": message_id,
+        }))
+
+    async def close(self):
+        """Espera los acks pendientes (acotado) y cierra"""
+        if self.pending:
+            try:
+                await asyncio.wait_for(self.drained.wait(), ACK_TIMEOUT)
+            except asyncio.TimeoutError:
+                pass
+        await self.websocket.close()
+        await self._reader
+
+
+class Clock:
+    def __init__(self, speed: Optional[float]):
+        """speed None = tan rápido como se pueda"""
+        self.speed = speed
+        self.started = time.perf_counter()
+
+    async def wait_until(self, t: float):
+        if self.speed is None:
+            return
+        delay = self.started + t / self.speed - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+async def replay_user(username: str, events: List[CaptureEvent], url: str, ssl_context,
+                      clock: Clock, stats: ReplayStats):
+    connection: Optional[ReplayConnection] = None
+    conn_id: Optional[int] = None  # conn_id capturado de la conexión abierta
+    for event in events:
+        await clock.wait_until(event.t)
+
+        if event.kind == CONNECT:
+            if connection is not None:
+                await connection.close()
+            conn_id = event.conn_id
+            try:
+                websocket = await websockets.connect(f"{url}/ws/{username}", ssl=ssl_context, max_size=None)
+            except (OSError, websockets.InvalidHandshake) as e:
+                print(f"❌ No se pudo conectar {username}: {e}", file=sys.stderr)
+                stats.failed_connections += 1
+                connection = None
+                continue
+            stats.connections += 1
+            connection = ReplayConnection(websocket, stats)
+            await connection.welcome.wait()
+
+        elif event.conn_id != conn_id or connection is None:
+            # Conexión fallida o ya reemplazada por una reconexión: el servidor
+            # registra CONNECT(nueva) antes que DISCONNECT(anterior)
+            if event.kind in (FRAME, MESSAGE):
+                stats.skipped += 1
+            continue
+
+        elif event.kind == FRAME:
+            stats.frames += 1
+            await connection.send_raw(event.payload)
+
+        elif event.kind == MESSAGE:
+            await connection.send_message(event.payload)
+
+        elif event.kind == DISCONNECT:
+            await connection.close()
+            connection = None
+            conn_id = None
+
+    if connection is not None:
+        await connection.close()
+
+
+def load_sessions(path: str) -> tuple:
+    """Eventos agrupados por username y duración de la captura"""
+    usernames: Dict[int, str] = {}
+    by_user: Dict[str, List[CaptureEvent]] = defaultdict(list)
+    duration = 0.0
+    for event in read_capture(path):
+        if event.kind == CONNECT:
+            usernames[event.conn_id] = event.payload
+        username = usernames.get(event.conn_id)
+        if username is not None:
+            by_user[username].append(event)
+        duration = max(duration, event.t)
+    return by_user, duration
+
+
+async def replay(path: str, url: str, speed: Optional[float], insecure: bool) -> dict:
+    by_user, duration = load_sessions(path)
+
+    ssl_context = None
+    if url.startswith("wss://"):
+        ssl_context = ssl.create_default_context()
+        if insecure:
+            ssl_context.check_hostname = False
+            ssl_context.verify_mode = ssl.CERT_NONE
+
+    stats = ReplayStats()
+    clock = Clock(speed)
+    await asyncio.gather(*(
+        replay_user(username, events, url, ssl_context, clock, stats)
+        for username, events in by_user.items()
+    ))
+    return stats.to_dict(time.perf_counter() - clock.started, duration)
+
+
+def parse_speed(value: str) -> Optional[float]:
+    if value == "max":
+        return None
+    speed = float(value.rstrip("x"))
+    if speed <= 0:
+        raise argparse.ArgumentTypeError("la velocidad debe ser positiva o 'max'")
+    return speed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reproduce una captura de tráfico del chat")
+    parser.add_argument("capture", help="Archivo generado con CHAT_CAPTURE_PATH")
+    parser.add_argument("--url", default="ws://localhost:8000",
+                        help="Instancia destino (ws:// o wss://)")
+    parser.add_argument("--speed", type=parse_speed, default=1.0,
+                        help="Multiplicador de velocidad (1, 10, 0.5...) o 'max'")
+    parser.add_argument("--insecure", action="store_true",
+                        help="No verificar el certificado (wss:// con certificado autofirmado)")
+    parser.add_argument("--json", action="store_true", help="Resultado en JSON")
+    args = parser.parse_args()
+
+    result = asyncio.run(replay(args.capture, args.url.rstrip("/"), args.speed, args.insecure))
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+    latency = result["latency_ms"]
+    speed = "max" if args.speed is None else f"{args.speed:g}x"
+    print(f"Captura de {result['capture_seconds']} s reproducida en {result['replay_seconds']} s ({speed})")
+    print(f"Conexiones: {result['connections']} (fallidas {result['failed_connections']})")
+    print(f"Mensajes: {result['messages']} enviados, {result['acked']} confirmados, "
+          f"{result['lost']} sin ack, {result['rate_limited']} rate_limited, {result['errors']} errores")
+    print(f"Otros frames: {result['frames']} | descartados sin conexión: {result['skipped']}")
+    print(f"Throughput: {result['messages_per_second']} mensajes/s")
+    print(f"Latencia ms: p50 {latency['p50']} | p95 {latency['p95']} | "
+          f"p99 {latency['p99']} | máx {latency['max']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Detección de frames repetidos (replay) por (key_id, nonce)
+Memoria acotada con dos generaciones de sets por clave: cuando la
+generación actual se llena pasa a ser la anterior y la más vieja se
+descarta. Búsqueda e inserción O(1).
+"""
+from typing import Dict, List, Set
+
+
+class NonceWindow:
+    __slots__ = ('capacity', 'current', 'previous')
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.current: Set[bytes] = set()
+        self.previous: Set[bytes] = set()
+
+    def __contains__(self, nonce: bytes) -> bool:
+        return nonce in self.current or nonce in self.previous
+
+    def add(self, nonce: bytes):
+        if len(self.current) >= self.capacity:
+            self.previous = self.current
+            self.current = set()
+        self.current.add(nonce)
+
+    def __len__(self) -> int:
+        return len(self.current) + len(self.previous)
+
+
+class ReplayError(ValueError):
+    """El frame ya fue aceptado antes con la misma clave y nonce"""
+
+
+class ReplayGuard:
+    def __init__(self, nonces_per_key: int = 100_000):
+        """
+        Registro de nonces ya aceptados
+
+        Args:
+            nonces_per_key: Nonces recordados con seguridad por clave; se
+                            conservan entre nonces_per_key y el doble. Un
+                            replay más antiguo que eso no se detecta.
+        """
+        self.generation_size = nonces_per_key
+        self._windows: Dict[str, NonceWindow] = {}
+        self.accepted = 0
+        self.replays = 0
+
+    def check(self, key_id: str, nonce: bytes):
+        """Lanza ReplayError si (key_id, nonce) ya fue aceptado"""
+        window = self._windows.get(key_id)
+        if window is not None and nonce in window:
+            self.replays += 1
+            raise ReplayError(f"Frame repetido (clave {key_id})")
+
+    def remember(self, key_id: str, nonce: bytes):
+        """Registra un frame que se descifró correctamente"""
+        window = self._windows.get(key_id)
+        if window is None:
+            window = self._windows[key_id] = NonceWindow(self.generation_size)
+        window.add(nonce)
+        self.accepted += 1
+
+    def forget_keys(self, key_ids: List[str]):
+        """Libera los nonces de claves eliminadas: sus frames ya no descifran"""
+        for key_id in key_ids:
+            self._windows.pop(key_id, None)
+
+    def get_stats(self) -> dict:
+        return {
+            'accepted': self.accepted,
+            'replays': self.replays,
+            'tracked_keys': len(self._windows),
+            'tracked_nonces': sum(len(window) for window in self._windows.values()),
+        }
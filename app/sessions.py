@@ -0,0 +1,118 @@
+"""
+Registro de sesiones WebSocket
+Cada conexión de cliente se representa con un objeto compacto (__slots__)
+indexado por username y por id de conexión
+"""
+import itertools
+import time
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+from fastapi import WebSocket
+
+
+class ClientSession:
+    """Estado por conexión de un cliente del chat"""
+
+    __slots__ = (
+        'conn_id',
+        'username',
+        'websocket',
+        'key_id',
+        'connected_at',
+        'last_seen',
+        'messages_in',
+        'bytes_in',
+        'rooms',
+    )
+
+    def __init__(self, conn_id: int, username: str, websocket: WebSocket):
+        now = time.monotonic()
+        self.conn_id = conn_id
+        self.username = username
+        self.websocket = websocket
+        self.key_id: Optional[str] = None
+        self.connected_at = now
+        self.last_seen = now
+        self.messages_in = 0
+        self.bytes_in = 0
+        self.rooms = None  # Se crea un set sólo si el cliente entra en alguna sala
+
+    def touch(self, size: int = 0):
+        """Registra actividad del cliente (mensaje recibido)"""
+        self.last_seen = time.monotonic()
+        self.messages_in += 1
+        self.bytes_in += size
+
+    def __repr__(self) -> str:
+        return f"ClientSession(conn_id={self.conn_id}, username={self.username!r})"
+
+
+class ConnectionRegistry:
+    def __init__(self, on_join: Optional[Callable[[ClientSession], None]] = None,
+                 on_leave: Optional[Callable[[ClientSession], None]] = None):
+        """
+        Registro de sesiones activas indexado por username y por conn_id
+
+        Un username sólo puede tener una sesión: al reconectar, la sesión
+        nueva reemplaza a la anterior en ambos índices.
+
+        Args:
+            on_join: Se llama cuando un username entra (no en una reconexión)
+            on_leave: Se llama cuando se elimina la sesión vigente de un username
+        """
+        self._by_username: Dict[str, ClientSession] = {}
+        self._by_conn_id: Dict[int, ClientSession] = {}
+        self._conn_ids = itertools.count(1)
+        self.on_join = on_join
+        self.on_leave = on_leave
+
+    def register(self, username: str, websocket: WebSocket) -> Tuple[ClientSession, Optional[ClientSession]]:
+        """
+        Crea y registra la sesión de un cliente
+
+        Returns:
+            (sesión nueva, sesión reemplazada o None)
+        """
+        previous = self._by_username.get(username)
+        if previous is not None:
+            del self._by_conn_id[previous.conn_id]
+
+        session = ClientSession(next(self._conn_ids), username, websocket)
+        self._by_username[username] = session
+        self._by_conn_id[session.conn_id] = session
+        if previous is None and self.on_join is not None:
+            self.on_join(session)
+        return session, previous
+
+    def unregister(self, session: ClientSession) -> bool:
+        """
+        Elimina una sesión. Si ya fue reemplazada por una reconexión no toca
+        la sesión nueva. Retorna True si la sesión estaba registrada.
+        """
+        if self._by_conn_id.get(session.conn_id) is not session:
+            return False
+
+        del self._by_conn_id[session.conn_id]
+        del self._by_username[session.username]
+        if self.on_leave is not None:
+            self.on_leave(session)
+        return True
+
+    def get(self, username: str) -> Optional[ClientSession]:
+        return self._by_username.get(username)
+
+    def get_by_conn_id(self, conn_id: int) -> Optional[ClientSession]:
+        return self._by_conn_id.get(conn_id)
+
+    def items(self) -> Iterator[Tuple[str, ClientSession]]:
+        return iter(list(self._by_username.items()))
+
+    def __iter__(self) -> Iterator[ClientSession]:
+        # Copia para permitir (des)registros mientras se itera con awaits
+        return iter(list(self._by_username.values()))
+
+    def __contains__(self, username: str) -> bool:
+        return username in self._by_username
+
+    def __len__(self) -> int:
+        return len(self._by_username)
@@ -0,0 +1,170 @@
+"""
+Supervisor de tareas en background
+Arranca los trabajos en orden, los reinicia con backoff si fallan, aplica
+jitter a los periódicos y los cancela limpiamente al apagar el servidor
+"""
+import asyncio
+import random
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+
+class JobStats:
+    __slots__ = ('runs', 'failures', 'restarts', 'total_time', 'max_time',
+                 'last_time', 'last_run_at', 'last_error')
+
+    def __init__(self):
+        self.runs = 0
+        self.failures = 0
+        self.restarts = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.last_time = 0.0
+        self.last_run_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    def record(self, elapsed: float):
+        self.runs += 1
+        self.total_time += elapsed
+        self.last_time = elapsed
+        if elapsed > self.max_time:
+            self.max_time = elapsed
+        self.last_run_at = time.time()
+
+    def to_dict(self) -> dict:
+        return {
+            'runs': self.runs,
+            'failures': self.failures,
+            'restarts': self.restarts,
+            'avg_ms': round(self.total_time / self.runs * 1000, 3) if self.runs else 0,
+            'max_ms': round(self.max_time * 1000, 3),
+            'last_ms': round(self.last_time * 1000, 3),
+            'last_run_at': self.last_run_at,
+            'last_error': self.last_error,
+        }
+
+
+class Job:
+    def __init__(self, name: str, func: Callable[[], Awaitable[None]],
+                 interval: Optional[float], jitter: float, initial_delay: Optional[float]):
+        self.name = name
+        self.func = func
+        self.interval = interval  # None = servicio de larga duración
+        self.jitter = jitter
+        self.initial_delay = initial_delay
+        self.task: Optional[asyncio.Task] = None
+        self.stats = JobStats()
+
+    def next_delay(self) -> float:
+        if self.jitter:
+            return self.interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+        return self.interval
+
+
+class TaskSupervisor:
+    def __init__(self, backoff_initial: float = 1, backoff_max: float = 60,
+                 shutdown_timeout: float = 5):
+        """
+        Supervisor de trabajos periódicos y servicios
+
+        Args:
+            backoff_initial: Espera tras el primer fallo de un trabajo (segundos)
+            backoff_max: Espera máxima entre reinicios
+            shutdown_timeout: Tiempo máximo para que los trabajos se cancelen
+        """
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.shutdown_timeout = shutdown_timeout
+        self._jobs: Dict[str, Job] = {}
+        self.started_at: Optional[float] = None
+
+    def add_periodic(self, name: str, func: Callable[[], Awaitable[None]], interval: float,
+                     jitter: float = 0.1, initial_delay: Optional[float] = None):
+        """
+        Registra una corrutina que se ejecuta cada interval segundos
+
+        Args:
+            jitter: Fracción aleatoria aplicada al intervalo (0.1 = ±10%)
+            initial_delay: Espera antes de la primera ejecución (default: interval)
+        """
+        self._jobs[name] = Job(name, func, interval, jitter, initial_delay)
+
+    def add_service(self, name: str, func: Callable[[], Awaitable[None]]):
+        """Registra una corrutina de larga duración; se reinicia si termina o falla"""
+        self._jobs[name] = Job(name, func, None, 0, None)
+
+    async def _run_periodic(self, job: Job, delay: float):
+        while True:
+            await asyncio.sleep(delay)
+            started = time.perf_counter()
+            await job.func()
+            job.stats.record(time.perf_counter() - started)
+            delay = job.next_delay()
+
+    async def _run_service(self, job: Job, delay: float):
+        started = time.perf_counter()
+        try:
+            await job.func()
+        finally:
+            job.stats.record(time.perf_counter() - started)
+        raise RuntimeError("el servicio terminó inesperadamente")
+
+    async def _supervise(self, job: Job):
+        """Ejecuta un trabajo y lo reinicia con backoff exponencial si falla"""
+        backoff = self.backoff_initial
+        if job.interval is None:
+            runner, delay = self._run_service, 0
+        else:
+            runner = self._run_periodic
+            delay = job.initial_delay if job.initial_delay is not None else job.next_delay()
+
+        while True:
+            runs_before = job.stats.runs
+            try:
+                await runner(job, delay)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if job.stats.runs > runs_before:
+                    # Hubo ejecuciones correctas desde el último fallo
+                    backoff = self.backoff_initial
+                job.stats.failures += 1
+                job.stats.restarts += 1
+                job.stats.last_error = f"{type(e).__name__}: {e}"
+                print(f"❌ Trabajo {job.name} falló ({e}); reinicio en {backoff:.1f}s")
+                await asyncio.sleep(backoff * random.uniform(0.5, 1))
+                backoff = min(backoff * 2, self.backoff_max)
+                # Tras el backoff se reintenta de inmediato
+                delay = 0
+
+    async def start(self):
+        """Arranca los trabajos en el orden en que se registraron"""
+        for job in self._jobs.values():
+            job.task = asyncio.create_task(self._supervise(job), name=f"job:{job.name}")
+        self.started_at = time.time()
+
+    async def stop(self):
+        """Cancela los trabajos en orden inverso y espera a que terminen"""
+        tasks: List[asyncio.Task] = []
+        for job in reversed(list(self._jobs.values())):
+            if job.task is not None:
+                job.task.cancel()
+                tasks.append(job.task)
+                job.task = None
+
+        if tasks:
+            _, pending = await asyncio.wait(tasks, timeout=self.shutdown_timeout)
+            for task in pending:
+                print(f"⚠️ {task.get_name()} no terminó en {self.shutdown_timeout}s")
+        self.started_at = None
+
+    def get_stats(self) -> dict:
+        """Estadísticas de ejecución por trabajo"""
+        return {
+            name: {
+                'interval': job.interval,
+                'running': job.task is not None and not job.task.done(),
+                **job.stats.to_dict()
+            }
+            for name, job in self._jobs.items()
+        }
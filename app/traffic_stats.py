@@ -0,0 +1,123 @@
+"""
+Estadísticas de tráfico con ventanas deslizantes
+Contadores en rings de buckets: añadir y consultar el total son O(1)
+amortizado, sin guardar un timestamp por mensaje
+"""
+import heapq
+import time
+from typing import Dict, List
+
+
+class SlidingWindowCounter:
+    __slots__ = ('resolution', 'size', '_counts', '_last_bucket', '_total')
+
+    def __init__(self, size: int = 3600, resolution: int = 1):
+        """
+        Args:
+            size: Número de buckets de la ventana
+            resolution: Segundos por bucket (ventana = size * resolution)
+        """
+        self.resolution = resolution
+        self.size = size
+        self._counts = [0] * size
+        self._last_bucket = int(time.time()) // resolution
+        self._total = 0
+
+    def _advance(self, bucket: int):
+        """Vacía los buckets que salieron de la ventana desde la última llamada"""
+        gap = bucket - self._last_bucket
+        if gap <= 0:
+            return
+        if gap >= self.size:
+            self._counts = [0] * self.size
+            self._total = 0
+        else:
+            counts = self._counts
+            for b in range(self._last_bucket + 1, bucket + 1):
+                slot = b % self.size
+                self._total -= counts[slot]
+                counts[slot] = 0
+        self._last_bucket = bucket
+
+    def add(self, value: int = 1, now: float = None):
+        bucket = int(now if now is not None else time.time()) // self.resolution
+        self._advance(bucket)
+        self._counts[bucket % self.size] += value
+        self._total += value
+
+    def total(self, now: float = None) -> int:
+        """Suma de toda la ventana"""
+        self._advance(int(now if now is not None else time.time()) // self.resolution)
+        return self._total
+
+    def last(self, buckets: int, now: float = None) -> List[int]:
+        """Valores de los últimos buckets, del más antiguo al actual"""
+        bucket = int(now if now is not None else time.time()) // self.resolution
+        self._advance(bucket)
+        buckets = min(buckets, self.size)
+        return [self._counts[b % self.size] for b in range(bucket - buckets + 1, bucket + 1)]
+
+
+class TrafficStats:
+    def __init__(self, window: int = 3600, top_n: int = 5):
+        """
+        Agregador de tráfico del servidor
+
+        Args:
+            window: Ventana en segundos (resolución de 1 segundo)
+            top_n: Cuántos usuarios se reportan como más activos
+        """
+        self.window = window
+        self.top_n = top_n
+        self.messages = SlidingWindowCounter(window)
+        self.bytes = SlidingWindowCounter(window)
+        # Por usuario basta con resolución de un minuto sobre la misma ventana
+        self._talkers: Dict[str, SlidingWindowCounter] = {}
+        self.total_messages = 0
+        self.total_bytes = 0
+
+    def record(self, username: str, size: int):
+        """Registra un mensaje recibido"""
+        now = time.time()
+        self.messages.add(1, now)
+        self.bytes.add(size, now)
+        self.total_messages += 1
+        self.total_bytes += size
+
+        talker = self._talkers.get(username)
+        if talker is None:
+            talker = self._talkers[username] = SlidingWindowCounter(self.window // 60, 60)
+        talker.add(1, now)
+
+    def top_talkers(self, now: float = None) -> List[list]:
+        """Usuarios con más mensajes en la ventana (y descarta los inactivos)"""
+        if now is None:
+            now = time.time()
+        counts = []
+        idle = []
+        for username, counter in self._talkers.items():
+            total = counter.total(now)
+            if total:
+                counts.append((total, username))
+            else:
+                idle.append(username)
+        for username in idle:
+            del self._talkers[username]
+        return [[username, total] for total, username in heapq.nlargest(self.top_n, counts)]
+
+    def snapshot(self, active_users: int) -> dict:
+        """Frame compacto con el estado actual de la ventana"""
+        now = time.time()
+        last_minute = self.messages.last(60, now)
+        return {
+            "messages_per_minute": sum(last_minute),
+            "messages_window": self.messages.total(now),
+            "bytes_per_minute": sum(self.bytes.last(60, now)),
+            "bytes_window": self.bytes.total(now),
+            "total_messages": self.total_messages,
+            "total_bytes": self.total_bytes,
+            "active_users": active_users,
+            "top_talkers": self.top_talkers(now),
+            "per_second": last_minute,
+            "window_seconds": self.window,
+        }
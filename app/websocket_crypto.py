@@ -1,47 +1,158 @@
 """
 Sistema de cifrado AES-256-GCM para WebSockets
 Compatible con Web Crypto API del navegador
+
+Rotación en dos fases: prepare_next_key() genera la siguiente clave y fija
+el instante de activación (se anuncia a los clientes por adelantado);
+activate_next_key() la convierte en la actual llegado ese instante. La
+clave siguiente ya se acepta al descifrar desde que se anuncia, y la
+anterior durante `grace_period` segundos tras la activación.
 """
 import secrets
 import base64
 import time
-from typing import Dict, Tuple
+from typing import Dict, List, Optional, Tuple
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 
+from replay_guard import ReplayGuard
+
+# Límites de uso por clave. GCM con nonces aleatorios (los que generan los
+# clientes) admite ~2^32 invocaciones por clave; rotamos mucho antes
+MAX_KEY_INVOCATIONS = 2 ** 28
+MAX_KEY_BYTES = 2 ** 36  # 64 GiB cifrados/descifrados por clave
+
+
+class NonceGenerator:
+    """
+    Nonces de 96 bits: prefijo aleatorio de 32 bits por clave + contador de 64 bits
+    Únicos por clave sin llamar a getrandom en cada mensaje
+    """
+    __slots__ = ('prefix', 'counter')
+
+    def __init__(self):
+        self.prefix = secrets.token_bytes(4)
+        self.counter = 0
+
+    def next(self) -> bytes:
+        self.counter += 1
+        return self.prefix + self.counter.to_bytes(8, 'big')
+
+
+class KeyState:
+    """Clave AES con su cifrador, generador de nonces y contadores de uso"""
+    __slots__ = ('key_bytes', 'timestamp', 'aesgcm', 'nonces',
+                 'encryptions', 'decryptions', 'bytes_processed', 'retire_at')
+
+    def __init__(self, key_bytes: bytes, timestamp: float):
+        self.key_bytes = key_bytes
+        self.timestamp = timestamp
+        self.aesgcm = AESGCM(key_bytes)
+        self.nonces = NonceGenerator()
+        self.encryptions = 0
+        self.decryptions = 0
+        self.bytes_processed = 0
+        self.retire_at: Optional[float] = None  # fin del periodo de gracia
+
+    @property
+    def invocations(self) -> int:
+        return self.encryptions + self.decryptions
+
+    def to_dict(self) -> dict:
+        return {
+            'encryptions': self.encryptions,
+            'decryptions': self.decryptions,
+            'bytes': self.bytes_processed,
+        }
+
 
 class CryptoManager:
-    def __init__(self, key_lifetime: int = 3600):
+    def __init__(self, key_lifetime: int = 3600, max_invocations: int = MAX_KEY_INVOCATIONS,
+                 max_bytes: int = MAX_KEY_BYTES, replay_guard: Optional[ReplayGuard] = None,
+                 announce_lead: float = 30, grace_period: float = 120):
         """
         Gestor de cifrado con rotación automática de claves
 
         Args:
             key_lifetime: Tiempo de vida de cada clave en segundos (default: 1 hora)
+            max_invocations: Cifrados + descifrados tras los que se fuerza la rotación
+            max_bytes: Bytes procesados tras los que se fuerza la rotación
+            replay_guard: Si se indica, rechaza frames con un (key_id, nonce) ya aceptado
+            announce_lead: Segundos entre el anuncio de la siguiente clave y su activación
+            grace_period: Segundos que se sigue aceptando una clave tras ser reemplazada
         """
         self.key_lifetime = key_lifetime
-        self.keys: Dict[str, Tuple[bytes, float]] = {}  # {key_id: (key_bytes, timestamp)}
+        self.announce_lead = announce_lead
+        self.grace_period = grace_period
+        self.max_invocations = max_invocations
+        self.max_bytes = max_bytes
+        self.replay_guard = replay_guard
+        self.keys: Dict[str, KeyState] = {}
         self.current_key_id: str = None
-        self._generate_new_key()
+        self.next_key_id: Optional[str] = None
+        self.activate_at: Optional[float] = None  # epoch s de activación de next_key_id
+        # La primera clave se genera en ensure_key() (al arrancar el servidor)
+        # o en el primer uso, no al importar el módulo
 
-    def _generate_new_key(self) -> str:
-        """Genera una nueva clave AES-256 y la marca como actual"""
+    def ensure_key(self) -> str:
+        """Genera la clave inicial si todavía no existe"""
+        if not self.current_key_id:
+            self._generate_new_key()
+        return self.current_key_id
+
+    def _create_key(self) -> str:
+        """Genera una nueva clave AES-256 sin activarla"""
         key_bytes = AESGCM.generate_key(bit_length=256)
         key_id = f"key_{int(time.time())}_{secrets.token_hex(4)}"
-        timestamp = time.time()
+        self.keys[key_id] = KeyState(key_bytes, time.time())
+        print(f"Nueva clave generada: {key_id}")
+        return key_id
 
-        self.keys[key_id] = (key_bytes, timestamp)
-        self.current_key_id = key_id
+    def _generate_new_key(self) -> str:
+        """Genera una nueva clave AES-256 y la marca como actual de inmediato"""
+        return self._make_current(self._create_key())
 
-        print(f"Nueva clave generada: {key_id}")
+    def _make_current(self, key_id: str) -> str:
+        previous = self.current_key_id
+        if previous is not None and previous in self.keys:
+            self.keys[previous].retire_at = time.time() + self.grace_period
+        self.current_key_id = key_id
         return key_id
 
+    def prepare_next_key(self, lead: Optional[float] = None) -> Tuple[str, str, float]:
+        """
+        Fase 1: genera la siguiente clave y fija cuándo se activará
+
+        Returns:
+            (next_key_id, key_base64, activate_at en epoch s)
+        """
+        if self.next_key_id is None:
+            self.next_key_id = self._create_key()
+            self.activate_at = time.time() + (self.announce_lead if lead is None else lead)
+        return self.next_key_id, self._key_base64(self.next_key_id), self.activate_at
+
+    def activate_next_key(self, now: Optional[float] = None) -> Optional[Tuple[str, str]]:
+        """
+        Fase 2: activa la clave anunciada si ya llegó su instante
+
+        Returns:
+            (key_id nuevo, key_id anterior) si se activó, None si no tocaba
+        """
+        now = time.time() if now is None else now
+        if self.next_key_id is None or now < self.activate_at:
+            return None
+        previous = self.current_key_id
+        self._make_current(self.next_key_id)
+        self.next_key_id = None
+        self.activate_at = None
+        return self.current_key_id, previous
+
+    def _key_base64(self, key_id: str) -> str:
+        return base64.b64encode(self.keys[key_id].key_bytes).decode('utf-8')
+
     def get_current_key_base64(self) -> Tuple[str, str]:
         """Retorna la clave actual en base64 para enviar al cliente"""
-        if not self.current_key_id:
-            self._generate_new_key()
-
-        key_bytes, _ = self.keys[self.current_key_id]
-        key_base64 = base64.b64encode(key_bytes).decode('utf-8')
-        return self.current_key_id, key_base64
+        self.ensure_key()
+        return self.current_key_id, self._key_base64(self.current_key_id)
 
     def encrypt_message(self, message: str, key_id: str = None) -> dict:
         """
@@ -55,20 +166,24 @@ class CryptoManager:
             dict con encrypted, nonce, key_id, timestamp
         """
         if key_id is None:
-            key_id = self.current_key_id
+            key_id = self.ensure_key()
 
         if key_id not in self.keys:
             raise ValueError(f"Clave {key_id} no encontrada")
 
-        key_bytes, _ = self.keys[key_id]
-        aesgcm = AESGCM(key_bytes)
+        state = self.keys[key_id]
+        if state.invocations >= 2 * self.max_invocations:
+            # La rotación por uso no llegó a tiempo: no arriesgar la clave
+            raise ValueError(f"Clave {key_id} agotada, pendiente de rotación")
 
-        # Generar nonce de 12 bytes (96 bits) - estándar para GCM
-        nonce = secrets.token_bytes(12)
+        # Nonce de 12 bytes (96 bits) - estándar para GCM, sin syscall por mensaje
+        nonce = state.nonces.next()
 
         # Cifrar mensaje
         message_bytes = message.encode('utf-8')
-        encrypted_bytes = aesgcm.encrypt(nonce, message_bytes, None)
+        encrypted_bytes = state.aesgcm.encrypt(nonce, message_bytes, None)
+        state.encryptions += 1
+        state.bytes_processed += len(message_bytes)
 
         return {
             'encrypted': base64.b64encode(encrypted_bytes).decode('utf-8'),
@@ -89,59 +204,110 @@ class CryptoManager:
         Returns:
             Mensaje descifrado como string
         """
+        return self.decrypt_bytes(encrypted_b64, nonce_b64, key_id).decode('utf-8')
+
+    def decrypt_bytes(self, encrypted_b64: str, nonce_b64: str, key_id: str,
+                      aad: Optional[bytes] = None) -> bytes:
+        """
+        Descifra un segmento binario usando AES-256-GCM
+
+        Args:
+            encrypted_b64: Datos cifrados en base64
+            nonce_b64: Nonce en base64
+            key_id: ID de la clave usada
+            aad: Datos asociados autenticados (p. ej. "transfer_id:index" de un chunk)
+
+        Returns:
+            Bytes descifrados
+        """
         if key_id not in self.keys:
             available = list(self.keys.keys())
             raise ValueError(f"Clave {key_id} no disponible. Claves disponibles: {available}")
 
-        key_bytes, _ = self.keys[key_id]
-        aesgcm = AESGCM(key_bytes)
+        state = self.keys[key_id]
+        if state.retire_at is not None and time.time() > state.retire_at:
+            raise ValueError(f"Clave {key_id} retirada (fuera del periodo de gracia)")
 
-        # Decodificar base64
-        encrypted_bytes = base64.b64decode(encrypted_b64)
+        # Decodificar base64 (el nonce se compara ya decodificado)
         nonce = base64.b64decode(nonce_b64)
+        if self.replay_guard is not None:
+            self.replay_guard.check(key_id, nonce)
+        encrypted_bytes = base64.b64decode(encrypted_b64)
 
         # Descifrar
-        decrypted_bytes = aesgcm.decrypt(nonce, encrypted_bytes, None)
-        return decrypted_bytes.decode('utf-8')
+        decrypted_bytes = state.aesgcm.decrypt(nonce, encrypted_bytes, aad)
+        state.decryptions += 1
+        state.bytes_processed += len(decrypted_bytes)
 
-    def rotate_key_if_needed(self) -> bool:
-        """Rota la clave si ha expirado. Retorna True si rotó"""
-        if not self.current_key_id:
+        # Sólo se recuerdan frames auténticos: un nonce con basura no bloquea al legítimo
+        if self.replay_guard is not None:
+            self.replay_guard.remember(key_id, nonce)
+        return decrypted_bytes
+
+    def usage_exceeded(self, key_id: str = None) -> bool:
+        """True si la clave superó los límites de invocaciones o bytes"""
+        state = self.keys.get(key_id or self.current_key_id)
+        if state is None:
             return False
+        return state.invocations >= self.max_invocations or state.bytes_processed >= self.max_bytes
 
-        _, timestamp = self.keys[self.current_key_id]
-        age = time.time() - timestamp
+    def rotation_due(self) -> bool:
+        """
+        True si hay que anunciar la siguiente clave: la actual caduca dentro
+        de announce_lead segundos o agotó su uso
+        """
+        if not self.current_key_id or self.next_key_id is not None:
+            return False
 
-        if age >= self.key_lifetime:
-            self._generate_new_key()
-            return True
-        return False
+        age = time.time() - self.keys[self.current_key_id].timestamp
+        return age >= self.key_lifetime - self.announce_lead or self.usage_exceeded()
 
-    def _clean_old_keys(self):
-        """Elimina claves que tienen más del doble del lifetime (mantiene histórico)"""
+    def _clean_old_keys(self) -> List[str]:
+        """
+        Elimina claves reemplazadas cuyo periodo de gracia terminó
+        Retorna los ids eliminados
+        """
         current_time = time.time()
-        max_age = self.key_lifetime * 2
 
         keys_to_remove = [
-            key_id for key_id, (_, timestamp) in self.keys.items()
-            if current_time - timestamp > max_age and key_id != self.current_key_id
+            key_id for key_id, state in self.keys.items()
+            if state.retire_at is not None and current_time > state.retire_at
+            and key_id not in (self.current_key_id, self.next_key_id)
         ]
 
         for key_id in keys_to_remove:
             del self.keys[key_id]
             print(f"Clave antigua eliminada: {key_id}")
 
+        if self.replay_guard is not None:
+            self.replay_guard.forget_keys(keys_to_remove)
+        return keys_to_remove
+
     def get_key_info(self) -> dict:
         """Retorna información sobre las claves activas"""
-        return {
+        info = {
             'total_keys': len(self.keys),
             'current_key_id': self.current_key_id,
+            'next_key_id': self.next_key_id,
+            'activate_at': self.activate_at,
+            'grace_period': self.grace_period,
             'key_ages': {
-                key_id: int(time.time() - timestamp)
-                for key_id, (_, timestamp) in self.keys.items()
+                key_id: int(time.time() - state.timestamp)
+                for key_id, state in self.keys.items()
+            },
+            'key_usage': {
+                key_id: state.to_dict()
+                for key_id, state in self.keys.items()
+            },
+            'limits': {
+                'max_invocations': self.max_invocations,
+                'max_bytes': self.max_bytes,
             }
         }
+        if self.replay_guard is not None:
+            info['replay'] = self.replay_guard.get_stats()
+        return info
 
 
 # Instancia global del gestor de cifrado
-crypto_manager = CryptoManager(key_lifetime=3600)  # Rotar cada hora
\ No newline at end of file
+crypto_manager = CryptoManager(key_lifetime=3600, replay_guard=ReplayGuard())  # Rotar cada hora